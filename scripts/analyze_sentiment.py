@@ -17,7 +17,7 @@ def main():
     """Hàm chính để phân tích tình cảm từ dữ liệu Reddit"""
     # Xử lý tham số dòng lệnh
     parser = argparse.ArgumentParser(description='Phân tích tình cảm từ dữ liệu Reddit')
-    parser.add_argument('--max-workers', type=int, default=4, help='Số lượng worker threads tối đa')
+    parser.add_argument('--max-workers', type=int, default=4, help='Số lượng worker processes tối đa')
     parser.add_argument('--batch-size', type=int, default=50, help='Kích thước của mỗi batch')
     parser.add_argument('--limit', type=int, help='Giới hạn số lượng bài viết phân tích')
     parser.add_argument('--analyze-comments', action='store_true', help='Phân tích bình luận')
@@ -32,7 +32,7 @@ def main():
         analyzer = SentimentAnalyzer(min_conn=3, max_conn=10)
 
         # Phân tích tình cảm cho bài viết với đa luồng
-        logger.info(f"Phân tích bài viết với {args.max_workers} worker threads và batch size {args.batch_size}")
+        logger.info(f"Phân tích bài viết với {args.max_workers} worker processes và batch size {args.batch_size}")
         post_count = analyzer.analyze_all_posts_parallel(
             max_workers=args.max_workers,
             batch_size=args.batch_size,
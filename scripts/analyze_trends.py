@@ -25,6 +25,8 @@ def main():
     parser = argparse.ArgumentParser(description='Phân tích xu hướng từ dữ liệu Reddit')
     parser.add_argument('--max-workers', type=int, default=4, help='Số lượng worker threads tối đa cho xử lý song song')
     parser.add_argument('--parallel', action='store_true', help='Chạy các phân tích song song')
+    parser.add_argument('--use-processes', action='store_true',
+                        help='Chạy song song bằng nhiều process thay vì threads (dùng cùng --parallel)')
     parser.add_argument('--min-mentions', type=int, default=5, help='Số lần đề cập tối thiểu cho các phân tích')
     parser.add_argument('--growth-threshold', type=int, default=50, help='Ngưỡng tăng trưởng % cho công nghệ mới nổi')
     parser.add_argument('--specific-analysis', choices=[
@@ -33,6 +35,8 @@ def main():
     ], default='all', help='Chỉ chạy phân tích cụ thể')
     parser.add_argument('--time-unit', choices=['day', 'week', 'month', 'quarter'], default='week',
                         help='Đơn vị thời gian cho phân tích xu hướng theo thời gian')
+    parser.add_argument('--dtype-backend', choices=['pyarrow', 'numpy_nullable'], default=None,
+                        help='Kiểu dữ liệu cho DataFrame kết quả (pyarrow cần cài thêm thư viện pyarrow)')
 
     args = parser.parse_args()
 
@@ -42,13 +46,14 @@ def main():
     analyzer = None
     try:
         # Khởi tạo analyzer với connection pool
-        analyzer = TrendAnalyzer(min_conn=3, max_conn=10)
+        analyzer = TrendAnalyzer(min_conn=3, max_conn=10, dtype_backend=args.dtype_backend)
 
         if args.specific_analysis == 'all':
             # Chạy tất cả các phân tích tự động
             results = analyzer.run_all_analyses(
                 parallel=args.parallel,
-                max_workers=args.max_workers
+                max_workers=args.max_workers,
+                use_processes=args.use_processes
             )
 
             # In tóm tắt kết quả
@@ -30,7 +30,8 @@ CREATE TABLE IF NOT EXISTS reddit_data.posts (
     permalink TEXT,
     link_flair_text TEXT,
     collected_utc BIGINT,
-    processed_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    processed_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    title_tsv tsvector GENERATED ALWAYS AS (to_tsvector('simple', coalesce(title, ''))) STORED
 );
 
 -- Bảng chứa thông tin bình luận
@@ -144,9 +145,19 @@ CREATE TABLE IF NOT EXISTS reddit_data.sentiment_popularity_correlation (
 CREATE INDEX IF NOT EXISTS idx_posts_created_date ON reddit_data.posts(created_date);
 CREATE INDEX IF NOT EXISTS idx_comments_created_date ON reddit_data.comments(created_date);
 CREATE INDEX IF NOT EXISTS idx_posts_subreddit ON reddit_data.posts(subreddit_id);
+CREATE INDEX IF NOT EXISTS idx_posts_created_date_subreddit ON reddit_data.posts(created_date, subreddit_id);
+CREATE INDEX IF NOT EXISTS idx_posts_title_tsv ON reddit_data.posts USING GIN (title_tsv);
+CREATE INDEX IF NOT EXISTS idx_posts_created_week ON reddit_data.posts (DATE_TRUNC('week', created_date));
+CREATE INDEX IF NOT EXISTS idx_posts_created_month ON reddit_data.posts (DATE_TRUNC('month', created_date));
 CREATE INDEX IF NOT EXISTS idx_user_activity_username ON reddit_data.user_activity(username);
 CREATE INDEX IF NOT EXISTS idx_tech_trends_name ON reddit_data.tech_trends(tech_name);
 
+-- tech_trends được làm mới bằng DELETE + INSERT: cho autovacuum dọn dead tuple sớm hơn mặc định (20%)
+ALTER TABLE reddit_data.tech_trends SET (autovacuum_vacuum_scale_factor = 0.05, autovacuum_analyze_scale_factor = 0.05);
+CREATE INDEX IF NOT EXISTS idx_post_analysis_pending ON reddit_data.post_analysis(post_id) WHERE sentiment_score IS NULL;
+CREATE INDEX IF NOT EXISTS idx_comment_analysis_pending ON reddit_data.comment_analysis(comment_id) WHERE sentiment_score IS NULL;
+CREATE INDEX IF NOT EXISTS idx_post_analysis_tech_mentioned ON reddit_data.post_analysis USING GIN (tech_mentioned);
+
 CREATE INDEX IF NOT EXISTS idx_tech_correlation_tech_names ON reddit_data.tech_correlation(tech_name_1, tech_name_2);
 CREATE INDEX IF NOT EXISTS idx_subreddit_tech_trends_subreddit ON reddit_data.subreddit_tech_trends(subreddit_id);
 CREATE INDEX IF NOT EXISTS idx_subreddit_tech_trends_tech ON reddit_data.subreddit_tech_trends(tech_name);
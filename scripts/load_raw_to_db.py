@@ -45,19 +45,51 @@ def load_data_to_db():
         if conn:
             conn.close()
 
+def iter_raw_records(directory, file_names):
+    """
+        Đọc các bản ghi dữ liệu thô: file .json chứa một bản ghi, shard .jsonl chứa mỗi dòng một bản ghi
+
+        Args:
+            directory (str): Thư mục dữ liệu thô
+            file_names (list): Danh sách file cần đọc
+
+        Yields:
+            tuple: (nguồn bản ghi dùng để log, dict dữ liệu hoặc None nếu không đọc được)
+    """
+    for file_name in file_names:
+        file_path = os.path.join(directory, file_name)
+        try:
+            with open(file_path, 'r', encoding='utf-8') as f:
+                if not file_name.endswith('.jsonl'):
+                    yield file_name, json.load(f)
+                    continue
+
+                for line_number, line in enumerate(f, 1):
+                    if not line.strip():
+                        continue
+                    source = f"{file_name}:{line_number}"
+                    try:
+                        yield source, json.loads(line)
+                    except ValueError as e:
+                        logger.error(f"Lỗi khi đọc bản ghi {source}: {str(e)}")
+                        yield source, None
+        except Exception as e:
+            logger.error(f"Lỗi khi đọc file {file_name}: {str(e)}")
+            yield file_name, None
+
+
 def load_posts(cur, conn):
-    """Load dữ liệu bài viết từ files JSON vào database"""
+    """Load dữ liệu bài viết từ files JSON / JSONL vào database"""
     posts_dir = "data/raw/posts"
     if not os.path.exists(posts_dir):
         logger.warning(f"Thư mục {posts_dir} không tồn tại")
         return
 
-    posts_files = [f for f in os.listdir(posts_dir) if f.endswith('json')]
+    posts_files = [f for f in os.listdir(posts_dir) if f.endswith(('.json', '.jsonl'))]
 
-    logger.info(f"Tìm thấy {len(posts_files)} files JSON bài viết")
+    logger.info(f"Tìm thấy {len(posts_files)} files JSON / JSONL bài viết")
 
     # Đếm các bài viết
-    total_files = len(posts_files)
     processed = 0
     inserted = 0
     updated = 0
@@ -66,14 +98,9 @@ def load_posts(cur, conn):
 
     # Đảm bảo subreddits tồn tại
     subreddits = set()
-    for file_name in posts_files:
-        try:
-            with open(os.path.join(posts_dir, file_name), 'r', encoding='utf-8') as f:
-                post_data = json.load(f)
-                if 'subreddit' in post_data and post_data['subreddit']:
-                    subreddits.add(post_data['subreddit'])
-        except:
-            pass
+    for file_name, post_data in iter_raw_records(posts_dir, posts_files):
+        if post_data and post_data.get('subreddit'):
+            subreddits.add(post_data['subreddit'])
 
     # Tạo subreddits trong database
     for subreddit in subreddits:
@@ -88,16 +115,17 @@ def load_posts(cur, conn):
     conn.commit()
     logger.info(f"Đã thêm {len(subreddits)} subreddits vào database")
 
-    # Xử lý từng file bài viết
-    for file_name in posts_files:
+    # Xử lý từng bản ghi bài viết
+    for file_name, post_data in iter_raw_records(posts_dir, posts_files):
         processed += 1
         if processed % 100 == 0:
-            logger.info(f"Đã xử lý {processed}/{total_files} files bài viết")
+            logger.info(f"Đã xử lý {processed} bản ghi bài viết")
 
-        try:
-            with open(os.path.join(posts_dir, file_name), 'r', encoding='utf-8') as f:
-                post_data = json.load(f)
+        if post_data is None:
+            errors += 1
+            continue
 
+        try:
             # Kiểm tra dữ liệu cần thiết
             if 'id' not in post_data or not post_data['id'] or 'subreddit' not in post_data or not post_data['subreddit']:
                 logger.warning(f"File {file_name} thiếu thông tin cần thiết, bỏ qua")
@@ -207,39 +235,39 @@ def load_posts(cur, conn):
     # Commit sau khi thay đổi
     conn.commit()
 
-    logger.info(f"Kết quả xử lý bài viết: Đã xử lý {processed} files, chèn mới {inserted}, cập nhật {updated}, bỏ qua {skipped}, lỗi {errors}")
+    logger.info(f"Kết quả xử lý bài viết: Đã xử lý {processed} bản ghi, chèn mới {inserted}, cập nhật {updated}, bỏ qua {skipped}, lỗi {errors}")
 
 
 def load_comments(cur, conn):
-    """Load dữ liệu bình luận từ files JSON vào database"""
+    """Load dữ liệu bình luận từ files JSON / JSONL vào database"""
     # Đọc thư mục dữ liệu thô
     comments_dir = "data/raw/comments"
     if not os.path.exists(comments_dir):
         logger.warning(f"Thư mục {comments_dir} không tồn tại")
         return
 
-    comment_files = [f for f in os.listdir(comments_dir) if f.endswith('.json')]
+    comment_files = [f for f in os.listdir(comments_dir) if f.endswith(('.json', '.jsonl'))]
 
-    logger.info(f"Tìm thấy {len(comment_files)} files JSON bình luận")
+    logger.info(f"Tìm thấy {len(comment_files)} files JSON / JSONL bình luận")
 
     # Đếm các bình luận
-    total_files = len(comment_files)
     processed = 0
     inserted = 0
     updated = 0
     errors = 0
     skipped = 0
 
-    # Xử lý từng file bình luận
-    for file_name in comment_files:
+    # Xử lý từng bản ghi bình luận
+    for file_name, comment_data in iter_raw_records(comments_dir, comment_files):
         processed += 1
         if processed % 100 == 0:
-            logger.info(f"Đã xử lý {processed}/{total_files} files bình luận")
+            logger.info(f"Đã xử lý {processed} bản ghi bình luận")
 
-        try:
-            with open(os.path.join(comments_dir, file_name), 'r', encoding='utf-8') as f:
-                comment_data = json.load(f)
+        if comment_data is None:
+            errors += 1
+            continue
 
+        try:
             # Kiểm tra dữ liệu cần thiết
             if 'id' not in comment_data or not comment_data['id'] or 'post_id' not in comment_data or not comment_data[
                 'post_id']:
@@ -328,7 +356,7 @@ def load_comments(cur, conn):
     # Commit các thay đổi còn lại
     conn.commit()
 
-    logger.info(f"Kết quả xử lý bình luận: Đã xử lý {processed} files, chèn mới {inserted}, cập nhật {updated}, bỏ qua {skipped}, lỗi {errors}")
+    logger.info(f"Kết quả xử lý bình luận: Đã xử lý {processed} bản ghi, chèn mới {inserted}, cập nhật {updated}, bỏ qua {skipped}, lỗi {errors}")
 
 
 def update_user_activity(cur, conn):
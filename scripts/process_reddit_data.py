@@ -1,10 +1,11 @@
 import sys
 import os
+import argparse
 
 # Thêm thư mục gốc của dự án vào sys.path để có thể import các module
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from src.data_processing.kafka_consumer import RedditDataConsumer
+from src.data_processing.kafka_consumer import RedditDataConsumer, run_consumers
 from src.utils.logger import setup_logger
 
 # Thiết lập logger
@@ -12,12 +13,28 @@ logger = setup_logger("reddit_data_processing", "logs/data_processing.log")
 
 def main():
     """ Hàm xử lý dữ liệu từ kafka """
+    parser = argparse.ArgumentParser(description='Xử lý dữ liệu Reddit từ Kafka và lưu vào PostgreSQL')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Số consumer chạy song song (tối đa bằng tổng số partition của các topic)')
+    parser.add_argument('--async-commit', action='store_true',
+                        help='Tắt synchronous_commit để nạp nhanh dữ liệu cũ (có thể mất các batch cuối nếu PostgreSQL sập)')
+    args = parser.parse_args()
+
     logger.info("Bắt đầu quá trình xử lý dữ liệu Reddit từ Kafka")
 
+    if args.workers > 1:
+        try:
+            run_consumers(num_workers=args.workers, async_commit=args.async_commit)
+        except Exception as e:
+            logger.error(f"Lỗi trong quá trình xử lý dữ liệu: {str(e)}")
+
+        logger.info("Hoàn thành quá trình xử lý dữ liệu")
+        return
+
     consumer = None
     try:
         # Khởi tạo consumer
-        consumer = RedditDataConsumer()
+        consumer = RedditDataConsumer(async_commit=args.async_commit)
         # Tiến hành xử lý dữ liệu
         consumer.process_data()
 
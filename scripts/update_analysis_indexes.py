@@ -0,0 +1,111 @@
+# scripts/update_analysis_indexes.py
+import sys
+import os
+import psycopg2
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.utils.config import POSTGRES_HOST, POSTGRES_PORT, POSTGRES_DB, POSTGRES_USER, POSTGRES_PASSWORD
+from src.utils.logger import setup_logger
+
+logger = setup_logger("update_schema", "logs/update_schema.log")
+
+# Các cột sinh tự động cần có trước khi tạo index.
+# Lần đầu thêm cột GENERATED ... STORED, PostgreSQL ghi lại toàn bộ bảng posts dưới khóa ACCESS EXCLUSIVE
+# (chặn cả đọc lẫn ghi cho đến khi xong), nên lần chạy đầu tiên phải nằm trong khung giờ bảo trì
+ANALYSIS_COLUMNS = [
+    # Vector full-text của tiêu đề bài viết (analyze_skill_demand_trends)
+    """
+    ALTER TABLE reddit_data.posts ADD COLUMN IF NOT EXISTS title_tsv tsvector
+    GENERATED ALWAYS AS (to_tsvector('simple', coalesce(title, ''))) STORED
+    """
+]
+
+# Các index phục vụ điều kiện lọc của SentimentAnalyzer / TrendAnalyzer
+ANALYSIS_INDEXES = [
+    # Bài viết / bình luận chưa được phân tích cảm xúc (analyze_all_*_parallel)
+    """
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_post_analysis_pending
+    ON reddit_data.post_analysis(post_id) WHERE sentiment_score IS NULL
+    """,
+    """
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_comment_analysis_pending
+    ON reddit_data.comment_analysis(comment_id) WHERE sentiment_score IS NULL
+    """,
+    # Tìm bài viết theo công nghệ (tech_mentioned @> ARRAY[...])
+    """
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_post_analysis_tech_mentioned
+    ON reddit_data.post_analysis USING GIN (tech_mentioned)
+    """,
+    # Lọc theo khoảng thời gian (analyze_sentiment_trends)
+    """
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_posts_created_date
+    ON reddit_data.posts(created_date)
+    """,
+    # Nhóm theo tuần / tháng và subreddit khi join posts (TrendAnalyzer)
+    """
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_posts_created_date_subreddit
+    ON reddit_data.posts(created_date, subreddit_id)
+    """,
+    # Nhóm bài viết theo tuần / tháng (analyze_tech_trends_by_time)
+    """
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_posts_created_week
+    ON reddit_data.posts (DATE_TRUNC('week', created_date))
+    """,
+    """
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_posts_created_month
+    ON reddit_data.posts (DATE_TRUNC('month', created_date))
+    """,
+    # Tìm bài viết tuyển dụng theo từ khóa trong tiêu đề (analyze_skill_demand_trends)
+    """
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_posts_title_tsv
+    ON reddit_data.posts USING GIN (title_tsv)
+    """
+]
+
+
+def update_indexes():
+    """
+        Thêm các cột sinh tự động và tạo các index cho bảng phân tích
+
+        Các index được tạo bằng CREATE INDEX CONCURRENTLY nên không khóa ghi. Riêng việc thêm cột
+        title_tsv lần đầu sẽ ghi lại bảng posts dưới khóa ACCESS EXCLUSIVE: hãy chạy script trong
+        khung giờ bảo trì (dừng consumer và dashboard). Các lần chạy sau cột đã tồn tại nên không ghi lại bảng
+    """
+    conn = None
+    try:
+        # Kết nối PostgreSQL
+        conn = psycopg2.connect(
+            host=POSTGRES_HOST,
+            port=POSTGRES_PORT,
+            dbname=POSTGRES_DB,
+            user=POSTGRES_USER,
+            password=POSTGRES_PASSWORD
+        )
+        # CREATE INDEX CONCURRENTLY không thể chạy trong transaction
+        conn.autocommit = True
+        cur = conn.cursor()
+
+        logger.warning("Thêm cột sinh tự động có thể khóa bảng posts (ACCESS EXCLUSIVE) trong lần chạy đầu, "
+                       "chỉ nên chạy trong khung giờ bảo trì")
+        for column_sql in ANALYSIS_COLUMNS:
+            cur.execute(column_sql)
+
+        for index_sql in ANALYSIS_INDEXES:
+            cur.execute(index_sql)
+
+        # Cập nhật thống kê để planner sử dụng các index mới
+        cur.execute("ANALYZE reddit_data.posts")
+        cur.execute("ANALYZE reddit_data.post_analysis")
+        cur.execute("ANALYZE reddit_data.comment_analysis")
+        logger.info(f"Đã tạo {len(ANALYSIS_INDEXES)} indexes cho các bảng phân tích")
+
+    except Exception as e:
+        logger.error(f"Lỗi khi tạo indexes: {str(e)}")
+    finally:
+        if conn:
+            conn.close()
+
+
+if __name__ == "__main__":
+    update_indexes()
@@ -1,21 +1,29 @@
 import re
+import string
 import json
 import os
+import tempfile
 import time
+import marshal
+import uuid
+import heapq
+import itertools
 import psycopg2
 import psycopg2.pool
 import psycopg2.extras
 import nltk
 from jedi.api.refactoring import inline
-from nltk.sentiment.vader import SentimentIntensityAnalyzer
+from nltk.sentiment.vader import SentimentIntensityAnalyzer, VaderConstants
 from textblob import TextBlob
 import threading
-from concurrent.futures import ThreadPoolExecutor
+import multiprocessing.util
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
-from collections import Counter, defaultdict
+from collections import Counter, OrderedDict, defaultdict, deque
 
 from src.utils.config import POSTGRES_HOST, POSTGRES_PORT, POSTGRES_DB, POSTGRES_USER, POSTGRES_PASSWORD
 from src.utils.logger import setup_logger
+from src.utils.db import prepare_statement
 
 # Thiết lập logger
 logger = setup_logger(__name__, "logs/sentiment_analyzer.log")
@@ -23,15 +31,82 @@ logger = setup_logger(__name__, "logs/sentiment_analyzer.log")
 # Tạo thread-local storage cho các resource dùng chung
 thread_local = threading.local()
 
+# Số từ khóa cập nhật tối đa để vô hiệu hóa cache có chọn lọc, vượt quá thì xóa toàn bộ cache
+CACHE_INVALIDATION_THRESHOLD = 200
+
+# Số kết quả phân tích tối đa giữ trong cache cảm xúc (LRU), kết quả ít dùng nhất bị loại trước
+SENTIMENT_CACHE_MAX_SIZE = 20000
+
+# Số công nghệ tối đa giữ trong cache phân tích công nghệ (LRU)
+TECH_SENTIMENT_CACHE_MAX_SIZE = 256
+
+# Thời gian (giây) giữ phiên bản dữ liệu post_analysis trước khi truy vấn lại
+TECH_DATA_VERSION_TTL = 60
+
+# Truy vấn xu hướng cảm xúc theo tuần ($1: số ngày phân tích, $2: số lần nhắc tối thiểu mỗi tuần)
+SENTIMENT_TRENDS_SQL = """
+    WITH tech_sentiments AS (
+    SELECT 
+        unnest(pa.tech_mentioned) as tech_name,
+        pa.sentiment_score,
+        p.created_date
+    FROM 
+        reddit_data.post_analysis pa
+        JOIN reddit_data.posts p ON pa.post_id = p.post_id
+    WHERE 
+        pa.tech_mentioned <> '{}'
+        AND pa.sentiment_score IS NOT NULL
+        AND p.created_date >= CURRENT_DATE - $1 * INTERVAL '1 day'
+    ),
+    weekly_sentiments AS (
+    SELECT 
+        tech_name,
+        DATE_TRUNC('week', created_date) as week_start,
+        AVG(sentiment_score) as avg_sentiment,
+        COUNT(*) as mention_count
+    FROM 
+        tech_sentiments
+    GROUP BY 
+        tech_name, week_start
+    HAVING 
+        COUNT(*) >= $2
+    ),
+    indexed_weeks AS (
+    SELECT 
+        *,
+        ROW_NUMBER() OVER (PARTITION BY tech_name ORDER BY week_start) - 1 as week_index
+    FROM 
+        weekly_sentiments
+    )
+    SELECT 
+        tech_name,
+        regr_slope(avg_sentiment, week_index) as trend_slope,
+        SUM(mention_count)::BIGINT as total_mentions,
+        array_agg(week_start ORDER BY week_start) as week_starts,
+        array_agg(avg_sentiment ORDER BY week_start) as avg_sentiments,
+        array_agg(mention_count ORDER BY week_start) as mention_counts
+    FROM 
+        indexed_weeks
+    GROUP BY 
+        tech_name
+    HAVING 
+        COUNT(*) >= 2
+    ORDER BY 
+        tech_name
+"""
+
 class SentimentAnalyzer:
     """Class phân tích tình cảm từ dữ liệu Reddit"""
-    def __init__(self, min_conn=3, max_conn=10):
+    def __init__(self, min_conn=3, max_conn=10, statement_timeout_ms=None):
         """
         Khởi tạo SentimentAnalyzer với connection pool
 
         Args:
             min_conn (int): Số kết nối tối thiểu trong pool
             max_conn (int): Số kết nối tối đa trong pool
+            statement_timeout_ms (int, optional): Thời gian tối đa cho mỗi câu lệnh SQL (mili giây).
+                Mặc định không giới hạn vì pool dùng chung cho các job batch (update_tech_sentiment, ...)
+                có truy vấn chạy lâu; chỉ nên đặt khi analyzer chỉ phục vụ truy vấn đọc tương tác / dashboard
         """
         # Đảm bảo tất cả tài nguyên NLTK được tải đầy đủ
         self._download_nltk_resources()
@@ -46,31 +121,39 @@ class SentimentAnalyzer:
         if self.tech_sentiment_dict:
             self.main_vader.lexicon.update(self.tech_sentiment_dict)
 
+        # Serialize lexicon đã gộp một lần để các thread khôi phục nhanh thay vì parse lại file
+        self._lexicon_blob = marshal.dumps(self.main_vader.lexicon)
+
         # Tải danh sách công nghệ
         self.technologies = self._load_technologies_list()
 
         # Cache cho từ khóa công nghệ và kỹ thuật
         self.tech_terms = self._prepare_tech_terms()
 
-        try:
-            self.connection_pool = psycopg2.pool.ThreadedConnectionPool(
-                min_conn,
-                max_conn,
-                host=POSTGRES_HOST,
-                port=POSTGRES_PORT,
-                dbname=POSTGRES_DB,
-                user=POSTGRES_USER,
-                password=POSTGRES_PASSWORD
-            )
-            logger.info(f"Đã khởi tạo connection pool (min={min_conn}, max={max_conn})")
-        except Exception as e:
-            logger.error(f"Lỗi khi khởi tạo connection pool: {str(e)}")
-            raise
+        # Biên dịch sẵn regex các thuật ngữ kỹ thuật đơn từ dùng trong clean_text
+        tech_pattern = '|'.join(re.escape(term) for term in self.tech_terms['all_terms'] if len(term.split()) == 1)
+        self.tech_term_regex = re.compile(f'({tech_pattern})', re.IGNORECASE) if tech_pattern else None
+
+        self.connection_pool = _create_connection_pool(min_conn, max_conn, statement_timeout_ms)
 
         # Khởi tạo cache cho kết quả phân tích
-        self.sentiment_cache = {}
+        # Cache LRU: cache key -> (kết quả, tập từ của văn bản)
+        self.sentiment_cache = OrderedDict()
+        # Cache LRU: tên công nghệ -> (phiên bản dữ liệu, kết quả phân tích)
+        self.tech_sentiment_cache = OrderedDict()
+        self._tech_data_version = None
+        self._tech_data_version_expires = 0
         self.cache_lock = threading.Lock()
 
+        # Chỉ mục từ -> các cache key chứa từ đó, dùng để vô hiệu hóa cache có chọn lọc
+        self._cache_token_index = defaultdict(set)
+
+        # Phiên bản lexicon, tăng mỗi lần cập nhật để các thread tạo lại VADER
+        self._lexicon_version = 0
+
+        # Các prepared statement đã tạo trên từng kết nối của pool
+        self._prepared_statements = set()
+
         logger.info("SentimentAnalyzer đã được khởi tạo")
 
     def _get_vader(self):
@@ -80,12 +163,10 @@ class SentimentAnalyzer:
             Returns:
                 SentimentIntensityAnalyzer: Instance cho thread hiện tại
         """
-        if not hasattr(thread_local, 'vader'):
+        if getattr(thread_local, 'lexicon_version', None) != self._lexicon_version:
             try:
-                thread_local.vader = SentimentIntensityAnalyzer()
-                # Cập nhật từ điển cho thread
-                if self.tech_sentiment_dict:
-                    thread_local.vader.lexicon.update(self.tech_sentiment_dict)
+                thread_local.vader = _vader_from_blob(self.main_vader.lexicon_file, self._lexicon_blob)
+                thread_local.lexicon_version = self._lexicon_version
             except Exception as e:
                 logger.warning(f"Không thể tạo VADER riêng cho thread, sử dụng VADER chính: {str(e)}")
                 return self.main_vader
@@ -313,9 +394,8 @@ class SentimentAnalyzer:
         text = re.sub(r'<.*?>', '', text)
 
         # Bảo tồn các thuật ngữ kỹ thuật đặc biệt
-        tech_pattern = '|'.join(re.escape(term) for term in self.tech_terms['all_terms'] if len(term.split()) == 1)
-        if tech_pattern:
-            text = re.sub(f'({tech_pattern})', r' \1 ', text, flags=re.IGNORECASE)
+        if self.tech_term_regex:
+            text = self.tech_term_regex.sub(r' \1 ', text)
 
         # Xử lý ký tự đặc biệt nhưng giữ lại dấu câu quan trọng
         text = re.sub(r'[^\w\s!?.,;:()]', ' ', text)
@@ -329,6 +409,23 @@ class SentimentAnalyzer:
 
         return text
 
+    def _tokenize_for_cache(self, clean_text):
+        """
+            Tách từ giống cách VADER tra lexicon để lập chỉ mục cache
+
+            Args:
+                clean_text (str): Văn bản đã làm sạch
+
+            Returns:
+                set: Tập các từ viết thường (kèm dạng đã bỏ dấu câu)
+        """
+        tokens = set()
+        for token in clean_text.split():
+            token = token.lower()
+            tokens.add(token)
+            tokens.add(token.strip(string.punctuation))
+        return tokens
+
     def analyze_sentiment_ensemble(self, text):
         """
             Phân tích tình cảm sử dụng ensemble approach kết hợp VADER và TextBlob
@@ -355,8 +452,10 @@ class SentimentAnalyzer:
 
         # Kiểm tra trong cache
         with self.cache_lock:
-            if cache_key in self.sentiment_cache:
-                return self.sentiment_cache[cache_key]
+            cached = self.sentiment_cache.get(cache_key)
+            if cached is not None:
+                self.sentiment_cache.move_to_end(cache_key)
+                return cached[0]
 
         clean_text = self.clean_text(text)
         if not clean_text:
@@ -400,11 +499,63 @@ class SentimentAnalyzer:
         }
 
         # Lưu vào cache
+        tokens = self._tokenize_for_cache(clean_text)
         with self.cache_lock:
-            self.sentiment_cache[cache_key] = result
+            self.sentiment_cache[cache_key] = (result, tokens)
+            for token in tokens:
+                self._cache_token_index[token].add(cache_key)
+
+            # Loại các kết quả ít dùng nhất để cache và chỉ mục từ không tăng không giới hạn
+            while len(self.sentiment_cache) > SENTIMENT_CACHE_MAX_SIZE:
+                self._evict_cache_key(next(iter(self.sentiment_cache)))
 
         return result
 
+    def _evict_cache_key(self, cache_key):
+        """
+            Xóa một kết quả khỏi cache cảm xúc và khỏi chỉ mục từ (gọi khi đang giữ cache_lock)
+
+            Args:
+                cache_key (int): Cache key cần xóa
+        """
+        entry = self.sentiment_cache.pop(cache_key, None)
+        if entry is None:
+            return
+
+        for token in entry[1]:
+            keys = self._cache_token_index.get(token)
+            if keys is not None:
+                keys.discard(cache_key)
+                if not keys:
+                    del self._cache_token_index[token]
+
+    def score_texts(self, texts):
+        """
+            Tính điểm ensemble cho nhiều văn bản, dùng chung một VADER cho cả batch
+
+            Args:
+                texts (list): Danh sách văn bản cần phân tích
+
+            Returns:
+                list: Điểm ensemble tương ứng với từng văn bản
+        """
+        # Lấy VADER và các hàm một lần cho cả batch thay vì mỗi văn bản
+        polarity_scores = self._get_vader().polarity_scores
+        clean_text = self.clean_text
+
+        scores = []
+        for text in texts:
+            cleaned = clean_text(text)
+            if not cleaned:
+                scores.append(0)
+                continue
+
+            # kết hợp vader và textblob (70% VADER, 30% TextBlob), chuẩn hóa về [-1, 1]
+            ensemble_score = polarity_scores(cleaned)["compound"] * 0.7 + TextBlob(cleaned).sentiment.polarity * 0.3
+            scores.append(max(-1, min(1, ensemble_score)))
+
+        return scores
+
     def analyze_contextual_sentiment(self, text, tech_name=None):
         """
             Phân tích tình cảm theo ngữ cảnh của một công nghệ cụ thể
@@ -463,19 +614,14 @@ class SentimentAnalyzer:
             return {}
 
         mentioned_techs = set()
-        text_lower = text.lower()
+        # Chỉ chuyển chữ thường một lần; các thuật ngữ và mapping đã ở dạng chữ thường
+        text_lower = text.casefold()
+        mapping = self.tech_terms['mapping']
 
-        # Công nghệ đơn từ
+        # Công nghệ đơn từ và nhiều từ
         for term in self.tech_terms['all_terms']:
-            if term.lower() in text_lower:
-                main_name = self.tech_terms['mapping'].get(term.lower(), term.lower())
-                mentioned_techs.add(main_name)
-
-        # công nghệ nhiều từ
-        for term in self.tech_terms['all_terms']:
-            if ' ' in term and term.lower() in text_lower:
-                main_name = self.tech_terms['mapping'].get(term.lower(), term.lower())
-                mentioned_techs.add(main_name)
+            if term in text_lower:
+                mentioned_techs.add(mapping[term])
 
         tech_sentiments = {}
         for tech in mentioned_techs:
@@ -595,36 +741,23 @@ class SentimentAnalyzer:
             cur.execute(query, post_ids)
             posts = cur.fetchall()
 
-            sentiment_results = []
-
-            for post in posts:
-                post_id = post['post_id']
-                title = post['title']
-                text = post['text']
+            # Kết hợp tiêu đề và nội dung, phân tích tình cảm cả batch một lần
+            full_texts = [f"{post['title']} {post['text']}" if post['text'] else post['title'] for post in posts]
+            scores = self.score_texts(full_texts)
 
-                # Kết hợp tiêu đề và nội dung
-                full_text = f"{title} {text}" if text else title
+            sentiment_results = [(post['post_id'], score) for post, score in zip(posts, scores)]
 
-                # Phân tích tình cảm
-                sentiment = self.analyze_sentiment_ensemble(full_text)
-
-                # Thêm vào batch
-                sentiment_results.append((
-                    post_id,
-                    sentiment["ensemble_score"]
-                ))
-
-            # Bulk insert/update
+            # Bulk insert/update (một câu lệnh nhiều VALUES cho mỗi trang)
             if sentiment_results:
-                psycopg2.extras.execute_batch(cur, """
+                psycopg2.extras.execute_values(cur, """
                     INSERT INTO reddit_data.post_analysis (
                         post_id, sentiment_score
-                    ) VALUES (%s, %s)
+                    ) VALUES %s
                     ON CONFLICT (post_id) 
                     DO UPDATE SET 
                         sentiment_score = EXCLUDED.sentiment_score,
                         processed_date = CURRENT_TIMESTAMP
-                """, sentiment_results)
+                """, sentiment_results, page_size=500)
 
                 conn.commit()
 
@@ -740,31 +873,22 @@ class SentimentAnalyzer:
             cur.execute(query, comment_ids)
             comments = cur.fetchall()
 
-            sentiment_results = []
+            # Phân tích tình cảm cả batch một lần
+            scores = self.score_texts([comment['body'] for comment in comments])
 
-            for comment in comments:
-                comment_id = comment['comment_id']
-                body = comment['body']
+            sentiment_results = [(comment['comment_id'], score) for comment, score in zip(comments, scores)]
 
-                # Phân tích tình cảm
-                sentiment = self.analyze_sentiment_ensemble(body)
-
-                # Thêm vào batch
-                sentiment_results.append((
-                    comment_id,
-                    sentiment["ensemble_score"]
-                ))
-            # Bulk insert/update
+            # Bulk insert/update (một câu lệnh nhiều VALUES cho mỗi trang)
             if sentiment_results:
-                psycopg2.extras.execute_batch(cur, """
+                psycopg2.extras.execute_values(cur, """
                     INSERT INTO reddit_data.comment_analysis (
                         comment_id, sentiment_score
-                    ) VALUES (%s, %s)
+                    ) VALUES %s
                     ON CONFLICT (comment_id) 
                     DO UPDATE SET 
                         sentiment_score = EXCLUDED.sentiment_score,
                         processed_date = CURRENT_TIMESTAMP
-                """, sentiment_results)
+                """, sentiment_results, page_size=500)
 
                 conn.commit()
 
@@ -782,6 +906,189 @@ class SentimentAnalyzer:
             if conn:
                 self.return_db_connection(conn)
 
+    def _analyze_tech_from_contexts(self, tech_name, posts):
+        """
+            Tính toán kết quả phân tích tình cảm của một công nghệ từ các bài viết đã truy vấn
+
+            Args:
+                tech_name (str): Tên công nghệ cần phân tích
+                posts (list): Danh sách (post_id, title, text, created_date) nhắc đến công nghệ
+
+            Returns:
+                dict: Kết quả phân tích
+        """
+        total_sentiment = 0
+        post_count = 0
+        positive_count = 0
+        negative_count = 0
+        neutral_count = 0
+        context_sentiments = []
+
+        # Heap kích thước 3 giữ các ngữ cảnh tích cực / tiêu cực nhất (chỉ số âm để ưu tiên bài đến trước khi bằng điểm)
+        top_positive_heap = []
+        top_negative_heap = []
+
+        # Với không quá 3 bài viết, mọi ngữ cảnh đều thuộc top nên chỉ cần nối vào danh sách
+        track_top = len(posts) > 3
+
+        # Dưới 3 bài viết thì không phân tích xu hướng theo thời gian, không cần giữ lại dòng thời gian
+        keep_timeline = len(posts) >= 3
+
+        # Phân tích tình cảm theo ngữ cảnh cho từng bài viết
+        for i, (post_id, title, text, created_date) in enumerate(posts):
+            full_text = f"{title} {text}" if text else title
+
+            # Phân tích tình cảm theo ngữ cảnh
+            context_sentiment = self.analyze_contextual_sentiment(full_text, tech_name)
+            sentiment_score = context_sentiment["score"]
+
+            # Lưu lại ngữ cảnh và điểm
+            context = {
+                'post_id': post_id,
+                'context': context_sentiment["context"],
+                'score': sentiment_score,
+                'created_date': created_date
+            }
+            if keep_timeline:
+                context_sentiments.append(context)
+
+            # Cập nhật thống kê
+            total_sentiment += sentiment_score
+            post_count += 1
+
+            if sentiment_score > 0.05:
+                positive_count += 1
+                entry = (sentiment_score, -i, context)
+                if not track_top:
+                    top_positive_heap.append(entry)
+                elif len(top_positive_heap) < 3:
+                    heapq.heappush(top_positive_heap, entry)
+                else:
+                    heapq.heappushpop(top_positive_heap, entry)
+            elif sentiment_score < -0.05:
+                negative_count += 1
+                entry = (-sentiment_score, -i, context)
+                if not track_top:
+                    top_negative_heap.append(entry)
+                elif len(top_negative_heap) < 3:
+                    heapq.heappush(top_negative_heap, entry)
+                else:
+                    heapq.heappushpop(top_negative_heap, entry)
+            else:
+                neutral_count += 1
+
+        # Điểm tình cảm trung bình
+        avg_sentiment = total_sentiment / post_count if post_count > 0 else 0
+
+        # Phân tích xu hướng theo thời gian (nếu có đủ dữ liệu)
+        time_trend = None
+        if keep_timeline:
+            # Sắp xếp theo thời gian
+            context_sentiments.sort(key=lambda x: x['created_date'])
+
+            # Chia thành các giai đoạn (ví dụ: đầu, giữa, cuối)
+            n = len(context_sentiments)
+            segment_size = n // 3
+
+            # Cộng dồn tổng và số lượng của từng giai đoạn trong một lượt duyệt
+            seg_sums = [0.0, 0.0, 0.0]
+            seg_counts = [0, 0, 0]
+            for i, context in enumerate(context_sentiments):
+                seg = min(i // segment_size, 2)
+                seg_sums[seg] += context['score']
+                seg_counts[seg] += 1
+
+            # Tính điểm trung bình cho mỗi giai đoạn
+            time_trend = {
+                'early': seg_sums[0] / seg_counts[0],
+                'mid': seg_sums[1] / seg_counts[1],
+                'recent': seg_sums[2] / seg_counts[2]
+            }
+
+        # Trả về kết quả phân tích
+        analysis_result = {
+            'tech_name': tech_name,
+            'post_count': post_count,
+            'avg_sentiment': avg_sentiment,
+            'positive_count': positive_count,
+            'negative_count': negative_count,
+            'neutral_count': neutral_count,
+            'sentiment_distribution': {
+                'positive': positive_count / post_count if post_count > 0 else 0,
+                'negative': negative_count / post_count if post_count > 0 else 0,
+                'neutral': neutral_count / post_count if post_count > 0 else 0
+            },
+            'time_trend': time_trend,
+            'top_positive_contexts': [entry[2] for entry in sorted(top_positive_heap, reverse=True)],
+            'top_negative_contexts': [entry[2] for entry in sorted(top_negative_heap, reverse=True)]
+        }
+
+        return analysis_result
+
+    def _iter_tech_contexts(self, conn, techs=None, itersize=2000):
+        """
+            Lấy các bài viết nhắc đến công nghệ trong một truy vấn và trả về lần lượt từng nhóm theo công nghệ
+
+            Dữ liệu được stream qua server-side cursor theo thứ tự tech_name, nên bộ nhớ chỉ giữ
+            bài viết của một công nghệ tại một thời điểm thay vì toàn bộ các cặp công nghệ × bài viết
+
+            Args:
+                conn: Kết nối PostgreSQL (cursor có tên phải chạy trong transaction của kết nối này)
+                techs (list, optional): Danh sách công nghệ cần lấy, None để lấy tất cả
+                itersize (int): Số dòng lấy về mỗi lần từ server
+
+            Yields:
+                tuple: (tên công nghệ, danh sách (post_id, title, text, created_date))
+        """
+        cur = conn.cursor(name=f"tech_contexts_{uuid.uuid4().hex}")
+        cur.itersize = itersize
+        try:
+            if techs is None:
+                cur.execute("""
+                    SELECT DISTINCT
+                        t.tech_name,
+                        p.post_id, p.title, p.text, p.created_date
+                    FROM reddit_data.posts p
+                    JOIN reddit_data.post_analysis pa ON p.post_id = pa.post_id
+                    CROSS JOIN LATERAL unnest(pa.tech_mentioned) AS t(tech_name)
+                    WHERE pa.tech_mentioned <> '{}'
+                    ORDER BY t.tech_name, p.post_id
+                """)
+            else:
+                techs = list(techs)
+                # && dùng được GIN index trên tech_mentioned, sau đó chỉ giữ lại các công nghệ được yêu cầu
+                cur.execute("""
+                    SELECT DISTINCT
+                        t.tech_name,
+                        p.post_id, p.title, p.text, p.created_date
+                    FROM reddit_data.posts p
+                    JOIN reddit_data.post_analysis pa ON p.post_id = pa.post_id
+                    CROSS JOIN LATERAL unnest(pa.tech_mentioned) AS t(tech_name)
+                    WHERE pa.tech_mentioned && %s::text[]
+                    AND t.tech_name = ANY(%s)
+                    ORDER BY t.tech_name, p.post_id
+                """, (techs, techs))
+
+            for tech_name, rows in itertools.groupby(cur, key=lambda row: row[0]):
+                yield tech_name, [row[1:] for row in rows]
+        finally:
+            cur.close()
+
+    def _save_tech_sentiment_avgs(self, cur, sentiment_updates):
+        """
+            Cập nhật điểm tình cảm trung bình vào bảng tech_trends trong một câu lệnh
+
+            Args:
+                cur: Cursor PostgreSQL
+                sentiment_updates (list): Danh sách (tech_name, sentiment_avg)
+        """
+        psycopg2.extras.execute_values(cur, """
+            UPDATE reddit_data.tech_trends AS tt
+            SET sentiment_avg = v.sentiment_avg
+            FROM (VALUES %s) AS v(tech_name, sentiment_avg)
+            WHERE tt.tech_name = v.tech_name
+        """, sentiment_updates, template="(%s, %s::float)")
+
     def analyze_tech_sentiment(self, tech_name):
         """
             Phân tích tình cảm đối với một công nghệ cụ thể
@@ -799,102 +1106,19 @@ class SentimentAnalyzer:
             cur = conn.cursor()
 
             # Tìm các bài viết nhắc đến công nghệ này
-            cur.execute("""
-                SELECT p.post_id, p.title, p.text, p.created_date
-                FROM reddit_data.posts p
-                JOIN reddit_data.post_analysis pa ON p.post_id = pa.post_id
-                WHERE %s = ANY(pa.tech_mentioned)
-            """, (tech_name,))
-
-            posts = cur.fetchall()
+            posts = dict(self._iter_tech_contexts(conn, [tech_name])).get(tech_name)
 
             if not posts:
                 logger.warning(f"Không tìm thấy bài viết nào nhắc đến {tech_name}")
                 return None
 
-            total_sentiment = 0
-            post_count = 0
-            positive_count = 0
-            negative_count = 0
-            neutral_count = 0
-            context_sentiments = []
-
-            # Phân tích tình cảm theo ngữ cảnh cho từng bài viết
-            for post_id, title, text, created_date in posts:
-                full_text = f"{title} {text}" if text else title
-
-                # Phân tích tình cảm theo ngữ cảnh
-                context_sentiment = self.analyze_contextual_sentiment(full_text, tech_name)
-                sentiment_score = context_sentiment["score"]
-
-                # Lưu lại ngữ cảnh và điểm
-                context_sentiments.append({
-                    'post_id': post_id,
-                    'context': context_sentiment["context"],
-                    'score': sentiment_score,
-                    'created_date': created_date
-                })
-
-                # Cập nhật thống kê
-                total_sentiment += sentiment_score
-                post_count += 1
-
-                if sentiment_score > 0.05:
-                    positive_count += 1
-                elif sentiment_score < -0.05:
-                    negative_count += 1
-                else:
-                    neutral_count += 1
-
-            # Điểm tình cảm trung bình
-            avg_sentiment = total_sentiment / post_count if post_count > 0 else 0
+            analysis_result = self._analyze_tech_from_contexts(tech_name, posts)
 
             # Cập nhật bảng tech_trends
-            cur.execute("""
-                UPDATE reddit_data.tech_trends
-                SET sentiment_avg = %s
-                WHERE tech_name = %s
-            """, (avg_sentiment, tech_name))
+            self._save_tech_sentiment_avgs(cur, [(tech_name, analysis_result['avg_sentiment'])])
 
             conn.commit()
 
-            # Phân tích xu hướng theo thời gian (nếu có đủ dữ liệu)
-            time_trend = None
-            if len(context_sentiments) >= 3:
-                # Sắp xếp theo thời gian
-                context_sentiments.sort(key=lambda x: x['created_date'])
-
-                # Chia thành các giai đoạn (ví dụ: đầu, giữa, cuối)
-                segment_size = len(context_sentiments) // 3
-
-                # Tính điểm trung bình cho mỗi giai đoạn
-                time_trend = {
-                    'early': sum(x['score'] for x in context_sentiments[:segment_size]) / segment_size,
-                    'mid': sum(x['score'] for x in context_sentiments[segment_size:2 * segment_size]) / segment_size,
-                    'recent': sum(x['score'] for x in context_sentiments[2 * segment_size:]) / (
-                                len(context_sentiments) - 2 * segment_size)
-                }
-
-            # Trả về kết quả phân tích
-            analysis_result = {
-                'tech_name': tech_name,
-                'post_count': post_count,
-                'avg_sentiment': avg_sentiment,
-                'positive_count': positive_count,
-                'negative_count': negative_count,
-                'neutral_count': neutral_count,
-                'sentiment_distribution': {
-                    'positive': positive_count / post_count if post_count > 0 else 0,
-                    'negative': negative_count / post_count if post_count > 0 else 0,
-                    'neutral': neutral_count / post_count if post_count > 0 else 0
-                },
-                'time_trend': time_trend,
-                'top_positive_contexts': sorted([c for c in context_sentiments if c['score'] > 0.05],
-                                                key=lambda x: x['score'], reverse=True)[:3],
-                'top_negative_contexts': sorted([c for c in context_sentiments if c['score'] < -0.05],
-                                                key=lambda x: x['score'])[:3]
-            }
-
             logger.debug(f"Đã phân tích tình cảm cho công nghệ {tech_name}")
             return analysis_result
 
@@ -910,12 +1134,16 @@ class SentimentAnalyzer:
             if conn:
                 self.return_db_connection(conn)
 
+    def _worker_initargs(self):
+        """Tham số cho _init_worker: lexicon và regex thuật ngữ hiện tại trong bộ nhớ của analyzer"""
+        return self.main_vader.lexicon_file, self._lexicon_blob, self.tech_term_regex
+
     def analyze_all_posts_parallel(self, max_workers=4, batch_size=50, limit=None):
         """
             Phân tích tình cảm cho tất cả các bài viết song song
 
             Args:
-                max_workers (int): Số lượng worker threads tối đa
+                max_workers (int): Số lượng worker processes tối đa
                 batch_size (int): Kích thước của mỗi batch xử lý
                 limit (int, optional): Giới hạn số lượng bài viết cần phân tích
 
@@ -926,7 +1154,9 @@ class SentimentAnalyzer:
         cur = None
         try:
             conn = self.get_db_connection()
-            cur = conn.cursor()
+            # Server-side cursor: stream ID theo từng batch thay vì tải toàn bộ vào bộ nhớ
+            cur = conn.cursor(name=f"post_ids_{uuid.uuid4().hex}")
+            cur.itersize = batch_size
 
             query = """
                 SELECT p.post_id
@@ -939,23 +1169,24 @@ class SentimentAnalyzer:
                 query += f" LIMIT {limit}"
 
             cur.execute(query)
-            post_ids = [row[0] for row in cur.fetchall()]
-            logger.info(f"Tìm thấy {len(post_ids)} bài viết cần phân tích tình cảm")
+            batches = _iter_id_batches(cur, batch_size)
 
-            if not post_ids:
-                return 0
+            # Xử lý song song các batch ngay khi đọc được từ database
+            # VADER/TextBlob là CPU-bound nên chạy trên nhiều process để tránh GIL
+            with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                                     initargs=self._worker_initargs()) as executor:
+                batch_results = list(_map_bounded(executor, _analyze_post_batch_worker, batches, max_workers * 2))
 
-            batches = [post_ids[i:i + batch_size] for i in range(0, len(post_ids), batch_size)]
-            logger.info(f"Chia thành {len(batches)} batch, mỗi batch khoảng {batch_size} bài viết")
-
-            # Xử lý song song các batch
-            total_processed = 0
-
-            with ThreadPoolExecutor(max_workers=max_workers) as executor:
-                batch_results = list(executor.map(self.analyze_post_batch, batches))
+            if not batch_results:
+                logger.info("Không có bài viết nào cần phân tích tình cảm")
+                return 0
 
             total_processed = sum(batch_results)
-            logger.info(f"Đã phân tích tình cảm cho {total_processed}/{len(post_ids)} bài viết")
+            # Kết quả phân tích bài viết thay đổi: các phân tích công nghệ đã cache không còn đúng
+            if total_processed:
+                self._invalidate_tech_sentiment_cache()
+            logger.info(f"Đã phân tích tình cảm cho {total_processed} bài viết "
+                        f"({len(batch_results)} batch, mỗi batch khoảng {batch_size} bài viết)")
             return total_processed
 
         except Exception as e:
@@ -986,7 +1217,7 @@ class SentimentAnalyzer:
             Phân tích tình cảm cho tất cả các bình luận song song
 
             Args:
-                max_workers (int): Số lượng worker threads tối đa
+                max_workers (int): Số lượng worker processes tối đa
                 batch_size (int): Kích thước của mỗi batch xử lý
                 limit (int, optional): Giới hạn số lượng bình luận cần phân tích
 
@@ -998,7 +1229,9 @@ class SentimentAnalyzer:
         try:
             # Lấy danh sách bình luận cần phân tích
             conn = self.get_db_connection()
-            cur = conn.cursor()
+            # Server-side cursor: stream ID theo từng batch thay vì tải toàn bộ vào bộ nhớ
+            cur = conn.cursor(name=f"comment_ids_{uuid.uuid4().hex}")
+            cur.itersize = batch_size
 
             query = """
                 SELECT c.comment_id
@@ -1011,27 +1244,25 @@ class SentimentAnalyzer:
                 query += f" LIMIT {limit}"
 
             cur.execute(query)
-            comment_ids = [row[0] for row in cur.fetchall()]
-
-            logger.info(f"Tìm thấy {len(comment_ids)} bình luận cần phân tích tình cảm")
 
-            if not comment_ids:
-                return 0
-
-            # Chia thành các batch nhỏ hơn
-            batches = [comment_ids[i:i + batch_size] for i in range(0, len(comment_ids), batch_size)]
-            logger.info(f"Chia thành {len(batches)} batch, mỗi batch khoảng {batch_size} bình luận")
+            # Chia thành các batch nhỏ hơn khi đọc từ database
+            batches = _iter_id_batches(cur, batch_size)
 
             # Xử lý song song các batch
-            total_processed = 0
+            # VADER/TextBlob là CPU-bound nên chạy trên nhiều process để tránh GIL
+            with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                                     initargs=self._worker_initargs()) as executor:
+                batch_results = list(_map_bounded(executor, _analyze_comment_batch_worker, batches, max_workers * 2))
 
-            with ThreadPoolExecutor(max_workers=max_workers) as executor:
-                batch_results = list(executor.map(self.analyze_comment_batch, batches))
+            if not batch_results:
+                logger.info("Không có bình luận nào cần phân tích tình cảm")
+                return 0
 
             # Tính tổng số bình luận đã xử lý
             total_processed = sum(batch_results)
 
-            logger.info(f"Đã phân tích tình cảm cho {total_processed}/{len(comment_ids)} bình luận")
+            logger.info(f"Đã phân tích tình cảm cho {total_processed} bình luận "
+                        f"({len(batch_results)} batch, mỗi batch khoảng {batch_size} bình luận)")
             return total_processed
 
         except Exception as e:
@@ -1057,26 +1288,24 @@ class SentimentAnalyzer:
             conn = self.get_db_connection()
             cur = conn.cursor()
 
-            cur.execute("""
-                SELECT DISTINCT unnest(tech_mentioned)
-                FROM reddit_data.post_analysis
-                WHERE tech_mentioned IS NOT NULL
-            """)
-
-            technologies = [row[0] for row in cur.fetchall()]
-
-            logger.info(f"Tìm thấy {len(technologies)} công nghệ cần cập nhật tình cảm")
-
-            count = 0
-            for tech in technologies:
-                result = self.analyze_tech_sentiment(tech)
-                if result:
-                    count += 1
+            # Lấy tất cả bài viết nhắc đến công nghệ trong một truy vấn thay vì một truy vấn cho mỗi công nghệ,
+            # phân tích từng công nghệ ngay khi đọc xong nhóm bài viết của nó
+            sentiment_updates = []
+            for tech, posts in self._iter_tech_contexts(conn):
+                result = self._analyze_tech_from_contexts(tech, posts)
+                sentiment_updates.append((tech, result['avg_sentiment']))
 
                 # Log tiến trình
-                if count % 10 == 0:
-                    logger.info(f"Đã cập nhật tình cảm cho {count}/{len(technologies)} công nghệ")
+                if len(sentiment_updates) % 10 == 0:
+                    logger.info(f"Đã phân tích tình cảm cho {len(sentiment_updates)} công nghệ")
+
+            # Cập nhật bảng tech_trends cho tất cả công nghệ trong một câu lệnh
+            if sentiment_updates:
+                self._save_tech_sentiment_avgs(cur, sentiment_updates)
+                conn.commit()
+                self._invalidate_tech_sentiment_cache()
 
+            count = len(sentiment_updates)
             logger.info(f"Hoàn thành cập nhật tình cảm cho {count} công nghệ")
             return count
 
@@ -1106,63 +1335,19 @@ class SentimentAnalyzer:
         try:
             conn = self.get_db_connection()
             cur = conn.cursor()
-            cur.execute("""
-                WITH tech_sentiments AS (
-                SELECT 
-                    unnest(pa.tech_mentioned) as tech_name,
-                    pa.sentiment_score,
-                    p.created_date
-                FROM 
-                    reddit_data.post_analysis pa
-                    JOIN reddit_data.posts p ON pa.post_id = p.post_id
-                WHERE 
-                    pa.tech_mentioned IS NOT NULL
-                    AND pa.sentiment_score IS NOT NULL
-                    AND p.created_date >= CURRENT_DATE - INTERVAL '%s DAY'
-                )   
-                SELECT 
-                    tech_name,
-                    DATE_TRUNC('week', created_date) as week_start,
-                    AVG(sentiment_score) as avg_sentiment,
-                    COUNT(*) as mention_count
-                FROM 
-                    tech_sentiments
-                GROUP BY 
-                    tech_name, week_start
-                HAVING 
-                    COUNT(*) >= %s
-                ORDER BY 
-                    tech_name, week_start
-            """, (period_days, min_mentions))
-
-            trends_data = cur.fetchall()
-
-            trends = defaultdict(list)
-            for tech_name, week_start, avg_sentiment, mention_count in trends_data:
-                trends[tech_name].append({
-                    'week_start': week_start,
-                    'avg_sentiment': float(avg_sentiment),
-                    'mention_count': mention_count
-                })
+            # Tính độ dốc xu hướng (bình phương tối thiểu theo chỉ số tuần) ngay trong PostgreSQL,
+            # câu lệnh được PREPARE một lần cho mỗi kết nối và chỉ bind tham số ở các lần gọi sau
+            prepare_statement(conn, self._prepared_statements, "sentiment_trends_q", "(int, int)",
+                              SENTIMENT_TRENDS_SQL)
+            cur.execute("EXECUTE sentiment_trends_q(%s, %s)", (period_days, min_mentions))
 
             trend_results = {}
-            for tech, data in trends.items():
-                if len(data) <= 1:
-                    continue
-
-                data.sort(key=lambda x: x['week_start'])
-
-                # Tính toán xu hướng (độ dốc của đường xu hướng)
-                x = list(range(len(data)))
-                y = [point['avg_sentiment'] for point in data]
-
-                # Tính hệ số góc bằng phương pháp bình phương tối thiểu
-                n = len(x)
-                if n >= 2:
-                    slope = (n * sum(x[i] * y[i] for i in range(n)) - sum(x) * sum(y)) / \
-                            (n * sum(x[i] ** 2 for i in range(n)) - sum(x) ** 2)
-                else:
-                    slope = 0
+            for tech, slope, total_mentions, week_starts, avg_sentiments, mention_counts in cur.fetchall():
+                data = [
+                    {'week_start': week_start, 'avg_sentiment': float(avg_sentiment), 'mention_count': mention_count}
+                    for week_start, avg_sentiment, mention_count in zip(week_starts, avg_sentiments, mention_counts)
+                ]
+                slope = float(slope) if slope is not None else 0
 
                 trend_type = 'increasing' if slope > 0.05 else 'decreasing' if slope < -0.05 else 'stable'
 
@@ -1171,7 +1356,7 @@ class SentimentAnalyzer:
                     'trend_slope': slope,
                     'trend_type': trend_type,
                     'current_sentiment': data[-1]['avg_sentiment'],
-                    'total_mentions': sum(point['mention_count'] for point in data)
+                    'total_mentions': total_mentions
                 }
 
             logger.info(f"Đã phân tích xu hướng cảm xúc cho {len(trend_results)} công nghệ")
@@ -1187,6 +1372,110 @@ class SentimentAnalyzer:
             if conn:
                 self.return_db_connection(conn)
 
+    def _invalidate_tech_sentiment_cache(self):
+        """Xóa cache phân tích công nghệ sau khi dữ liệu phân tích bài viết / tech_trends thay đổi"""
+        with self.cache_lock:
+            self.tech_sentiment_cache.clear()
+            self._tech_data_version_expires = 0
+
+    def _get_tech_data_version(self):
+        """
+            Lấy phiên bản dữ liệu post_analysis để kiểm tra cache phân tích công nghệ: bài viết được
+            phân tích bởi process / analyzer khác cũng làm phiên bản thay đổi
+
+            Returns:
+                tuple | None: (MAX(processed_date), COUNT(*)) của post_analysis, None nếu không truy vấn được
+        """
+        now = time.monotonic()
+        with self.cache_lock:
+            if self._tech_data_version is not None and now < self._tech_data_version_expires:
+                return self._tech_data_version
+
+        conn = None
+        cur = None
+        try:
+            conn = self.get_db_connection()
+            cur = conn.cursor()
+            cur.execute("SELECT MAX(processed_date), COUNT(*) FROM reddit_data.post_analysis")
+            version = cur.fetchone()
+        except Exception as e:
+            logger.warning(f"Không thể lấy phiên bản dữ liệu phân tích: {str(e)}")
+            return None
+        finally:
+            if cur:
+                cur.close()
+            if conn:
+                self.return_db_connection(conn)
+
+        with self.cache_lock:
+            self._tech_data_version = version
+            self._tech_data_version_expires = now + TECH_DATA_VERSION_TTL
+
+        return version
+
+    def _get_cached_tech_sentiments(self, tech_names):
+        """
+            Lấy kết quả phân tích tình cảm của nhiều công nghệ, chỉ truy vấn database cho các công nghệ chưa có trong cache
+
+            Args:
+                tech_names (list): Danh sách tên công nghệ cần phân tích
+
+            Returns:
+                dict: Tên công nghệ -> kết quả phân tích (bỏ qua công nghệ không có bài viết)
+        """
+        # Chỉ dùng kết quả cache cùng phiên bản dữ liệu (không dùng cache nếu không lấy được phiên bản)
+        version = self._get_tech_data_version()
+        results = {}
+        if version is not None:
+            with self.cache_lock:
+                for tech in tech_names:
+                    entry = self.tech_sentiment_cache.get(tech)
+                    if entry is not None and entry[0] == version:
+                        self.tech_sentiment_cache.move_to_end(tech)
+                        results[tech] = entry[1]
+
+        missing = [tech for tech in dict.fromkeys(tech_names) if tech not in results]
+        if not missing:
+            return results
+
+        conn = None
+        cur = None
+        try:
+            conn = self.get_db_connection()
+            cur = conn.cursor()
+
+            # Một truy vấn cho tất cả công nghệ chưa có trong cache
+            analyses = {tech: self._analyze_tech_from_contexts(tech, posts)
+                        for tech, posts in self._iter_tech_contexts(conn, missing)}
+
+            # Cập nhật bảng tech_trends
+            if analyses:
+                self._save_tech_sentiment_avgs(cur, [(tech, analysis['avg_sentiment'])
+                                                     for tech, analysis in analyses.items()])
+                conn.commit()
+
+            if version is not None:
+                with self.cache_lock:
+                    for tech, analysis in analyses.items():
+                        self.tech_sentiment_cache[tech] = (version, analysis)
+                        self.tech_sentiment_cache.move_to_end(tech)
+                    while len(self.tech_sentiment_cache) > TECH_SENTIMENT_CACHE_MAX_SIZE:
+                        self.tech_sentiment_cache.popitem(last=False)
+            results.update(analyses)
+
+        except Exception as e:
+            logger.error(f"Lỗi khi phân tích tình cảm cho các công nghệ {', '.join(missing)}: {str(e)}")
+            if conn:
+                conn.rollback()
+
+        finally:
+            if cur:
+                cur.close()
+            if conn:
+                self.return_db_connection(conn)
+
+        return results
+
     def compare_tech_sentiment(self, tech_names):
         """
            So sánh cảm xúc giữa các công nghệ
@@ -1200,11 +1489,9 @@ class SentimentAnalyzer:
         if not tech_names or len(tech_names) < 2:
             return None
 
-        tech_results = {}
-        for tech in tech_names:
-            analysis = self.analyze_tech_sentiment(tech)
-            if analysis:
-                tech_results[tech] = analysis
+        # Lấy kết quả từ cache, các công nghệ còn thiếu được phân tích chung từ một truy vấn
+        analyses = self._get_cached_tech_sentiments(tech_names)
+        tech_results = {tech: analyses[tech] for tech in tech_names if tech in analyses}
 
         ranked_techs = sorted(tech_results.items(),
                               key=lambda x: x[1]['avg_sentiment'],
@@ -1220,14 +1507,16 @@ class SentimentAnalyzer:
                                for tech, data in tech_results.items()}
         }
 
-        # Thêm phân tích so sánh cặp đôi
-        comparison['pairwise_differences'] = {}
+        # Thêm phân tích so sánh cặp đôi (hiệu của mọi cặp tính một lần bằng broadcasting)
         tech_list = list(tech_results.keys())
-        for i in range(len(tech_list)):
-            for j in range(i + 1, len(tech_list)):
-                tech1, tech2 = tech_list[i], tech_list[j]
-                diff = tech_results[tech1]['avg_sentiment'] - tech_results[tech2]['avg_sentiment']
-                comparison['pairwise_differences'][f"{tech1} vs {tech2}"] = diff
+        sentiments = np.fromiter((tech_results[tech]['avg_sentiment'] for tech in tech_list),
+                                 dtype=np.float64, count=len(tech_list))
+        diffs = sentiments[:, None] - sentiments[None, :]
+        rows, cols = np.triu_indices(len(tech_list), k=1)
+        comparison['pairwise_differences'] = {
+            f"{tech_list[i]} vs {tech_list[j]}": float(diffs[i, j])
+            for i, j in zip(rows.tolist(), cols.tolist())
+        }
 
         return comparison
 
@@ -1248,17 +1537,27 @@ class SentimentAnalyzer:
             # Cập nhật từ điển hiện tại
             self.tech_sentiment_dict.update(updates)
 
-            # Lưu vào file
-            sentiment_file = "config/tech_sentiment.json"
-            with open(sentiment_file, 'w', encoding='utf-8') as f:
-                json.dump(self.tech_sentiment_dict, f, indent=4)
+            # Lưu vào file (lỗi ghi file được báo qua giá trị trả về)
+            data = json.dumps(self.tech_sentiment_dict, indent=4).encode('utf-8')
+            self._write_sentiment_dict_file("config/tech_sentiment.json", data)
 
             # Cập nhật VADER lexicon
             self.main_vader.lexicon.update(updates)
+            self._lexicon_blob = marshal.dumps(self.main_vader.lexicon)
+            self._lexicon_version += 1
 
-            # Xóa cache để đảm bảo các phân tích mới sẽ sử dụng từ điển mới
+            # Vô hiệu hóa cache để đảm bảo các phân tích mới sẽ sử dụng từ điển mới
             with self.cache_lock:
-                self.sentiment_cache.clear()
+                if len(updates) > CACHE_INVALIDATION_THRESHOLD:
+                    self.sentiment_cache.clear()
+                    self._cache_token_index.clear()
+                else:
+                    # Chỉ xóa các kết quả của văn bản có chứa từ khóa vừa cập nhật
+                    affected = set().union(*(self._cache_token_index.get(term.lower(), ()) for term in updates))
+                    for cache_key in affected:
+                        self._evict_cache_key(cache_key)
+                    logger.debug(f"Đã xóa {len(affected)} kết quả khỏi cache cảm xúc")
+                self.tech_sentiment_cache.clear()
 
             logger.info(f"Đã cập nhật {len(updates)} mục trong từ điển cảm xúc")
             return True
@@ -1267,6 +1566,39 @@ class SentimentAnalyzer:
             logger.error(f"Lỗi khi cập nhật từ điển cảm xúc: {str(e)}")
             return False
 
+    def _write_sentiment_dict_file(self, sentiment_file, data):
+        """
+            Ghi file từ điển cảm xúc an toàn: ghi ra file tạm rồi thay thế nguyên tử
+
+            Args:
+                sentiment_file (str): Đường dẫn file từ điển
+                data (bytes): Nội dung JSON đã serialize
+
+            Raises:
+                OSError: Khi không ghi được file (file cũ được giữ nguyên)
+        """
+        dir_name = os.path.dirname(sentiment_file) or '.'
+        fd, tmp_path = tempfile.mkstemp(dir=dir_name, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+
+            # mkstemp tạo file với quyền 0600: giữ quyền của file cũ (hoặc 0644 nếu chưa có)
+            try:
+                mode = os.stat(sentiment_file).st_mode & 0o777
+            except FileNotFoundError:
+                mode = 0o644
+            os.chmod(tmp_path, mode)
+
+            os.replace(tmp_path, sentiment_file)
+            logger.debug(f"Đã lưu từ điển cảm xúc vào {sentiment_file}")
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
     def close(self):
         """Đóng kết nối PostgreSQL"""
         if hasattr(self, 'cur') and self.cur:
@@ -1276,24 +1608,134 @@ class SentimentAnalyzer:
         logger.info("Đã đóng kết nối PostgreSQL")
 
 
+def _create_connection_pool(min_conn, max_conn, statement_timeout_ms=None):
+    """
+        Tạo connection pool tới PostgreSQL
 
+        Args:
+            min_conn (int): Số kết nối tối thiểu trong pool
+            max_conn (int): Số kết nối tối đa trong pool
+            statement_timeout_ms (int, optional): Thời gian tối đa cho mỗi câu lệnh SQL (mili giây)
+
+        Returns:
+            ThreadedConnectionPool: Connection pool đã khởi tạo
+    """
+    # Giới hạn thời gian mỗi câu lệnh để truy vấn chậm không giữ kết nối của pool quá lâu
+    conn_kwargs = {}
+    if statement_timeout_ms:
+        conn_kwargs['options'] = f"-c statement_timeout={int(statement_timeout_ms)}"
+
+    try:
+        pool = psycopg2.pool.ThreadedConnectionPool(
+            min_conn,
+            max_conn,
+            host=POSTGRES_HOST,
+            port=POSTGRES_PORT,
+            dbname=POSTGRES_DB,
+            user=POSTGRES_USER,
+            password=POSTGRES_PASSWORD,
+            **conn_kwargs
+        )
+        logger.info(f"Đã khởi tạo connection pool (min={min_conn}, max={max_conn})")
+        return pool
+    except Exception as e:
+        logger.error(f"Lỗi khi khởi tạo connection pool: {str(e)}")
+        raise
+
+
+def _vader_from_blob(lexicon_file, lexicon_blob):
+    """
+        Tạo VADER từ lexicon đã marshal, bỏ qua __init__ (đọc và parse vader_lexicon.txt)
 
+        Args:
+            lexicon_file (str): Đường dẫn lexicon gốc của VADER
+            lexicon_blob (bytes): Lexicon đã gộp từ điển tùy chỉnh, serialize bằng marshal
 
+        Returns:
+            SentimentIntensityAnalyzer: VADER dùng lexicon đã cho
+    """
+    vader = SentimentIntensityAnalyzer.__new__(SentimentIntensityAnalyzer)
+    vader.lexicon_file = lexicon_file
+    vader.lexicon = marshal.loads(lexicon_blob)
+    vader.constants = VaderConstants()
+    return vader
 
 
+# SentimentAnalyzer riêng của mỗi process worker (khởi tạo một lần trong _init_worker)
+_worker_analyzer = None
 
 
+def _init_worker(lexicon_file, lexicon_blob, tech_term_regex):
+    """
+        Khởi tạo SentimentAnalyzer tối giản cho process worker: chỉ chấm điểm và ghi kết quả batch
 
+        Lexicon và regex thuật ngữ được lấy từ process cha (kể cả các cập nhật từ điển chưa ghi xuống file),
+        không kiểm tra lại tài nguyên NLTK hay tải lại từ điển / danh sách công nghệ
 
+        Args:
+            lexicon_file (str): Đường dẫn lexicon gốc của VADER
+            lexicon_blob (bytes): Lexicon hiện tại của process cha (SentimentAnalyzer._lexicon_blob)
+            tech_term_regex (re.Pattern | None): Regex thuật ngữ kỹ thuật dùng trong clean_text
+    """
+    global _worker_analyzer
+    analyzer = SentimentAnalyzer.__new__(SentimentAnalyzer)
+    analyzer.main_vader = _vader_from_blob(lexicon_file, lexicon_blob)
+    analyzer._lexicon_blob = lexicon_blob
+    analyzer._lexicon_version = 0
+    analyzer.tech_term_regex = tech_term_regex
+    analyzer.connection_pool = _create_connection_pool(1, 2)
 
+    # Đóng pool khi process worker kết thúc (atexit không chạy trong process con của multiprocessing)
+    multiprocessing.util.Finalize(None, analyzer.connection_pool.closeall, exitpriority=10)
+    _worker_analyzer = analyzer
 
 
+def _analyze_post_batch_worker(post_ids):
+    """Phân tích một batch bài viết trong process worker"""
+    return _worker_analyzer.analyze_post_batch(post_ids)
 
 
+def _analyze_comment_batch_worker(comment_ids):
+    """Phân tích một batch bình luận trong process worker"""
+    return _worker_analyzer.analyze_comment_batch(comment_ids)
 
 
+def _iter_id_batches(cursor, batch_size):
+    """
+        Đọc ID từ cursor và trả về lần lượt từng batch
 
+        Args:
+            cursor: Cursor đã thực thi truy vấn trả về ID ở cột đầu tiên
+            batch_size (int): Kích thước của mỗi batch
 
+        Yields:
+            list: Danh sách ID của một batch
+    """
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            break
+        yield [row[0] for row in rows]
 
 
+def _map_bounded(executor, fn, iterable, max_pending):
+    """
+        Giống executor.map nhưng chỉ lấy phần tử tiếp theo từ iterable khi số task đang chờ
+        nhỏ hơn max_pending (executor.map đọc hết iterable ngay khi được gọi)
 
+        Args:
+            executor: Executor dùng để chạy fn
+            fn (callable): Hàm xử lý từng phần tử
+            iterable: Nguồn dữ liệu (có thể là generator đọc từ database)
+            max_pending (int): Số task tối đa đã submit nhưng chưa lấy kết quả
+
+        Yields:
+            Kết quả của fn theo đúng thứ tự phần tử đầu vào
+    """
+    pending = deque()
+    for item in iterable:
+        pending.append(executor.submit(fn, item))
+        if len(pending) >= max_pending:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
@@ -2,9 +2,12 @@ import os
 import re
 import json
 import time
+import hashlib
 from datetime import datetime, timedelta
+from itertools import repeat
 import threading
-from concurrent.futures import ThreadPoolExecutor
+import weakref
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 
 import psycopg2
 import psycopg2.pool
@@ -13,12 +16,12 @@ import pandas as pd
 import numpy as np
 from collections import defaultdict, Counter
 
-from click.formatting import iter_rows
-from matplotlib.artist import kwdoc
-from matplotlib.backend_tools import cursors
-
-from src.utils.config import POSTGRES_HOST, POSTGRES_PORT, POSTGRES_DB, POSTGRES_USER, POSTGRES_PASSWORD
+from src.utils.config import (
+    POSTGRES_HOST, POSTGRES_PORT, POSTGRES_DB, POSTGRES_USER, POSTGRES_PASSWORD, CACHE_DIR, CACHE_SIZE_LIMIT
+)
 from src.utils.logger import setup_logger
+from src.utils.db import prepare_statement
+from src.utils.cache import ResultCache
 
 # Thiết lập logger
 logger = setup_logger(__name__, "logs/trend_analyzer.log")
@@ -26,16 +29,111 @@ logger = setup_logger(__name__, "logs/trend_analyzer.log")
 # Tạo thread-local storage cho các resource dùng chung
 thread_local = threading.local()
 
+# Số dòng mỗi lần FETCH khi đọc các cặp công nghệ đồng xuất hiện
+PAIRS_FETCH_SIZE = 20000
+
+# Số dòng mỗi khối khi đọc kết quả lớn qua server-side cursor
+READ_CHUNK_SIZE = 50000
+
+# Thời gian (giây) dùng lại phiên bản dữ liệu trước khi truy vấn lại database
+DATASET_VERSION_TTL = 60
+
+# Phiên bản dữ liệu khi không truy vấn được database
+UNKNOWN_DATASET_VERSION = "unknown"
+
+# Tăng trưởng số lần đề cập so với kỳ trước ($1: số tuần mỗi kỳ), một lần quét duy nhất:
+# hai kỳ được tách bằng FILTER thay vì hai CTE riêng
+TECH_GROWTH_SQL = """
+    WITH latest AS (
+        SELECT MAX(week_start) as max_week FROM reddit_data.tech_trends
+    )
+    SELECT
+        tech_name,
+        SUM(mention_count) FILTER (
+            WHERE week_start >= latest.max_week - $1 * INTERVAL '1 week'
+        ) as current_mentions,
+        COALESCE(SUM(mention_count) FILTER (
+            WHERE week_start < latest.max_week - $1 * INTERVAL '1 week'
+        ), 0) as previous_mentions
+    FROM
+        reddit_data.tech_trends, latest
+    WHERE
+        week_start >= latest.max_week - 2 * $1 * INTERVAL '1 week'
+    GROUP BY
+        tech_name
+    HAVING
+        -- Chỉ xem xét các công nghệ có ít nhất 5 lần đề cập
+        SUM(mention_count) FILTER (
+            WHERE week_start >= latest.max_week - $1 * INTERVAL '1 week'
+        ) >= 5
+"""
+
+# Các công nghệ được đề cập thường xuyên ($1: số lần đề cập tối thiểu)
+POPULAR_TECHS_SQL = """
+    SELECT tech_name, SUM(mention_count) as total_mentions
+    FROM reddit_data.tech_trends
+    GROUP BY tech_name
+    HAVING SUM(mention_count) >= $1
+    ORDER BY total_mentions DESC
+"""
+
+
+def _release_connection(pool, conn):
+    """Trả kết nối của thread về pool (bỏ qua nếu pool đã đóng)"""
+    try:
+        pool.putconn(conn, close=conn.closed)
+    except psycopg2.pool.PoolError:
+        pass
+
+
+class _ThreadConnection:
+    """Kết nối được giữ riêng cho một thread, tự trả về pool khi thread kết thúc"""
+    def __init__(self, pool):
+        self.pool = pool
+        self.conn = pool.getconn()
+        # Thread-local bị giải phóng khi thread kết thúc, lúc đó kết nối được trả lại pool
+        self.release = weakref.finalize(self, _release_connection, pool, self.conn)
+
+
+# TrendAnalyzer riêng của mỗi process worker (khởi tạo trong _init_worker)
+_worker_analyzer = None
+
+
+def _init_worker(dtype_backend, cache_dir):
+    """Khởi tạo TrendAnalyzer và connection pool cho process worker"""
+    global _worker_analyzer
+    _worker_analyzer = TrendAnalyzer(min_conn=1, max_conn=2, dtype_backend=dtype_backend, cache_dir=cache_dir)
+
+
+def _run_analysis_worker(name, method_name, kwargs):
+    """Chạy một phân tích của TrendAnalyzer trong process worker"""
+    try:
+        return name, getattr(_worker_analyzer, method_name)(**kwargs)
+    except Exception as e:
+        logger.error(f"Lỗi khi chạy phân tích {name}: {str(e)}")
+        return name, None
+
+
 class TrendAnalyzer:
-    """Class phân tích xu hướng từ dữ liệu Reddit theo thời gian"""
-    def __init__(self, min_conn=3, max_conn=10):
+    """
+        Class phân tích xu hướng từ dữ liệu Reddit theo thời gian
+
+        Các DataFrame kết quả được dùng chung với cache (không sao chép), nơi gọi chỉ được đọc,
+        cần sửa đổi thì gọi .copy() trước
+    """
+    def __init__(self, min_conn=3, max_conn=10, dtype_backend=None, cache_dir=os.path.join(CACHE_DIR, "trend_analyzer")):
         """
             Khởi tạo TrendAnalyzer với connection pool
 
             Args:
                 min_conn (int): Số kết nối tối thiểu trong pool
                 max_conn (int): Số kết nối tối đa trong pool
+                dtype_backend (str, optional): Kiểu dữ liệu cho DataFrame kết quả ('pyarrow',
+                    'numpy_nullable'), None để dùng kiểu numpy mặc định
+                cache_dir (str, optional): Thư mục lưu cache kết quả, None để chỉ cache trong bộ nhớ
         """
+        self.dtype_backend = dtype_backend
+
         try:
             self.connection_pool = psycopg2.pool.ThreadedConnectionPool(
                 min_conn,
@@ -52,9 +150,17 @@ class TrendAnalyzer:
             logger.error(f"Lỗi khi khởi tạo connection pool: {str(e)}")
             raise
 
-        # Khởi tạo cache cho các kết quả phân tích
-        self.cache = {}
-        self.cache_lock = threading.Lock()
+        # Khởi tạo cache cho các kết quả phân tích (LRU có giới hạn, lưu xuống đĩa để dùng lại sau khi khởi động lại;
+        # thư mục cache dùng chung giữa các process worker của run_all_analyses và các lần chạy CLI)
+        self.cache = ResultCache(cache_dir=cache_dir, maxsize=128, size_limit=CACHE_SIZE_LIMIT)
+
+        # Phiên bản dữ liệu dùng trong cache key (làm mới tối đa mỗi DATASET_VERSION_TTL giây)
+        self._dataset_version_value = None
+        self._dataset_version_expires = 0
+        self._dataset_version_lock = threading.Lock()
+
+        # Các prepared statement đã tạo, theo (kết nối, backend pid, tên)
+        self._prepared_statements = set()
 
         logger.info("TrendAnalyzer đã được khởi tạo")
 
@@ -69,11 +175,25 @@ class TrendAnalyzer:
             Returns:
                 connection: Kết nối PostgreSQL
         """
+        # Mỗi thread giữ một kết nối riêng cho mỗi analyzer, tránh lock của pool ở mỗi lần gọi
+        holders = getattr(thread_local, 'connections', None)
+        if holders is None:
+            holders = thread_local.connections = {}
+
+        holder = holders.get(id(self))
+        if holder is not None:
+            if holder.pool is self.connection_pool and not holder.conn.closed:
+                return holder.conn
+            # Kết nối đã đóng (hoặc thuộc analyzer cũ): trả lại pool và lấy kết nối mới
+            holder.release()
+            del holders[id(self)]
+
         retries = 0
         while retries < max_retries:
             try:
-                conn = self.connection_pool.getconn()
-                return conn
+                holder = _ThreadConnection(self.connection_pool)
+                holders[id(self)] = holder
+                return holder.conn
             except Exception as e:
                 retries += 1
                 logger.warning(f"Lỗi khi lấy kết nối (lần {retries}): {str(e)}")
@@ -84,13 +204,146 @@ class TrendAnalyzer:
 
     def return_db_connection(self, conn):
         """
-            Trả lại kết nối vào connection pool
+            Kết thúc sử dụng kết nối của thread hiện tại (kết nối vẫn được giữ cho lần gọi sau)
 
             Args:
                 conn: Kết nối PostgreSQL cần trả lại
         """
-        if conn:
-            self.connection_pool.putconn(conn)
+        # Giống pool.putconn: rollback transaction còn dang dở để lần dùng sau bắt đầu sạch
+        if conn and not conn.closed and \
+                conn.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            conn.rollback()
+
+    def _dataset_version(self):
+        """
+            Lấy dấu phiên bản của dữ liệu nguồn để đưa vào cache key: khi có dữ liệu phân tích
+            hoặc xu hướng mới, key thay đổi và kết quả cũ trong cache không còn được dùng
+
+            Dấu phiên bản không nhận ra các cập nhật tại chỗ (score / num_comments của posts,
+            sentiment_avg của tech_trends), nên kết quả cache vẫn hết hạn theo TTL của từng phân tích
+
+            Returns:
+                str: Dấu phiên bản dữ liệu ("unknown" nếu không truy vấn được)
+        """
+        now = time.monotonic()
+        with self._dataset_version_lock:
+            if self._dataset_version_value is not None and now < self._dataset_version_expires:
+                return self._dataset_version_value
+
+        conn = None
+        cur = None
+        try:
+            conn = self.get_db_connection()
+            cur = conn.cursor()
+            cur.execute("""
+                SELECT
+                    (SELECT MAX(processed_date) FROM reddit_data.post_analysis),
+                    (SELECT COUNT(*) FROM reddit_data.post_analysis),
+                    (SELECT MAX(processed_date) FROM reddit_data.tech_trends)
+            """)
+            version = hashlib.md5(repr(cur.fetchone()).encode('utf-8')).hexdigest()[:12]
+        except Exception as e:
+            logger.warning(f"Không thể lấy phiên bản dữ liệu: {str(e)}")
+            return UNKNOWN_DATASET_VERSION
+        finally:
+            if cur:
+                cur.close()
+            if conn:
+                self.return_db_connection(conn)
+
+        with self._dataset_version_lock:
+            self._dataset_version_value = version
+            self._dataset_version_expires = now + DATASET_VERSION_TTL
+
+        return version
+
+    def _invalidate_dataset_version(self):
+        """
+            Buộc lần gọi _dataset_version() tiếp theo truy vấn lại database
+
+            Chỉ cần gọi sau khi ghi vào bảng nguồn của các truy vấn được cache (tech_trends).
+            Các hàm _save_*_to_db chỉ ghi bảng kết quả, không truy vấn nào đọc lại qua cache,
+            nên không cần làm mất hiệu lực cache
+        """
+        with self._dataset_version_lock:
+            self._dataset_version_expires = 0
+
+    def _read_sql(self, query, conn, params=None, chunksize=None):
+        """
+            Đọc kết quả truy vấn vào DataFrame với dtype backend đã cấu hình
+
+            Args:
+                query (str): Câu lệnh SQL
+                conn: Kết nối PostgreSQL
+                params (tuple | dict, optional): Tham số của câu lệnh
+                chunksize (int, optional): Nếu có, đọc qua server-side cursor theo từng khối
+                    thay vì tải toàn bộ kết quả về client một lần (chỉ dùng với SELECT)
+
+            Returns:
+                pandas.DataFrame: Kết quả truy vấn
+        """
+        if chunksize:
+            return self._read_sql_chunked(query, conn, params, chunksize)
+
+        if self.dtype_backend:
+            # Cột kiểu Arrow là buffer liên tục, không phải object Python cho từng ô
+            return pd.read_sql_query(query, conn, params=params, dtype_backend=self.dtype_backend)
+        return pd.read_sql_query(query, conn, params=params)
+
+    def _read_sql_chunked(self, query, conn, params, chunksize):
+        """
+            Đọc kết quả truy vấn qua named cursor, mỗi khối chuyển thành DataFrame riêng
+
+            Args:
+                query (str): Câu lệnh SELECT
+                conn: Kết nối PostgreSQL
+                params (tuple | dict, optional): Tham số của câu lệnh
+                chunksize (int): Số dòng mỗi lần FETCH
+
+            Returns:
+                pandas.DataFrame: Kết quả truy vấn
+        """
+        chunks = []
+        columns = None
+        # Kết quả nằm lại trên server, client chỉ giữ một khối tuple tại một thời điểm
+        with conn.cursor(name="read_sql_cur") as cur:
+            cur.itersize = chunksize
+            cur.execute(query, params)
+            while True:
+                rows = cur.fetchmany(chunksize)
+                if columns is None:
+                    columns = [desc[0] for desc in cur.description]
+                if not rows:
+                    break
+                chunks.append(pd.DataFrame.from_records(rows, columns=columns))
+
+        if not chunks:
+            df = pd.DataFrame(columns=columns)
+        else:
+            df = pd.concat(chunks, ignore_index=True, copy=False)
+
+        if self.dtype_backend:
+            return df.convert_dtypes(dtype_backend=self.dtype_backend)
+        return df
+
+    def _vacuum_table(self, conn, table):
+        """
+            Chạy VACUUM (ANALYZE) cho bảng sau khi làm mới dữ liệu (VACUUM không chạy được trong transaction)
+
+            Args:
+                conn: Kết nối PostgreSQL không có transaction đang mở
+                table (str): Tên đầy đủ của bảng
+        """
+        autocommit = conn.autocommit
+        try:
+            conn.autocommit = True
+            with conn.cursor() as cur:
+                cur.execute(f"VACUUM (ANALYZE) {table}")
+        except Exception as e:
+            # Không ảnh hưởng dữ liệu đã commit, autovacuum sẽ dọn sau
+            logger.warning(f"Không thể VACUUM bảng {table}: {str(e)}")
+        finally:
+            conn.autocommit = autocommit
 
     def analyze_weekly_tech_trends(self):
         """
@@ -105,52 +358,47 @@ class TrendAnalyzer:
             conn = self.get_db_connection()
             cur = conn.cursor()
 
-            # Tạo temporary table để lưu trữ kết quả phân tích
-            cur.execute("""
-                CREATE TEMP TABLE IF NOT EXISTS temp_tech_trends AS (
-                    SELECT
-                        unnest(pa.tech_mentioned) as tech_name,
-                        DATE_TRUNC('week', p.created_date) as week_start,
-                        p.subreddit_id,
-                        COUNT(*) as mention_count,
-                        AVG(pa.sentiment_score) as sentiment_avg
-                    FROM
-                        reddit_data.post_analysis pa
-                        JOIN reddit_data.posts p ON pa.post_id = p.post_id
-                    WHERE
-                        pa.tech_mentioned IS NOT NULL
-                    GROUP BY
-                        tech_name, week_start, p.subreddit_id
-                );
-            """)
+            # Tăng work_mem trong transaction này để GROUP BY chạy hoàn toàn trong RAM
+            cur.execute("SET LOCAL work_mem = '256MB'")
 
-            cur.execute("TRUNCATE TABLE reddit_data.tech_trends RESTART IDENTITY")
+            # Làm mới bằng DELETE + INSERT trong một transaction thay vì TRUNCATE: các truy vấn đọc
+            # tech_trends vẫn thấy dữ liệu cũ (MVCC) cho đến khi commit, quyền và các đối tượng phụ thuộc
+            # của bảng được giữ nguyên. SHARE ROW EXCLUSIVE không chặn đọc nhưng bắt các lệnh ghi khác
+            # (ví dụ UPDATE sentiment_avg của SentimentAnalyzer) chờ đến khi xong, để chúng áp dụng lên
+            # dữ liệu mới thay vì bị ghi đè
+            cur.execute("LOCK TABLE reddit_data.tech_trends IN SHARE ROW EXCLUSIVE MODE")
+            cur.execute("DELETE FROM reddit_data.tech_trends")
 
-            # Chèn dữ liệu mới từ temporary table
             cur.execute("""
-                        INSERT INTO reddit_data.tech_trends (
-                            tech_name, week_start, subreddit_id, mention_count, sentiment_avg
-                        )
-                        SELECT
-                            tech_name,
-                            week_start,
-                            subreddit_id,
-                            mention_count,
-                            sentiment_avg
-                        FROM
-                            temp_tech_trends
-                        ORDER BY
-                            week_start, tech_name, mention_count DESC
-                    """)
-
-            cur.execute("SELECT COUNT(*) FROM reddit_data.tech_trends")
-            trend_count = cur.fetchone()[0]
-
-            cur.execute("DROP TABLE IF EXISTS temp_tech_trends")
+                INSERT INTO reddit_data.tech_trends (
+                    tech_name, week_start, subreddit_id, mention_count, sentiment_avg
+                )
+                SELECT
+                    unnest(pa.tech_mentioned) as tech_name,
+                    DATE_TRUNC('week', p.created_date) as week_start,
+                    p.subreddit_id,
+                    COUNT(*) as mention_count,
+                    AVG(pa.sentiment_score) as sentiment_avg
+                FROM
+                    reddit_data.post_analysis pa
+                    JOIN reddit_data.posts p ON pa.post_id = p.post_id
+                WHERE
+                    pa.tech_mentioned IS NOT NULL
+                GROUP BY
+                    tech_name, week_start, p.subreddit_id
+                ORDER BY
+                    week_start, tech_name, mention_count DESC
+            """)
+            trend_count = cur.rowcount
 
             conn.commit()
+            # tech_trends vừa được làm mới: các kết quả cache dựa trên bảng này không còn đúng
+            self._invalidate_dataset_version()
             logger.info(f"Đã phân tích và cập nhật {trend_count} xu hướng công nghệ theo tuần")
 
+            # DELETE để lại toàn bộ dữ liệu cũ dưới dạng dead tuple: dọn ngay thay vì chờ autovacuum
+            self._vacuum_table(conn, 'reddit_data.tech_trends')
+
             return trend_count
         except Exception as e:
             logger.error(f"Lỗi khi phân tích xu hướng công nghệ theo tuần: {str(e)}")
@@ -178,61 +426,26 @@ class TrendAnalyzer:
         try:
             conn = self.get_db_connection()
 
-            cache_key = f"tech_growth_{period_weeks}"
+            version = self._dataset_version()
+            cache_key = f"tech_growth_{period_weeks}_{version}"
 
-            with self.cache_lock:
-                if cache_key in self.cache and self.cache[cache_key]['timestamp'] > datetime.now() - timedelta(hours=6):
-                    logger.info(f"Sử dụng kết quả phân tích tăng trưởng từ cache (period_weeks={period_weeks})")
-                    return self.cache[cache_key]['data']
+            cached = self.cache.get(cache_key, ttl=timedelta(hours=6))
+            if cached is not None:
+                logger.info(f"Sử dụng kết quả phân tích tăng trưởng từ cache (period_weeks={period_weeks})")
+                return cached
 
-            query = f"""
-                WITH current_period AS (
-                    SELECT
-                        tech_name,
-                        SUM(mention_count) as current_mentions
-                    FROM
-                        reddit_data.tech_trends
-                    WHERE
-                        week_start >= (SELECT MAX(week_start) FROM reddit_data.tech_trends) - INTERVAL '{period_weeks} weeks'
-                    GROUP BY
-                        tech_name
-                ),
-                previous_period AS (
-                    SELECT
-                        tech_name,
-                        SUM(mention_count) as previous_mentions
-                    FROM
-                        reddit_data.tech_trends
-                    WHERE
-                        week_start >= (SELECT MAX(week_start) FROM reddit_data.tech_trends) - INTERVAL '{period_weeks * 2} weeks'
-                        AND week_start < (SELECT MAX(week_start) FROM reddit_data.tech_trends) - INTERVAL '{period_weeks} weeks'
-                    GROUP BY
-                        tech_name
-                )
-                SELECT
-                    cp.tech_name,
-                    cp.current_mentions,
-                    COALESCE(pp.previous_mentions, 0) as previous_mentions,
-                    CASE
-                        WHEN COALESCE(pp.previous_mentions, 0) = 0 THEN NULL
-                        ELSE (cp.current_mentions - pp.previous_mentions)::FLOAT / pp.previous_mentions * 100
-                    END as growth_percent
-                FROM
-                    current_period cp
-                    LEFT JOIN previous_period pp ON cp.tech_name = pp.tech_name
-                WHERE
-                    cp.current_mentions >= 5  -- Chỉ xem xét các công nghệ có ít nhất 5 lần đề cập
-                ORDER BY
-                    growth_percent DESC NULLS LAST
-            """
+            # Câu lệnh được PREPARE một lần cho mỗi kết nối, các lần sau chỉ bind tham số
+            prepare_statement(conn, self._prepared_statements, "tech_growth_q", "(int)", TECH_GROWTH_SQL)
+            df = self._read_sql("EXECUTE tech_growth_q(%(weeks)s)", conn, params={'weeks': period_weeks})
 
-            df = pd.read_sql_query(query, conn)
+            # Tính phần trăm tăng trưởng bằng numpy, NaN khi kỳ trước không có đề cập
+            current = df['current_mentions'].to_numpy(dtype=np.float64)
+            previous = df['previous_mentions'].to_numpy(dtype=np.float64)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                df['growth_percent'] = np.where(previous > 0, (current - previous) / previous * 100, np.nan)
+            df = df.sort_values('growth_percent', ascending=False, na_position='last').reset_index(drop=True)
 
-            with self.cache_lock:
-                self.cache[cache_key] = {
-                    'data': df.copy(),
-                    'timestamp': datetime.now()
-                }
+            self.cache.set(cache_key, df)
 
             logger.info(f"Đã phân tích tăng trưởng cho {len(df)} công nghệ")
             return df
@@ -257,13 +470,14 @@ class TrendAnalyzer:
         """
         conn = None
         try:
-            cache_key = f"emerging_tech_{min_mentions}_{growth_threshold}"
+            version = self._dataset_version()
+            cache_key = f"emerging_tech_{min_mentions}_{growth_threshold}_{version}"
 
             # Kiểm tra trong cache
-            with self.cache_lock:
-                if cache_key in self.cache and self.cache[cache_key]['timestamp'] > datetime.now() - timedelta(hours=6):
-                    logger.info(f"Sử dụng kết quả phân tích công nghệ mới nổi từ cache")
-                    return self.cache[cache_key]['data']
+            cached = self.cache.get(cache_key, ttl=timedelta(hours=6))
+            if cached is not None:
+                logger.info(f"Sử dụng kết quả phân tích công nghệ mới nổi từ cache")
+                return cached
 
             # Phân tích tăng trưởng
             growth_df = self.analyze_tech_growth()
@@ -275,41 +489,34 @@ class TrendAnalyzer:
             # Lọc các công nghệ mới nổi
             emerging_df = growth_df[
                 (growth_df['current_mentions'] >= min_mentions) &
-                (growth_df['growth_percent'] >= growth_threshold)
+                (growth_df['growth_percent'] >= growth_threshold).fillna(False)
                 ].copy()
 
             # Lấy thông tin về tình cảm (sentiment)
             if not emerging_df.empty:
                 conn = self.get_db_connection()
 
-                # Danh sách các công nghệ mới nổi
-                tech_list = "', '".join(emerging_df['tech_name'].tolist())
-
-                # Truy vấn điểm tình cảm trung bình
-                query = f"""
+                # Truy vấn điểm tình cảm trung bình (danh sách công nghệ truyền vào dưới dạng một tham số mảng)
+                query = """
                     SELECT
                         tech_name,
                         AVG(sentiment_avg) as avg_sentiment
                     FROM
                         reddit_data.tech_trends
                     WHERE
-                        tech_name IN ('{tech_list}')
+                        tech_name = ANY(%s)
                     GROUP BY
                         tech_name
                 """
 
-                sentiment_df = pd.read_sql_query(query, conn)
+                sentiment_df = self._read_sql(query, conn, params=(emerging_df['tech_name'].tolist(),))
                 emerging_df = pd.merge(emerging_df, sentiment_df, on='tech_name', how='left')
 
                 # Lưu vào database
                 self._save_emerging_tech_to_db(emerging_df, conn)
 
             # Lưu vào cache
-            with self.cache_lock:
-                self.cache[cache_key] = {
-                    'data': emerging_df.copy(),
-                    'timestamp': datetime.now()
-                }
+            self.cache.set(cache_key, emerging_df)
 
             logger.info(f"Đã xác định {len(emerging_df)} công nghệ mới nổi")
             return emerging_df
@@ -335,25 +542,29 @@ class TrendAnalyzer:
 
         try:
             current_date = datetime.now().date()
-            records = []
-
-            for _, row in emerging_df.iterrows():
-                records.append((
-                    row['tech_name'],
-                    current_date,
-                    current_date - timedelta(days=30),  # period_start là 30 ngày trước
-                    int(row['current_mentions']),
-                    float(row.get('avg_sentiment', 0)),
-                    float(row['growth_percent']),
-                    None  # correlation_score, sẽ cập nhật sau nếu cần
-                ))
+            period_start = current_date - timedelta(days=30)  # period_start là 30 ngày trước
+
+            # Lấy cả cột một lần (tolist trả về kiểu Python mà psycopg2 có thể adapt)
+            tech_names = emerging_df['tech_name'].tolist()
+            mentions = emerging_df['current_mentions'].astype(np.int64).tolist()
+            if 'avg_sentiment' in emerging_df:
+                sentiments = emerging_df['avg_sentiment'].astype(np.float64).tolist()
+            else:
+                sentiments = [0.0] * len(emerging_df)
+            growths = emerging_df['growth_percent'].astype(np.float64).tolist()
+
+            # correlation_score để None, sẽ cập nhật sau nếu cần
+            records = [
+                (tech_name, current_date, period_start, mention_count, sentiment, growth, None)
+                for tech_name, mention_count, sentiment, growth in zip(tech_names, mentions, sentiments, growths)
+            ]
 
             # Insert vào bảng sentiment_popularity_correlation
             cursor = conn.cursor()
-            psycopg2.extras.execute_batch(cursor, """
+            psycopg2.extras.execute_values(cursor, """
                 INSERT INTO reddit_data.sentiment_popularity_correlation
                 (tech_name, period_end, period_start, mention_count, sentiment_avg, upvote_avg, correlation_score)
-                VALUES (%s, %s, %s, %s, %s, %s, %s)
+                VALUES %s
                 ON CONFLICT (tech_name, period_end) 
                 DO UPDATE SET
                     period_start = EXCLUDED.period_start,
@@ -362,7 +573,7 @@ class TrendAnalyzer:
                     upvote_avg = EXCLUDED.upvote_avg,
                     correlation_score = EXCLUDED.correlation_score,
                     processed_date = CURRENT_TIMESTAMP
-            """, records)
+            """, records, page_size=1000)
 
             conn.commit()
             logger.info(f"Đã lưu {len(records)} công nghệ mới nổi vào database")
@@ -384,27 +595,21 @@ class TrendAnalyzer:
         conn = None
         try:
             # Cache key cho kết quả phân tích
-            cache_key = f"tech_correlation_{min_mentions}"
+            version = self._dataset_version()
+            cache_key = f"tech_correlation_{min_mentions}_{version}"
 
             # Kiểm tra trong cache
-            with self.cache_lock:
-                if cache_key in self.cache and self.cache[cache_key]['timestamp'] > datetime.now() - timedelta(
-                        hours=12):
-                    logger.info(f"Sử dụng kết quả phân tích tương quan từ cache")
-                    return self.cache[cache_key]['data']
+            cached = self.cache.get(cache_key, ttl=timedelta(hours=12))
+            if cached is not None:
+                logger.info(f"Sử dụng kết quả phân tích tương quan từ cache")
+                return cached
 
             conn = self.get_db_connection()
 
             # Danh sách cách công nghệ thường được đề cập
-            query_popular = f"""
-                SELECT tech_name, SUM(mention_count) as total_mentions
-                FROM reddit_data.tech_trends
-                GROUP BY tech_name
-                HAVING SUM(mention_count) >= {min_mentions}
-                ORDER BY total_mentions DESC
-            """
-
-            popular_techs = pd.read_sql_query(query_popular, conn)
+            prepare_statement(conn, self._prepared_statements, "popular_techs_q", "(int)", POPULAR_TECHS_SQL)
+            popular_techs = self._read_sql("EXECUTE popular_techs_q(%(min_mentions)s)", conn,
+                                           params={'min_mentions': min_mentions})
 
             if popular_techs.empty:
                 logger.warning("Không có đủ dữ liệu để phân tích tương quan")
@@ -412,66 +617,57 @@ class TrendAnalyzer:
 
             tech_list = popular_techs['tech_name'].tolist()
 
-            # DF lưu trữ ma trận đồng xuất hiện
-            correlation_matrix = pd.DataFrame(0, index=tech_list, columns=tech_list)
-            query_posts = """
-                SELECT post_id, tech_mentioned
-                FROM reddit_data.post_analysis
-                WHERE tech_mentioned IS NOT NULL
+            # Đếm số lần đồng xuất hiện của từng cặp công nghệ ngay trong PostgreSQL
+            # thay vì tải toàn bộ post_analysis về client. Công nghệ được đổi sang chỉ số
+            # (vị trí trong tech_list) ở phía server để client ghi thẳng vào ma trận
+            query_pairs = """
+                WITH exploded AS (
+                    SELECT DISTINCT pa.post_id, array_position(%(techs)s::text[], t.tech_name) - 1 AS tech_idx
+                    FROM reddit_data.post_analysis pa
+                    CROSS JOIN LATERAL unnest(pa.tech_mentioned) AS t(tech_name)
+                    WHERE pa.tech_mentioned && %(techs)s::text[]
+                    AND t.tech_name = ANY(%(techs)s)
+                )
+                SELECT a.tech_idx AS idx_1, b.tech_idx AS idx_2, COUNT(*) AS co_count
+                FROM exploded a
+                JOIN exploded b ON a.post_id = b.post_id AND a.tech_idx < b.tech_idx
+                GROUP BY a.tech_idx, b.tech_idx
             """
 
-            posts_df = pd.read_sql_query(query_posts, conn)
-            # Đếm số lần đồng xuất hiện
-            for _, row in posts_df.iterrows():
-                techs = row['tech_mentioned']
-                if techs and isinstance(techs, list):
-                    # Lọc các công nghệ trong danh sách phổ biến
-                    techs_in_list = [tech for tech in techs if tech in tech_list]
-
-                    # Cập nhật ma trận
-                    for i in range(len(techs_in_list)):
-                        for j in range(i, len(techs_in_list)):
-                            tech_i = techs_in_list[i]
-                            tech_j = techs_in_list[j]
-                            correlation_matrix.loc[tech_i, tech_j] += 1
-                            if i != j:  # Không phải đường chéo
-                                correlation_matrix.loc[tech_j, tech_i] += 1
-
-            # Tính toán hệ số Jaccard để chuẩn hóa
-            for i in range(len(tech_list)):
-                for j in range(i + 1, len(tech_list)):
-                    tech_i = tech_list[i]
-                    tech_j = tech_list[j]
-
-                    # Hệ số Jaccard: |A∩B| / |A∪B|
-                    intersection = correlation_matrix.loc[tech_i, tech_j]
-                    union = (
-                            popular_techs.loc[popular_techs['tech_name'] == tech_i, 'total_mentions'].iloc[0] +
-                            popular_techs.loc[popular_techs['tech_name'] == tech_j, 'total_mentions'].iloc[0] -
-                            intersection
-                    )
-
-                    if union > 0:
-                        jaccard = intersection / union
-                    else:
-                        jaccard = 0
-
-                    correlation_matrix.loc[tech_i, tech_j] = jaccard
-                    correlation_matrix.loc[tech_j, tech_i] = jaccard
+            # Ma trận đồng xuất hiện đối xứng, điền dần từ server-side cursor theo từng khối
+            # thay vì dựng DataFrame cho toàn bộ kết quả
+            co_occurrence = np.zeros((len(tech_list), len(tech_list)), dtype=np.int32)
+            with conn.cursor(name="tech_pairs_cur") as pairs_cur:
+                pairs_cur.itersize = PAIRS_FETCH_SIZE
+                pairs_cur.execute(query_pairs, {'techs': tech_list})
+                while True:
+                    rows = pairs_cur.fetchmany(PAIRS_FETCH_SIZE)
+                    if not rows:
+                        break
+
+                    block = np.array(rows, dtype=np.int64)
+                    idx_1, idx_2, counts = block[:, 0], block[:, 1], block[:, 2]
+                    co_occurrence[idx_1, idx_2] = counts
+                    co_occurrence[idx_2, idx_1] = counts
+
+            # Tính toán hệ số Jaccard để chuẩn hóa: |A∩B| / |A∪B|
+            # Mẫu số được broadcast trực tiếp ở float32 (đủ độ chính xác cho hệ số Jaccard),
+            # tránh tạo thêm ma trận float64 trung gian rồi ép kiểu lại
+            total_mentions = popular_techs['total_mentions'].to_numpy(dtype=np.float32)
+            union = total_mentions[:, None] + total_mentions[None, :]
+            union -= co_occurrence
+            jaccard = np.divide(co_occurrence, union, out=np.zeros_like(union), where=union > 0)
 
             # Đặt 1.0 cho đường chéo
-            for tech in tech_list:
-                correlation_matrix.loc[tech, tech] = 1.0
+            np.fill_diagonal(jaccard, 1.0)
+
+            correlation_matrix = pd.DataFrame(jaccard, index=tech_list, columns=tech_list)
 
             # Lưu kết quả vào database
             self._save_tech_correlation_to_db(correlation_matrix, conn)
 
             # Lưu vào cache
-            with self.cache_lock:
-                self.cache[cache_key] = {
-                    'data': correlation_matrix.copy(),
-                    'timestamp': datetime.now()
-                }
+            self.cache.set(cache_key, correlation_matrix)
 
             logger.info(f"Đã phân tích tương quan giữa {len(tech_list)} công nghệ")
             return correlation_matrix
@@ -503,33 +699,30 @@ class TrendAnalyzer:
             # Xóa dữ liệu cũ
             cursor.execute("DELETE FROM reddit_data.tech_correlation")
 
-            # Chuẩn bị dữ liệu để insert
-            tech_list = correlation_matrix.index.tolist()
-            records = []
+            # Chuẩn bị dữ liệu để insert: lấy tam giác trên của ma trận (i < j) bằng numpy
+            tech_names = correlation_matrix.index.to_numpy()
+            scores = correlation_matrix.to_numpy()
             correlation_threshold = 0.05  # Ngưỡng mới
 
-            for i in range(len(tech_list)):
-                for j in range(i + 1, len(tech_list)):
-                    tech_i = tech_list[i]
-                    tech_j = tech_list[j]
-                    correlation_score = correlation_matrix.loc[tech_i, tech_j]
-
-                    # Chỉ lưu những cặp có tương quan đáng kể
-                    if correlation_score > correlation_threshold:
-                        records.append((
-                            tech_i,
-                            tech_j,
-                            correlation_score,
-                            analyzed_date
-                        ))
-
-            # Bulk insert
+            idx_i, idx_j = np.triu_indices(len(tech_names), k=1)
+            pair_scores = scores[idx_i, idx_j]
+
+            # Chỉ lưu những cặp có tương quan đáng kể
+            mask = pair_scores > correlation_threshold
+            records = list(zip(
+                tech_names[idx_i[mask]].tolist(),
+                tech_names[idx_j[mask]].tolist(),
+                pair_scores[mask].astype(np.float64).tolist(),
+                repeat(analyzed_date)
+            ))
+
+            # Bulk insert (một câu lệnh nhiều VALUES cho mỗi trang)
             if records:
-                psycopg2.extras.execute_batch(cursor, """
+                psycopg2.extras.execute_values(cursor, """
                     INSERT INTO reddit_data.tech_correlation
                     (tech_name_1, tech_name_2, correlation_score, analyzed_date)
-                    VALUES (%s, %s, %s, %s)
-                """, records)
+                    VALUES %s
+                """, records, page_size=2000)
 
             conn.commit()
             logger.info(f"Đã lưu {len(records)} cặp tương quan công nghệ vào database")
@@ -547,15 +740,18 @@ class TrendAnalyzer:
         """
         conn = None
         try:
-            cache_key = "skill_demand_trends"
+            version = self._dataset_version()
+            cache_key = f"skill_demand_trends_{version}"
 
-            with self.cache_lock:
-                if cache_key in self.cache and self.cache[cache_key]['timestamp'] > datetime.now() - timedelta(hours=24):
-                    logger.info("Sử dụng kết quả phân tích nhu cầu kỹ năng từ cache")
-                    return self.cache[cache_key]['data']
+            cached = self.cache.get(cache_key, ttl=timedelta(hours=24))
+            if cached is not None:
+                logger.info("Sử dụng kết quả phân tích nhu cầu kỹ năng từ cache")
+                return cached
 
             conn = self.get_db_connection()
 
+            # Lọc bài viết tuyển dụng qua cột full-text title_tsv (có GIN index),
+            # tiền tố ":*" giữ hành vi khớp "jobs", "positions"... như LIKE trước đây
             query = """
                 SELECT
                     DATE_TRUNC('month', p.created_date) as month,
@@ -567,30 +763,22 @@ class TrendAnalyzer:
                 WHERE
                     pa.skills_mentioned IS NOT NULL
                     AND p.created_date IS NOT NULL
-                    AND (LOWER(p.title) LIKE '%hiring%' 
-                        OR LOWER(p.title) LIKE '%job%'
-                        OR LOWER(p.title) LIKE '%career%'
-                        OR LOWER(p.title) LIKE '%looking for%'
-                        OR LOWER(p.title) LIKE '%position%')
+                    AND p.title_tsv @@ to_tsquery('simple', 'hiring:* | job:* | career:* | position:* | looking <-> for')
                 GROUP BY
                     month, skill
                 ORDER BY
                     month, mention_count DESC
             """
 
-            df = pd.read_sql_query(query, conn)
+            df = self._read_sql(query, conn, chunksize=READ_CHUNK_SIZE)
             if df.empty:
                 logger.warning("Không có dữ liệu về nhu cầu kỹ năng")
                 return pd.DataFrame()
 
-            with self.cache_lock:
-                self.cache[cache_key] = {
-                    'data': df.copy(),
-                    'timestamp': datetime.now()
-                }
+            self.cache.set(cache_key, df)
 
-                logger.info(f"Đã phân tích xu hướng nhu cầu kỹ năng qua {df['month'].nunique()} tháng")
-                return df
+            logger.info(f"Đã phân tích xu hướng nhu cầu kỹ năng qua {df['month'].nunique()} tháng")
+            return df
 
         except Exception as e:
             logger.error(f"Lỗi khi phân tích xu hướng nhu cầu kỹ năng: {str(e)}")
@@ -613,11 +801,12 @@ class TrendAnalyzer:
         conn = None
         cur = None
         try:
-            cache_key = f"subreddit_trends_{min_mentions}"
-            with self.cache_lock:
-                if cache_key in self.cache and self.cache[cache_key]['timestamp'] > datetime.now() - timedelta(hours=12):
-                    logger.info("Sử dụng kết quả phân tích xu hướng subreddit từ cache")
-                    return self.cache[cache_key]['data']
+            version = self._dataset_version()
+            cache_key = f"subreddit_trends_{min_mentions}_{version}"
+            cached = self.cache.get(cache_key, ttl=timedelta(hours=12))
+            if cached is not None:
+                logger.info("Sử dụng kết quả phân tích xu hướng subreddit từ cache")
+                return cached
 
             conn = self.get_db_connection()
             cur = conn.cursor()
@@ -684,14 +873,10 @@ class TrendAnalyzer:
                 ORDER BY
                     subreddit_name, month_start, mention_count DESC
             """
-            df = pd.read_sql_query(query_result, conn)
+            df = self._read_sql(query_result, conn, chunksize=READ_CHUNK_SIZE)
 
             # Lưu vào cache
-            with self.cache_lock:
-                self.cache[cache_key] = {
-                    'data': df.copy(),
-                    'timestamp': datetime.now()
-                }
+            self.cache.set(cache_key, df)
 
             return df
 
@@ -720,18 +905,21 @@ class TrendAnalyzer:
         conn = None
         try:
             # Cache key cho kết quả phân tích
-            cache_key = f"sentiment_popularity_{min_mentions}"
+            version = self._dataset_version()
+            cache_key = f"sentiment_popularity_{min_mentions}_{version}"
 
             # Kiểm tra trong cache
-            with self.cache_lock:
-                if cache_key in self.cache and self.cache[cache_key]['timestamp'] > datetime.now() - timedelta(
-                        hours=12):
-                    logger.info("Sử dụng kết quả phân tích tương quan sentiment-popularity từ cache")
-                    return self.cache[cache_key]['data']
+            cached = self.cache.get(cache_key, ttl=timedelta(hours=12))
+            if cached is not None:
+                logger.info("Sử dụng kết quả phân tích tương quan sentiment-popularity từ cache")
+                return cached
 
             # Lấy kết nối từ pool
             conn = self.get_db_connection()
-            query = f"""
+
+            # Hệ số tương quan Pearson tính ngay trong PostgreSQL bằng aggregate corr(),
+            # chỉ trả về một dòng cho mỗi công nghệ thay vì toàn bộ số liệu theo tháng
+            query = """
                 WITH tech_stats AS (
                     SELECT
                         unnest(pa.tech_mentioned) as tech_name,
@@ -745,62 +933,63 @@ class TrendAnalyzer:
                     WHERE
                         pa.tech_mentioned IS NOT NULL
                         AND pa.sentiment_score IS NOT NULL
+                ),
+                monthly AS (
+                    SELECT
+                        tech_name,
+                        month,
+                        AVG(sentiment_score)::FLOAT as avg_sentiment,
+                        AVG(post_score)::FLOAT as avg_score,
+                        AVG(num_comments)::FLOAT as avg_comments,
+                        COUNT(*) as mention_count
+                    FROM
+                        tech_stats
+                    GROUP BY
+                        tech_name, month
+                    HAVING
+                        COUNT(*) >= %(min_mentions)s
+                ),
+                correlations AS (
+                    SELECT
+                        tech_name,
+                        corr(avg_sentiment, avg_score) as sentiment_score_corr,
+                        corr(avg_sentiment, avg_comments) as sentiment_comments_corr,
+                        SUM(mention_count)::BIGINT as mention_count,
+                        AVG(avg_sentiment) as avg_sentiment,
+                        AVG(avg_score) as avg_score,
+                        AVG(avg_comments) as avg_comments
+                    FROM
+                        monthly
+                    GROUP BY
+                        tech_name
+                    HAVING
+                        COUNT(*) >= 2  -- Cần ít nhất 2 tháng dữ liệu để tính tương quan
                 )
                 SELECT
                     tech_name,
-                    month,
-                    AVG(sentiment_score) as avg_sentiment,
-                    AVG(post_score) as avg_score,
-                    AVG(num_comments) as avg_comments,
-                    COUNT(*) as mention_count
+                    sentiment_score_corr,
+                    sentiment_comments_corr,
+                    -- Trung bình các hệ số khác NULL (corr() trả về NULL khi giá trị không đổi)
+                    (COALESCE(sentiment_score_corr, 0) + COALESCE(sentiment_comments_corr, 0))
+                        / NULLIF((sentiment_score_corr IS NOT NULL)::INT + (sentiment_comments_corr IS NOT NULL)::INT, 0)
+                        as avg_correlation,
+                    mention_count,
+                    avg_sentiment,
+                    avg_score,
+                    avg_comments
                 FROM
-                    tech_stats
-                GROUP BY
-                    tech_name, month
-                HAVING
-                    COUNT(*) >= {min_mentions}
+                    correlations
                 ORDER BY
-                    tech_name, month
+                    tech_name
             """
 
-            df = pd.read_sql_query(query, conn)
+            result_df = self._read_sql(query, conn, params={'min_mentions': min_mentions})
 
-            if df.empty:
+            if result_df.empty:
                 logger.warning("Không đủ dữ liệu để phân tích tương quan sentiment-popularity")
                 return pd.DataFrame()
 
-            # Tính toán hệ số tương quan cho từng công nghệ
-            tech_corr = {}
-            for tech in df['tech_name'].unique():
-                tech_df = df[df['tech_name'] == tech].copy()
-                if len(tech_df) < 2:
-                    continue
-
-                # Tính hệ số tương quan Pearson
-                sentiment_score_corr = tech_df['avg_sentiment'].corr(tech_df['avg_score'])
-                sentiment_comments_corr = tech_df['avg_sentiment'].corr(tech_df['avg_comments'])
-
-                avg_corr = np.nanmean([sentiment_score_corr, sentiment_comments_corr])
-
-                tech_corr[tech] = {
-                    'sentiment_score_corr': sentiment_score_corr,
-                    'sentiment_comments_corr': sentiment_comments_corr,
-                    'avg_correlation': avg_corr,
-                    'mention_count': tech_df['mention_count'].sum(),
-                    'avg_sentiment': tech_df['avg_sentiment'].mean(),
-                    'avg_score': tech_df['avg_score'].mean(),
-                    'avg_comments': tech_df['avg_comments'].mean()
-                }
-
-            result_df = pd.DataFrame.from_dict(tech_corr, orient='index')
-            result_df.reset_index(inplace=True)
-            result_df.rename(columns={'index': 'tech_name'}, inplace=True)
-
-            with self.cache_lock:
-                self.cache[cache_key] = {
-                    'data': result_df.copy(),
-                    'timestamp': datetime.now()
-                }
+            self.cache.set(cache_key, result_df)
 
             logger.info(f"Đã phân tích tương quan sentiment-popularity cho {len(result_df)} công nghệ")
             return result_df
@@ -829,25 +1018,24 @@ class TrendAnalyzer:
             # Chuẩn bị dữ liệu để insert
             current_date = datetime.now().date()
             start_date = current_date - timedelta(days=90)  # 3 tháng trước
-            records = []
-
-            for _, row in result_df.iterrows():
-                records.append((
-                    row['tech_name'],
-                    start_date,
-                    current_date,
-                    int(row['mention_count']),
-                    float(row['avg_sentiment']),
-                    float(row['avg_score']),
-                    float(row['avg_comments']),
-                    float(row['avg_correlation'])
-                ))
-
-            # Insert vào bảng sentiment_popularity_correlation
-            psycopg2.extras.execute_batch(cursor, """
+            # Ép kiểu theo cả cột thay vì từng giá trị. NaN (ví dụ corr() NULL) được đổi thành None
+            # để PostgreSQL lưu NULL thay vì 'NaN'
+            float_columns = ['avg_sentiment', 'avg_score', 'avg_comments', 'avg_correlation']
+            float_df = result_df[float_columns].astype(np.float64)
+            float_df = float_df.astype(object).where(float_df.notna(), None)
+            records = list(zip(
+                result_df['tech_name'].tolist(),
+                repeat(start_date),
+                repeat(current_date),
+                result_df['mention_count'].to_numpy(dtype=np.int64).tolist(),
+                *(float_df[column].tolist() for column in float_columns)
+            ))
+
+            # Insert vào bảng sentiment_popularity_correlation (một câu lệnh nhiều VALUES cho mỗi trang)
+            psycopg2.extras.execute_values(cursor, """
                     INSERT INTO reddit_data.sentiment_popularity_correlation
                     (tech_name, period_start, period_end, mention_count, sentiment_avg, upvote_avg, comment_count_avg, correlation_score)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+                    VALUES %s
                     ON CONFLICT (tech_name, period_end) 
                     DO UPDATE SET
                         period_start = EXCLUDED.period_start,
@@ -857,7 +1045,7 @@ class TrendAnalyzer:
                         comment_count_avg = EXCLUDED.comment_count_avg,
                         correlation_score = EXCLUDED.correlation_score,
                         processed_date = CURRENT_TIMESTAMP
-                """, records)
+                """, records, page_size=1000)
 
             conn.commit()
             logger.info(f"Đã lưu {len(records)} kết quả tương quan sentiment-popularity vào database")
@@ -886,15 +1074,18 @@ class TrendAnalyzer:
                 logger.warning(f"Đơn vị thời gian không hợp lệ: {time_unit}. Sử dụng 'week' thay thế.")
                 time_unit = 'week'
 
-            cache_key = f"tech_trends_{time_unit}_{min_mentions}"
+            version = self._dataset_version()
+            cache_key = f"tech_trends_{time_unit}_{min_mentions}_{version}"
             # Kiểm tra trong cache
-            with self.cache_lock:
-                if cache_key in self.cache and self.cache[cache_key]['timestamp'] > datetime.now() - timedelta(hours=12):
-                    logger.info(f"Sử dụng kết quả phân tích xu hướng theo {time_unit} từ cache")
-                    return self.cache[cache_key]['data']
+            cached = self.cache.get(cache_key, ttl=timedelta(hours=12))
+            if cached is not None:
+                logger.info(f"Sử dụng kết quả phân tích xu hướng theo {time_unit} từ cache")
+                return cached
 
             conn = self.get_db_connection()
 
+            # time_unit đã được kiểm tra theo valid_units và phải là hằng số trong DATE_TRUNC
+            # (khớp với expression index trên posts), các giá trị còn lại truyền dưới dạng tham số
             query = f"""
                 SELECT
                     unnest(pa.tech_mentioned) as tech_name,
@@ -909,20 +1100,17 @@ class TrendAnalyzer:
                 GROUP BY
                     tech_name, time_period
                 HAVING
-                    COUNT(*) >= {min_mentions}
+                    COUNT(*) >= %(min_mentions)s
                 ORDER BY
                     time_period, mention_count DESC
             """
-            df = pd.read_sql_query(query, conn)
+            df = self._read_sql(query, conn, params={'min_mentions': min_mentions},
+                                chunksize=READ_CHUNK_SIZE)
             if df.empty:
                 logger.warning(f"Không có dữ liệu xu hướng theo {time_unit}")
                 return pd.DataFrame()
 
-            with self.cache_lock:
-                self.cache[cache_key] = {
-                    'data': df.copy(),
-                    'timestamp': datetime.now()
-                }
+            self.cache.set(cache_key, df)
 
             logger.info(f"Đã phân tích xu hướng theo {time_unit} cho {df['tech_name'].nunique()} công nghệ")
             return df
@@ -934,13 +1122,15 @@ class TrendAnalyzer:
             if conn:
                 self.return_db_connection(conn)
 
-    def run_all_analyses(self, parallel=True, max_workers=4):
+    def run_all_analyses(self, parallel=True, max_workers=4, use_processes=False):
         """
         Chạy tất cả các phân tích và lưu kết quả vào database
 
         Args:
             parallel (bool): Có chạy song song hay không
-            max_workers (int): Số lượng thread tối đa khi chạy song song
+            max_workers (int): Số lượng thread (hoặc process) tối đa khi chạy song song
+            use_processes (bool): Chạy song song bằng process thay vì thread, dành cho khi phần
+                xử lý pandas/numpy phía client chiếm phần lớn thời gian
 
         Returns:
             dict: Kết quả các phân tích đã chạy
@@ -948,9 +1138,9 @@ class TrendAnalyzer:
         start_time = time.time()
         results = {}
 
-        # Danh sách các phân tích cần chạy
+        # Danh sách các phân tích cần chạy (weekly_tech_trends ghi lại bảng tech_trends
+        # mà các phân tích khác đọc, nên luôn được chạy trước)
         analyses = [
-            ('weekly_tech_trends', self.analyze_weekly_tech_trends, {}),
             ('tech_growth', self.analyze_tech_growth, {}),
             ('emerging_tech', self.analyze_emerging_technologies, {}),
             ('tech_correlation', self.analyze_tech_correlation, {}),
@@ -961,7 +1151,32 @@ class TrendAnalyzer:
             ('tech_trends_monthly', self.analyze_tech_trends_by_time, {'time_unit': 'month'})
         ]
 
-        if parallel:
+        try:
+            results['weekly_tech_trends'] = self.analyze_weekly_tech_trends()
+            logger.info("Đã hoàn thành phân tích: weekly_tech_trends")
+        except Exception as e:
+            logger.error(f"Lỗi khi chạy phân tích weekly_tech_trends: {str(e)}")
+            results['weekly_tech_trends'] = None
+
+        if parallel and use_processes:
+            # Mỗi process có TrendAnalyzer và connection pool riêng, kết quả được pickle về process cha
+            logger.info(f"Chạy tất cả phân tích song song với {max_workers} processes")
+            with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                                     initargs=(self.dtype_backend, self.cache.cache_dir)) as executor:
+                futures = [
+                    executor.submit(_run_analysis_worker, name, func.__name__, kwargs)
+                    for name, func, kwargs in analyses
+                ]
+
+                for future in futures:
+                    try:
+                        name, result = future.result()
+                        results[name] = result
+                    except Exception as e:
+                        logger.error(f"Lỗi khi lấy kết quả phân tích: {str(e)}")
+        elif parallel:
+            # Không vượt quá số kết nối của pool, chừa lại một kết nối cho luồng chính
+            max_workers = max(1, min(max_workers, self.connection_pool.maxconn - 1))
             logger.info(f"Chạy tất cả phân tích song song với {max_workers} threads")
 
             def run_analysis(name, func, kwargs):
@@ -4,6 +4,8 @@ from datetime import datetime
 import praw
 from praw import models
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from kafka import KafkaProducer
 
 from src.utils.config import (
@@ -15,18 +17,36 @@ from src.utils.logger import setup_logger
 
 logger = setup_logger(__name__, "logs/reddit_collector.log")
 
+# Encoder dựng sẵn một lần, bỏ khoảng trắng thừa để tin nhắn Kafka gọn hơn
+_KAFKA_JSON_ENCODER = json.JSONEncoder(separators=(',', ':'))
+
+
+def _serialize_value(value):
+    """Chuyển dữ liệu thành bytes JSON để gửi tới Kafka"""
+    return _KAFKA_JSON_ENCODER.encode(value).encode('utf-8')
+
+
+def _serialize_key(key):
+    """Chuyển key thành bytes (None nếu không có key)"""
+    return key.encode('utf-8') if key else None
+
 class RedditCollector:
     """
         Class chịu trách nhiệm thu thập dữ liệu từ Reddit API và gửi tới Kafka
     """
 
-    def __init__(self, subreddits=None, post_limit=DEFAULT_POST_LIMIT):
+    def __init__(self, subreddits=None, post_limit=DEFAULT_POST_LIMIT, max_replace_more=32,
+                 replace_more_threshold=None):
         """
             Khởi tạo Reddit API client và Kafka producer
 
             Args:
                 subreddits (list): Danh sách các subreddit cần thu thập dữ liệu
                 post_limit (int): Số lượng bài viết tối đa cần thu thập cho mỗi subreddit
+                max_replace_more (int): Số MoreComments tối đa được tải thêm cho mỗi bài viết
+                    (mỗi lần tải là một request tới Reddit API), None để tải tất cả
+                replace_more_threshold (int, optional): Bỏ qua các nhánh MoreComments có ít hơn số bình luận này.
+                    Mặc định 5 khi có max_replace_more, 0 (không bỏ qua nhánh nào) khi max_replace_more là None
         """
         if subreddits is None:
             self.subreddits = ["dataengineering"]
@@ -34,19 +54,28 @@ class RedditCollector:
             self.subreddits = subreddits
 
         self.post_limit = post_limit
+        self.max_replace_more = max_replace_more
+        if replace_more_threshold is None:
+            replace_more_threshold = 0 if max_replace_more is None else 5
+        self.replace_more_threshold = replace_more_threshold
         self.total_posts_collected = 0
         self.total_comments_collected = 0
 
+        # Bộ đếm tổng và các shard JSONL được dùng chung khi thu thập song song nhiều subreddit
+        self._stats_lock = threading.Lock()
+        self._jsonl_lock = threading.Lock()
+
+        # Các shard JSONL đang mở, theo đường dẫn file (chỉ giữ shard của ngày hiện tại)
+        self._jsonl_files = {}
+        self._jsonl_day = None
+
+        # PRAW không thread-safe: mỗi thread dùng một Reddit API client riêng
+        self._local = threading.local()
+
         # Create Reddit API client
         logger.info("Khoi tao Reddit API client")
         try:
-            self.reddit = praw.Reddit(
-                client_id = REDDIT_CLIENT_ID,
-                client_secret = REDDIT_CLIENT_SECRET,
-                user_agent = REDDIT_USER_AGENT,
-                username = REDDIT_USERNAME,
-                password = REDDIT_PASSWORD
-            )
+            self._local.reddit = self._create_reddit_client()
             logger.info("Đã kết nối thành công với Reddit API")
         except Exception as e:
             logger.error(f"Lỗi khi kết nối vưới Reddit API: {str(e)}")
@@ -55,10 +84,15 @@ class RedditCollector:
         # Create Kafka producer
         logger.info(f"Khởi tạo Kafka producer, kết nối với {KAFKA_BOOTSTRAP_SERVERS}")
         try:
+            # Gom tin nhắn thành batch lớn (chờ tối đa linger_ms) và nén cả batch trước khi gửi
             self.producer = KafkaProducer(
                 bootstrap_servers = KAFKA_BOOTSTRAP_SERVERS,
-                value_serializer = lambda v: json.dumps(v).encode('utf-8'),
-                key_serializer = lambda k: k.encode('utf-8') if k else None
+                value_serializer = _serialize_value,
+                key_serializer = _serialize_key,
+                linger_ms = 50,
+                batch_size = 131072,
+                compression_type = 'gzip',
+                acks = 1
             )
             logger.info("Đã kết nối thành công với Kafka")
         except Exception as e:
@@ -66,6 +100,29 @@ class RedditCollector:
             raise
 
 
+    def _create_reddit_client(self):
+        """
+            Tạo Reddit API client mới
+
+            Returns:
+                praw.Reddit: Reddit API client
+        """
+        return praw.Reddit(
+            client_id = REDDIT_CLIENT_ID,
+            client_secret = REDDIT_CLIENT_SECRET,
+            user_agent = REDDIT_USER_AGENT,
+            username = REDDIT_USERNAME,
+            password = REDDIT_PASSWORD
+        )
+
+    @property
+    def reddit(self):
+        """Reddit API client của thread hiện tại (tạo mới ở lần dùng đầu tiên trong thread)"""
+        client = getattr(self._local, 'reddit', None)
+        if client is None:
+            client = self._local.reddit = self._create_reddit_client()
+        return client
+
     def collect_posts_with_pagination(self, subreddit_name, sort_by='hot', max_posts=None):
         """
             Thu thập bài viết từ một subreddit cụ thể sử dụng phương pháp phân trang để lấy nhiều hơn
@@ -84,6 +141,8 @@ class RedditCollector:
         subreddit = self.reddit.subreddit(subreddit_name)
 
         count = 0
+        comments_total = 0
+        reached_limit = False
         last_id = None
         batch_size = 100 # Số lượng bài viết lấy trong mỗi lần call API
 
@@ -93,44 +152,51 @@ class RedditCollector:
                 # Áp dụng phương thức sắp xếp và pagination
                 params = {"after": last_id} if last_id else {}
 
+                # Duyệt trực tiếp generator của PRAW, bài viết được xử lý ngay khi trang được tải về
                 if sort_by == "hot":
-                    posts_batch = list(subreddit.hot(limit=batch_size, params=params))
+                    posts_iter = subreddit.hot(limit=batch_size, params=params)
                 elif sort_by == "new":
-                    posts_batch = list(subreddit.new(limit=batch_size, params=params))
+                    posts_iter = subreddit.new(limit=batch_size, params=params)
                 elif sort_by == "top":
-                    posts_batch = list(subreddit.top(limit=batch_size, params=params))
+                    posts_iter = subreddit.top(limit=batch_size, params=params)
                 elif sort_by == "rising":
-                    posts_batch = list(subreddit.rising(limit=batch_size, params=params))
+                    posts_iter = subreddit.rising(limit=batch_size, params=params)
                 else:
                     logger.warning(f"Phương thức sắp xếp không hợp lệ: {sort_by}, tiến hành sử dụng hot thay thế")
-                    posts_batch = list(subreddit.hot(limit=batch_size, params=params))
+                    posts_iter = subreddit.hot(limit=batch_size, params=params)
 
-                    # Nếu không có thêm bài viết nào, thoát vòng lặp
-                if not posts_batch:
-                    logger.info(f"Không còn bài viết nào để thu thập từ r/{subreddit_name} ({sort_by})")
-                    break
+                # Shard JSONL của trang hiện tại (tính một lần thay vì cho từng bài viết)
+                shard_path = f"data/raw/posts/{subreddit_name}_{datetime.now().strftime('%Y-%m-%d')}.jsonl"
+
+                # ID bài viết cuối cùng của trang, dùng để phân trang
+                page_last_id = None
 
                 # Xử lý mỗi bài viết trong batch
-                for post in posts_batch:
+                for post in posts_iter:
+                    page_last_id = post.id
+
                     if post.stickied:
                         continue
 
                     if max_posts and count >= max_posts:
                         logger.info(f"Đã đạt giới hạn {max_posts} bài viết từ r/{subreddit_name} ({sort_by})")
-                        return count
+                        reached_limit = True
+                        break
 
                     # Xử lý bài viết
                     try:
+                        author = post.author
                         post_data = {
                             "id": post.id,
                             "title": post.title,
                             "text": post.selftext,
                             "url": post.url,
-                            "author": post.author.name if post.author else "[deleted]",
+                            "author": author.name if author else "[deleted]",
                             "score": post.score,
                             "upvote_ratio": post.upvote_ratio,
                             "num_comments": post.num_comments,
-                            "created_utc": post.created_utc,
+                            # PRAW trả về float, cột created_utc là BIGINT
+                            "created_utc": int(post.created_utc),
                             "created_date": datetime.fromtimestamp(post.created_utc).strftime('%Y-%m-%d %H:%M:%S'),
                             "subreddit": post.subreddit.display_name,
                             "permalink": post.permalink,
@@ -146,31 +212,38 @@ class RedditCollector:
                         # Gửi dữ liệu tới Kafka
                         self.producer.send(KAFKA_POSTS_TOPIC, key=post.id, value=post_data)
 
-                        # Lưu trữ dữ liệu vào file JSON
-                        self._save_to_json(post_data, f"data/raw/posts/{subreddit_name}_{post.id}.json")
+                        # Lưu trữ dữ liệu vào shard JSONL theo subreddit và ngày thu thập
+                        self._append_jsonl(shard_path, post_data)
 
                         count += 1
-                        self.total_posts_collected += 1
 
                         if count % 10 == 0:
                             logger.info(f"Tiến độ: Đã thu thập {count} bài viết từ r/{subreddit_name} ({sort_by})")
 
-                        # Thu thập bình luận cho bài viết hiện tại
-                        comments_count = self.collect_comments(post)
-
-                        # Rate limiting
-                        time.sleep(1)
+                        # Thu thập bình luận cho bài viết hiện tại (PRAW tự giới hạn tốc độ gọi Reddit API)
+                        comments_total += self.collect_comments(post)
 
                     except Exception as e:
                         logger.error(f"Lỗi khi xử lý bài viết {post.id}: {str(e)}")
 
+                # Đẩy các tin nhắn còn trong buffer của producer và các shard JSONL sau mỗi trang
+                self.producer.flush()
+                self._flush_jsonl()
+
+                if reached_limit:
+                    break
+
+                # Nếu không có thêm bài viết nào, thoát vòng lặp
+                if page_last_id is None:
+                    logger.info(f"Không còn bài viết nào để thu thập từ r/{subreddit_name} ({sort_by})")
+                    break
+
                 # Lưu ID của bài viết cuối cùng để tiếp tục phân trang
-                if posts_batch:
-                    last_id = f"t3_{posts_batch[-1].id}"
-                    logger.debug(f"Sử dụng last_id: {last_id} cho trang tiếp theo")
+                last_id = f"t3_{page_last_id}"
+                logger.debug(f"Sử dụng last_id: {last_id} cho trang tiếp theo")
 
-                    # Rate limiting
-                    time.sleep(2)
+                # Rate limiting
+                time.sleep(2)
 
             except Exception as e:
                 logger.error(f"Lỗi trong quá trình thu thập từ r/{subreddit_name} ({sort_by}): {str(e)}")
@@ -178,6 +251,9 @@ class RedditCollector:
                 time.sleep(10)
                 break
 
+        # Bộ đếm cục bộ của lượt thu thập được cộng vào tổng một lần duy nhất
+        self._add_collected(count, comments_total)
+
         logger.info(f"Đã hoàn thành thu thập {count} bài viết từ r/{subreddit_name} ({sort_by})")
         return count
 
@@ -195,54 +271,57 @@ class RedditCollector:
 
         # Đảm bảo tất cả bình luận được tải (thay thế MoreComments object)
         try:
-            # Thiết lập giới hạn cho việc thu thập bình luận để tránh quá tải hệ thống
-            post.comments.replace_more(limit=None)  # Sử dụng None để lấy tất cả bình luận
+            # Thiết lập giới hạn cho việc thu thập bình luận để tránh quá tải hệ thống:
+            # chỉ tải tối đa max_replace_more nhánh, bỏ qua các nhánh có ít hơn replace_more_threshold bình luận
+            skipped_more = post.comments.replace_more(limit=self.max_replace_more,
+                                                      threshold=self.replace_more_threshold)
+            if skipped_more:
+                logger.info(f"Bỏ qua {len(skipped_more)} nhánh bình luận chưa tải của bài viết ID: {post.id}")
             count = 0
 
-            # Đệ quy duyệt qua từng bình luận và bình luận con của bình luận
-            def process_comment(comment_obj, parent_id=None):
+            # Các giá trị chung cho mọi bình luận của bài viết, chỉ lấy một lần
+            post_id = post.id
+            subreddit_name = post.subreddit.display_name
+            shard_path = f"data/raw/comments/{subreddit_name}_{datetime.now().strftime('%Y-%m-%d')}.jsonl"
+
+            def process_comment(comment_obj):
                 nonlocal count
 
                 try:
+                    author = comment_obj.author
                     comment_data = {
                         "id": comment_obj.id,
-                        "post_id": post.id,
-                        "parent_id": parent_id if parent_id else comment_obj.parent_id,
+                        "post_id": post_id,
+                        "parent_id": comment_obj.parent_id,
                         "body": comment_obj.body,
-                        "author": comment_obj.author.name if comment_obj.author else "[deleted]",
+                        "author": author.name if author else "[deleted]",
                         "score": comment_obj.score,
-                        "created_utc": comment_obj.created_utc,
+                        "created_utc": int(comment_obj.created_utc),
                         "created_date": datetime.fromtimestamp(comment_obj.created_utc).strftime('%Y-%m-%d %H:%M:%S'),
                         "is_submitter": comment_obj.is_submitter,
-                        "subreddit": post.subreddit.display_name,
+                        "subreddit": subreddit_name,
                         "collected_utc": int(time.time())
                     }
 
                     # Gửi data tới Kafka
                     self.producer.send(KAFKA_COMMENTS_TOPIC, key=comment_obj.id, value=comment_data)
 
-                    # Lưu dữ liệu vào file JSON
-                    self._save_to_json(comment_data,
-                                       f"data/raw/comments/{post.subreddit.display_name}_{comment_obj.id}.json")
+                    # Lưu dữ liệu vào shard JSONL theo subreddit và ngày thu thập
+                    self._append_jsonl(shard_path, comment_data)
 
                     count += 1
-                    self.total_comments_collected += 1
 
                     # Hiển thị thông tin tiến độ sau mỗi 100 bình luận
                     if count % 100 == 0:
-                        logger.info(f"Tiến độ: Đã thu thập {count} bình luận cho bài viết ID: {post.id}")
-
-                    # Xử lý các bình luận con
-                    for reply in comment_obj.replies:
-                        process_comment(reply, comment_obj.id)
+                        logger.info(f"Tiến độ: Đã thu thập {count} bình luận cho bài viết ID: {post_id}")
 
                 except Exception as e:
                     logger.error(f"Lỗi khi xử lý bình luận {comment_obj.id}: {str(e)}")
                     logger.debug(
                         f"Chi tiết bình luận: id={comment_obj.id}, author={comment_obj.author if comment_obj.author else '[deleted]'}")
 
-            # Xử lý tất cả bình luận gốc trong bài viết
-            for comment in post.comments:
+            # Duyệt toàn bộ cây bình luận đã được PRAW làm phẳng (không đệ quy)
+            for comment in post.comments.list():
                 if isinstance(comment, praw.models.MoreComments):
                     continue
                 process_comment(comment)
@@ -253,13 +332,56 @@ class RedditCollector:
             logger.error(f"Lỗi khi thu thập bình luận cho bài viết {post.id}: {str(e)}")
             return 0
 
-    def collect_all_data(self, max_posts_per_type=None):
+    def _add_collected(self, posts, comments):
+        """
+            Cộng số bài viết và bình luận của một lượt thu thập vào bộ đếm tổng
+
+            Args:
+                posts (int): Số bài viết đã thu thập
+                comments (int): Số bình luận đã thu thập
+        """
+        with self._stats_lock:
+            self.total_posts_collected += posts
+            self.total_comments_collected += comments
+
+    def _collect_subreddit(self, subreddit, max_posts_per_type=None):
+        """
+            Thu thập bài viết của một subreddit theo tất cả các cách sắp xếp
+
+            Args:
+                subreddit (str): Tên subreddit
+                max_posts_per_type (int): Số lượng bài viết tối đa cho mỗi loại sắp xếp
+        """
+        logger.info(f"Bắt đầu thu thập dữ liệu từ r/{subreddit}")
+
+        try:
+            # Thu thập các bài viết theo các cách sắp xếp khác nhau
+            for sort_type in ["hot", "new", "top", "rising"]:
+                posts_count = self.collect_posts_with_pagination(subreddit, sort_by=sort_type,
+                                                                 max_posts=max_posts_per_type)
+                logger.info(f"Đã thu thập {posts_count} bài viết từ r/{subreddit} ({sort_type})")
+
+                # Rate limiting
+                time.sleep(3)
+
+            logger.info(f"Đã hoàn thành thu thập dữ liệu từ r/{subreddit}")
+
+        except Exception as e:
+            logger.error(f"Lỗi khi thu thập dữ liệu từ r/{subreddit}: {str(e)}")
+
+        # Rate limiting
+        time.sleep(5)
+
+    def collect_all_data(self, max_posts_per_type=None, max_workers=1):
         """
             Thu thập dữ liệu từ tất cả subreddits được cấu hình
 
             Args:
                 max_posts_per_type (int): Số lượng bài viết tối đa cần thu thập cho mỗi loại sắp xếp,
                                          None để lấy tất cả có thể
+                max_workers (int): Số subreddit được thu thập đồng thời (mặc định 1: tuần tự).
+                    Mỗi thread có Reddit client và bộ giới hạn tốc độ của PRAW riêng, nên tốc độ gọi API
+                    trên cùng tài khoản tăng theo số worker; chỉ tăng khi quota OAuth cho phép
         """
         logger.info(f"Bắt đầu thu thập dữ liệu từ {len(self.subreddits)} subreddits: {', '.join(self.subreddits)}")
         start_time = time.time()
@@ -268,26 +390,19 @@ class RedditCollector:
         self.total_posts_collected = 0
         self.total_comments_collected = 0
 
-        for subreddit in self.subreddits:
-            logger.info(f"Bắt đầu thu thập dữ liệu từ r/{subreddit}")
-
-            try:
-                # Thu thập các bài viết theo các cách sắp xếp khác nhau
-                for sort_type in ["hot", "new", "top", "rising"]:
-                    posts_count = self.collect_posts_with_pagination(subreddit, sort_by=sort_type,
-                                                                     max_posts=max_posts_per_type)
-                    logger.info(f"Đã thu thập {posts_count} bài viết từ r/{subreddit} ({sort_type})")
-
-                    # Rate limiting
-                    time.sleep(3)
-
-                logger.info(f"Đã hoàn thành thu thập dữ liệu từ r/{subreddit}")
-
-            except Exception as e:
-                logger.error(f"Lỗi khi thu thập dữ liệu từ r/{subreddit}: {str(e)}")
-
-            # Rate limiting
-            time.sleep(5)
+        # Thời gian chờ chủ yếu là gọi Reddit API, có thể thu thập nhiều subreddit đồng thời
+        max_workers = max(1, min(max_workers, len(self.subreddits)))
+        try:
+            if max_workers > 1:
+                with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                    list(executor.map(lambda subreddit: self._collect_subreddit(subreddit, max_posts_per_type),
+                                      self.subreddits))
+            else:
+                for subreddit in self.subreddits:
+                    self._collect_subreddit(subreddit, max_posts_per_type)
+        finally:
+            # Đóng các shard sau mỗi lần thu thập, kể cả khi bị lỗi giữa chừng
+            self._close_jsonl()
 
         end_time = time.time()
         duration = end_time - start_time
@@ -298,26 +413,61 @@ class RedditCollector:
         logger.info(f"Tổng cộng: {self.total_posts_collected} bài viết và {self.total_comments_collected} bình luận")
         logger.info(f"Thời gian thu thập: {int(hours)} giờ, {int(minutes)} phút và {int(seconds)} giây")
 
-    def _save_to_json(self, data, file_path):
+    def _append_jsonl(self, file_path, data):
         """
-            Lưu trữ dữ liệu vào file JSON
+            Ghi thêm một bản ghi vào shard JSON Lines (file được giữ mở giữa các lần ghi)
 
             Args:
+                file_path (str): Đường dẫn tới file .jsonl
                 data (dict): Dữ liệu cần lưu
-                file_path (str): Đường dẫn tới file
         """
-
-        # Tạo folder nếu chưa tồn tại
-        os.makedirs(os.path.dirname(file_path), exist_ok=True)
-
         try:
-            with open(file_path, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
+            line = json.dumps(data, ensure_ascii=False) + '\n'
+            with self._jsonl_lock:
+                f = self._jsonl_files.get(file_path)
+                if f is None:
+                    # Shard theo ngày (<subreddit>_YYYY-MM-DD.jsonl): sang ngày mới thì đóng shard của ngày cũ
+                    day = os.path.basename(file_path).rsplit('_', 1)[-1]
+                    if day != self._jsonl_day:
+                        self._close_jsonl_locked()
+                        self._jsonl_day = day
+
+                    # Tạo folder nếu chưa tồn tại
+                    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+                    f = self._jsonl_files[file_path] = open(file_path, 'a', encoding='utf-8')
+
+                f.write(line)
         except Exception as e:
             logger.error(f"Lỗi khi lưu dữ liệu vào {file_path}: {str(e)}")
 
+    def _flush_jsonl(self):
+        """Đẩy dữ liệu trong buffer của các shard JSONL xuống đĩa"""
+        with self._jsonl_lock:
+            for file_path, f in self._jsonl_files.items():
+                try:
+                    f.flush()
+                except Exception as e:
+                    logger.error(f"Lỗi khi ghi dữ liệu vào {file_path}: {str(e)}")
+
+    def _close_jsonl(self):
+        """Đóng tất cả các shard JSONL đang mở"""
+        with self._jsonl_lock:
+            self._close_jsonl_locked()
+
+    def _close_jsonl_locked(self):
+        """Đóng tất cả các shard JSONL đang mở (cần giữ _jsonl_lock)"""
+        for file_path, f in self._jsonl_files.items():
+            try:
+                f.close()
+            except Exception as e:
+                logger.error(f"Lỗi khi đóng file {file_path}: {str(e)}")
+        self._jsonl_files.clear()
+        self._jsonl_day = None
+
     def close(self):
-        """ Đóng kafka producer """
+        """ Đóng các shard JSONL và kafka producer """
+        self._close_jsonl()
+
         if hasattr(self, 'producer') and self.producer:
             self.producer.flush()
             self.producer.close()
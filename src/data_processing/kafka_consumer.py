@@ -1,8 +1,14 @@
+import io
 import json
 import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from kafka import KafkaConsumer
+from kafka.structs import OffsetAndMetadata
 import psycopg2
+from psycopg2 import sql
 from psycopg2.extras import execute_values
+from psycopg2.pool import ThreadedConnectionPool
 
 from src.utils.config import (
     KAFKA_BOOTSTRAP_SERVERS, KAFKA_POSTS_TOPIC, KAFKA_COMMENTS_TOPIC,
@@ -12,18 +18,111 @@ from src.utils.logger import setup_logger
 
 logger = setup_logger(__name__, "logs/kafka_consumer.log")
 
+# Số dòng mỗi câu lệnh INSERT khi ghi batch bằng execute_values
+INSERT_PAGE_SIZE = 500
+
+# Số batch tiếp theo được thử ghi lại bình luận khi bài viết của nó chưa có trong database
+# (bài viết có thể đang được consumer khác trong cùng group ghi)
+COMMENT_RETRY_BATCHES = 3
+
+# Số kết nối tối đa trong pool PostgreSQL của mỗi consumer (thread ghi và lúc khởi tạo)
+POOL_MAX_CONNECTIONS = 2
+
+# Batch từ số dòng này trở lên được nạp bằng COPY vào bảng tạm thay vì INSERT ... VALUES
+COPY_MIN_ROWS = 200
+
+POST_COLUMNS = ("post_id", "subreddit_id", "title", "text", "url", "author", "score", "upvote_ratio",
+                "num_comments", "created_utc", "created_date", "is_self", "is_video",
+                "over_18", "permalink", "link_flair_text", "collected_utc")
+
+POST_CONFLICT = """
+    ON CONFLICT (post_id)
+    DO UPDATE SET
+        score = EXCLUDED.score,
+        upvote_ratio = EXCLUDED.upvote_ratio,
+        num_comments = EXCLUDED.num_comments,
+        collected_utc = EXCLUDED.collected_utc
+"""
+
+COMMENT_COLUMNS = ("comment_id", "post_id", "parent_id", "body", "author", "score",
+                   "created_utc", "created_date", "is_submitter", "collected_utc")
+
+# Chỉ ghi bình luận của bài viết đã tồn tại, điều kiện được PostgreSQL kiểm tra ngay trong câu lệnh INSERT
+COMMENT_GUARD = """
+    WHERE EXISTS (SELECT 1 FROM reddit_data.posts p WHERE p.post_id = s.post_id)
+"""
+
+COMMENT_CONFLICT = """
+    ON CONFLICT (comment_id)
+    DO UPDATE SET
+        score = EXCLUDED.score,
+        collected_utc = EXCLUDED.collected_utc
+"""
+
+# Các trường của tin nhắn bài viết theo thứ tự cột sau post_id, subreddit_id trong POST_COLUMNS
+POST_FIELDS = ("title", "text", "url", "author", "score", "upvote_ratio", "num_comments",
+               "created_utc", "created_date", "is_self", "is_video", "over_18",
+               "permalink", "link_flair_text", "collected_utc")
+POST_FIELD_DEFAULTS = tuple(False if field in ("is_self", "is_video", "over_18") else None
+                            for field in POST_FIELDS)
+
+# Các trường của tin nhắn bình luận theo thứ tự cột trong COMMENT_COLUMNS
+COMMENT_FIELDS = ("id", "post_id", "parent_id", "body", "author", "score",
+                  "created_utc", "created_date", "is_submitter", "collected_utc")
+COMMENT_FIELD_DEFAULTS = tuple(False if field == "is_submitter" else None for field in COMMENT_FIELDS)
+
+# Kiểu tham số của các prepared statement dùng khi ghi lại từng dòng, theo thứ tự cột ở trên
+POST_PARAM_TYPES = ("varchar", "int", "text", "text", "text", "varchar", "int", "float", "int",
+                    "bigint", "timestamp", "boolean", "boolean", "boolean", "text", "text", "bigint")
+COMMENT_PARAM_TYPES = ("varchar", "varchar", "varchar", "text", "varchar", "int",
+                       "bigint", "timestamp", "boolean", "bigint")
+
+
+def _deserialize_value(value):
+    """
+        Giải mã tin nhắn JSON từ Kafka (json.loads nhận trực tiếp bytes UTF-8)
+
+        Tin nhắn rỗng hoặc không phải JSON hợp lệ trả về None thay vì làm lỗi cả lần poll
+    """
+    if not value or value.isspace():
+        return None
+    try:
+        return json.loads(value)
+    except ValueError:
+        logger.warning(f"Bỏ qua tin nhắn không phải JSON hợp lệ ({len(value)} bytes)")
+        return None
+
+
+def _copy_value(value):
+    """Chuyển một giá trị sang định dạng text của COPY (NULL là \\N, escape tab/xuống dòng)"""
+    if value is None:
+        return '\\N'
+    # Float nguyên (vd. created_utc từ tin nhắn cũ: 1697040000.0) được ghi dạng số nguyên,
+    # COPY vào cột BIGINT không chấp nhận "1697040000.0"; cột float vẫn đọc được "1"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return (str(value).replace('\\', '\\\\').replace('\t', '\\t')
+            .replace('\n', '\\n').replace('\r', '\\r'))
+
+
 class RedditDataConsumer:
     """
         Class tiêu thụ dữ liệu từ Kafka, xử lý và lưu vào PostgreSQL
     """
 
-    def __init__(self, topics=None, group_id="reddit_data_group"):
+    def __init__(self, topics=None, group_id="reddit_data_group", batch_size=2000, flush_interval=1.0,
+                 async_commit=False):
         """
             Khởi tạo Kafka consumer và kết nối PostgreSQL
 
             Args:
                 topics (list): Danh sách các Kafka topics cần theo dõi
                 group_id (str): Consumer group ID
+                batch_size (int): Số tin nhắn tối đa gom lại trước khi ghi vào PostgreSQL
+                flush_interval (float): Thời gian (giây) tối đa giữ tin nhắn trong batch trước khi ghi
+                async_commit (bool): Tắt synchronous_commit cho phiên PostgreSQL (dùng khi nạp lại dữ liệu cũ);
+                    commit không chờ ghi WAL xuống đĩa, nếu PostgreSQL sập có thể mất các batch cuối
+                    dù offset Kafka đã được commit
         """
 
         # Thiết lập kafka topics
@@ -33,6 +132,9 @@ class RedditDataConsumer:
             self.topics = topics
 
         self.group_id = group_id
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.async_commit = async_commit
 
         # Khởi tạo Kafka consumer
         logger.info(f"Khởi tạo Kafka consumer cho topics: {', '.join(self.topics)}")
@@ -41,9 +143,15 @@ class RedditDataConsumer:
                 *self.topics,
                 bootstrap_servers = KAFKA_BOOTSTRAP_SERVERS,
                 auto_offset_reset = 'earliest',
-                enable_auto_commit = True,
+                # Offset chỉ được commit sau khi batch tương ứng đã được commit vào PostgreSQL
+                enable_auto_commit = False,
+                # Mỗi lần fetch lấy nhiều dữ liệu hơn (chờ tối đa fetch_max_wait_ms nếu chưa đủ fetch_min_bytes)
+                fetch_min_bytes = 1_000_000,
+                fetch_max_wait_ms = 200,
+                max_partition_fetch_bytes = 10_485_760,
+                max_poll_records = self.batch_size,
                 group_id = self.group_id,
-                value_deserializer = lambda x: json.loads(x.decode('utf-8'))
+                value_deserializer = _deserialize_value
             )
             logger.info("Kafka consumer đã được khởi tạo thành công")
 
@@ -53,19 +161,75 @@ class RedditDataConsumer:
 
         # Kết nối đến PostgreSQL
         logger.info(f"Kết nối đến PostgreSQL database: {POSTGRES_DB} tại {POSTGRES_HOST}:{POSTGRES_PORT}")
+        self.conn = None
+        self.cur = None
         try:
-            self.conn = psycopg2.connect(
+            # Mỗi batch mượn một kết nối từ pool và trả lại sau khi commit, kết nối bị lỗi được bỏ đi
+            # và batch sau dùng kết nối mới thay vì làm dừng cả consumer
+            self.pool = ThreadedConnectionPool(
+                minconn=1,
+                maxconn=POOL_MAX_CONNECTIONS,
                 host=POSTGRES_HOST,
                 port=POSTGRES_PORT,
                 dbname=POSTGRES_DB,
                 user=POSTGRES_USER,
                 password=POSTGRES_PASSWORD
             )
-            self.cur = self.conn.cursor()
+
+            # id của các kết nối trong pool đã được chuẩn bị phiên (bảng tạm, prepared statement)
+            self._ready_conns = set()
+            self._acquire_connection()
+        except Exception as e:
+            logger.error(f"Lỗi khi kết nối PostgreSQL: {str(e)}")
+            raise
+
+        try:
+            # Câu lệnh ghi batch của mỗi bảng được tạo một lần, các batch sau dùng lại đúng chuỗi SQL này
+            self._upsert_sql = {
+                "posts": self._build_upsert_sql("posts", POST_COLUMNS, POST_CONFLICT),
+                "comments": self._build_upsert_sql("comments", COMMENT_COLUMNS, COMMENT_CONFLICT,
+                                                   where_clause=COMMENT_GUARD, returning="comment_id, author")
+            }
+
+            # Ánh xạ tên subreddit -> subreddit_id, số subreddit ít nên nạp sẵn toàn bộ
+            self.cur.execute("SELECT name, subreddit_id FROM reddit_data.subreddits")
+            self._subreddit_ids = dict(self.cur.fetchall())
+            self.conn.commit()
             logger.info("Đã kết nối thành công đến PostgreSQL")
         except Exception as e:
             logger.error(f"Lỗi khi kết nối PostgreSQL: {str(e)}")
             raise
+        finally:
+            self._release_connection()
+
+        # Các dòng bài viết / bình luận chờ ghi vào PostgreSQL trong batch tiếp theo, theo id:
+        # một bài viết có thể xuất hiện nhiều lần (hot, new, top...), chỉ giữ bản mới nhất
+        self._post_buf = {}
+        self._comment_buf = {}
+
+        # Vị trí (TopicPartition, offset) của tin nhắn ứng với mỗi bình luận trong _comment_buf
+        self._comment_pos = {}
+
+        # Số bài viết / bình luận mới của mỗi người dùng trong batch: username -> [post_count, comment_count]
+        self._user_delta = {}
+
+        # Bình luận chưa ghi được vì bài viết chưa tồn tại:
+        # comment_id -> (dòng dữ liệu, số lần đã thử, vị trí tin nhắn). Offset Kafka không được commit
+        # vượt qua tin nhắn của các bình luận này, để chúng được đọc lại nếu consumer dừng trước khi ghi được
+        self._deferred_comments = {}
+
+        # Offset đầu tiên / sau cuối của batch hiện tại trên mỗi partition,
+        # dùng để đọc lại batch nếu ghi lỗi và để commit đúng offset của batch đã ghi
+        self._batch_start = {}
+        self._batch_end = {}
+
+        # Việc ghi PostgreSQL chạy trên một thread riêng, song song với lần poll Kafka tiếp theo;
+        # _pending_flush là (future, batch_start, batch_end) của batch đang ghi
+        self._db_executor = ThreadPoolExecutor(max_workers=1)
+        self._pending_flush = None
+
+        # Được bật bởi stop() để dừng vòng lặp xử lý từ thread khác
+        self._stop_event = threading.Event()
 
     def process_data(self):
         """
@@ -74,143 +238,541 @@ class RedditDataConsumer:
         logger.info("Bắt đầu xử lý dữ liệu từ Kafka")
 
         try:
-            # Duyệt qua từng message từ Kafka
-            for message in self.consumer:
-                topic = message.topic
-                data = message.value
-
-                try:
-                    if topic == KAFKA_POSTS_TOPIC:
-                        self._process_post(data)
-                    elif topic == KAFKA_COMMENTS_TOPIC:
-                        self._process_comment(data)
-
-                    # Commit transaction sau khi xử lý mỗi tin nahwns
-                    self.conn.commit()
-                except Exception as e:
-                    logger.error(f"Lỗi khi xử lý tin nhắn: {str(e)}")
-                    self.conn.rollback() # Nếu có lỗi thì
+            pending = 0
+            deadline = time.monotonic() + self.flush_interval
+
+            while not self._stop_event.is_set():
+                # Lấy nhiều tin nhắn mỗi lần poll, chờ không quá thời hạn ghi batch hiện tại
+                timeout_ms = max(0, int((deadline - time.monotonic()) * 1000))
+                records = self.consumer.poll(timeout_ms=timeout_ms, max_records=self.batch_size - pending)
+
+                for tp, messages in records.items():
+                    # Mỗi partition thuộc một topic, chọn hàm xử lý một lần cho cả danh sách tin nhắn
+                    if tp.topic == KAFKA_POSTS_TOPIC:
+                        process = self._process_post
+                    elif tp.topic == KAFKA_COMMENTS_TOPIC:
+                        process = self._process_comment
+                    else:
+                        process = None
+
+                    self._batch_start.setdefault(tp, messages[0].offset)
+                    self._batch_end[tp] = messages[-1].offset + 1
+                    pending += len(messages)
+                    if process is None:
+                        continue
+
+                    for message in messages:
+                        try:
+                            process(message.value, (tp, message.offset))
+                        except Exception as e:
+                            logger.error(f"Lỗi khi xử lý tin nhắn: {str(e)}")
+
+                # Gửi batch cho thread ghi khi đủ batch_size tin nhắn hoặc hết flush_interval
+                if pending >= self.batch_size or time.monotonic() >= deadline:
+                    self._commit_batch()
+                    pending = 0
+                    deadline = time.monotonic() + self.flush_interval
         except KeyboardInterrupt:
             logger.info("Nhận được tín hiệu ngắt, dừng consumer")
         except Exception as e:
             logger.error(f"Lỗi không xác định trong quá trình xử lý: {str(e)}")
         finally:
+            self._commit_batch(wait=True)
+            self._db_executor.shutdown(wait=True)
             self.close()
 
-    def _process_post(self, post_data):
+    def stop(self):
+        """Yêu cầu vòng lặp process_data dừng sau lần poll hiện tại"""
+        self._stop_event.set()
+
+    def _commit_batch(self, wait=False):
         """
-            Xử lý dữ liệu bài viết và lưu vào PostgreSQL
+            Chờ batch trước ghi xong rồi gửi batch hiện tại cho thread ghi PostgreSQL,
+            để lần poll tiếp theo chạy song song với việc ghi
 
             Args:
-                post_data (dict): Dữ liệu bài viết từ Kafka
+                wait (bool): Chờ cả batch vừa gửi ghi xong (khi dừng consumer)
+        """
+        # Offset phải được commit theo đúng thứ tự batch
+        self._finish_pending_flush()
+
+        if self._batch_start:
+            batch_start, batch_end = self._batch_start, self._batch_end
+            post_buf, comment_buf, comment_pos = self._post_buf, self._comment_buf, self._comment_pos
+            self._batch_start, self._batch_end = {}, {}
+            self._post_buf, self._comment_buf, self._comment_pos = {}, {}, {}
+
+            future = self._db_executor.submit(self._flush_buffers, post_buf, comment_buf, comment_pos)
+            self._pending_flush = (future, batch_start, batch_end)
+
+        if wait:
+            self._finish_pending_flush()
+
+    def _finish_pending_flush(self):
         """
+            Chờ batch đang ghi hoàn tất, sau đó commit offset Kafka của batch (hoặc đọc lại nếu ghi lỗi)
+
+            KafkaConsumer không an toàn khi dùng từ nhiều thread, nên commit / seek luôn chạy ở thread poll
+        """
+        if self._pending_flush is None:
+            return
 
-        logger.debug(f"Xử lý bài viết: {post_data.get('id')}")
+        future, batch_start, batch_end = self._pending_flush
+        self._pending_flush = None
 
         try:
-            # Đảm bảo có subreddit tồn tại ở bảng subreddits
-            self._ensure_subreddit_exists(post_data.get('subreddit'))
+            saved = future.result()
+        except Exception as e:
+            logger.error(f"Lỗi khi ghi batch vào PostgreSQL: {str(e)}")
+            saved = False
 
-            # Get subreddit id
-            self.cur.execute(
-                "SELECT subreddit_id FROM reddit_data.subreddits WHERE name = %s",
-                (post_data.get('subreddit'),)
-            )
-            result = self.cur.fetchone()
-            subreddit_id = result[0] if result else None
+        try:
+            if saved:
+                # Chỉ commit đến cuối batch đã ghi, không phải vị trí poll hiện tại (đã đọc thêm batch sau),
+                # và không vượt qua tin nhắn của bình luận còn bị hoãn (mới chỉ nằm trong bộ nhớ).
+                # Thread ghi đã xong batch nên đọc _deferred_comments ở đây là an toàn
+                offsets = dict(batch_end)
+                for _, _, position in self._deferred_comments.values():
+                    if position is not None and position[0] in offsets:
+                        tp, offset = position
+                        offsets[tp] = min(offsets[tp], offset)
+
+                self.consumer.commit({
+                    tp: OffsetAndMetadata(offset, None) for tp, offset in offsets.items()
+                })
+            else:
+                # Các tin nhắn đọc sau batch lỗi cũng bị bỏ và đọc lại cùng batch đó
+                for tp, offset in self._batch_start.items():
+                    batch_start.setdefault(tp, offset)
+                self._batch_start, self._batch_end = {}, {}
+                self._post_buf, self._comment_buf, self._comment_pos = {}, {}, {}
+
+                # Không commit offset và quay lại đầu batch để đọc lại các tin nhắn chưa được lưu
+                for tp, offset in batch_start.items():
+                    self.consumer.seek(tp, offset)
+                logger.warning("Ghi batch thất bại, batch sẽ được đọc lại từ Kafka")
+        except Exception as e:
+            logger.error(f"Lỗi khi commit offset Kafka: {str(e)}")
 
-            # Thêm hoặc cập nhật dữ liệu bài viết
-            self.cur.execute("""
-                INSERT INTO reddit_data.posts (
-                    post_id, subreddit_id, title, text, url, author, score, upvote_ratio,
-                    num_comments, created_utc, created_date, is_self, is_video,
-                    over_18, permalink, link_flair_text, collected_utc
-                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                ON CONFLICT (post_id)
-                DO UPDATE SET
-                    score = EXCLUDED.score,
-                    upvote_ratio = EXCLUDED.upvote_ratio,
-                    num_comments = EXCLUDED.num_comments,
-                    collected_utc = EXCLUDED.collected_utc;
-            """, (
-                post_data.get('id'),
-                subreddit_id,
-                post_data.get('title'),
-                post_data.get('text'),
-                post_data.get('url'),
-                post_data.get('author'),
-                post_data.get('score'),
-                post_data.get('upvote_ratio'),
-                post_data.get('num_comments'),
-                post_data.get('created_utc'),
-                post_data.get('created_date'),
-                post_data.get('is_self', False),
-                post_data.get('is_video', False),
-                post_data.get('over_18', False),
-                post_data.get('permalink'),
-                post_data.get('link_flair_text'),
-                post_data.get('collected_utc')
-            ))
-
-            # Cập nhật bảng user_activity
-            self._update_user_activity(post_data.get('author'), is_post=True)
-
-            logger.debug(f"Đã lưu bài viết {post_data.get('id')} vào PostgreSQL")
+    def _flush_buffers(self, post_buf, comment_buf, comment_pos=None):
+        """
+            Ghi các bài viết và bình luận của một batch vào PostgreSQL bằng một kết nối mượn từ pool
+            (chạy trên thread ghi, là thread duy nhất dùng self.conn / self.cur)
+
+            Args:
+                post_buf (dict): Các dòng bài viết theo post_id (cột subreddit_id đang là tên subreddit)
+                comment_buf (dict): Các dòng bình luận theo comment_id
+                comment_pos (dict, optional): Vị trí tin nhắn Kafka của các bình luận theo comment_id
 
+            Returns:
+                bool: True nếu batch đã được commit (hoặc không có gì để ghi)
+        """
+        if not post_buf and not comment_buf:
+            return True
+
+        try:
+            self._acquire_connection()
         except Exception as e:
-            logger.error(f"Lỗi khi xử lý bài viết {post_data.get('id')}: {str(e)}")
+            logger.error(f"Không lấy được kết nối PostgreSQL từ pool: {str(e)}")
+            return False
+
+        try:
+            return self._write_batch(post_buf, comment_buf, comment_pos)
+        finally:
+            self._release_connection()
+
+    def _write_batch(self, post_buf, comment_buf, comment_pos=None):
+        """
+            Ghi một batch trong một transaction ngắn trên kết nối hiện tại
+
+            Args:
+                post_buf (dict): Các dòng bài viết theo post_id (cột subreddit_id đang là tên subreddit)
+                comment_buf (dict): Các dòng bình luận theo comment_id
+                comment_pos (dict, optional): Vị trí tin nhắn Kafka của các bình luận theo comment_id
+
+            Returns:
+                bool: True nếu batch đã được commit
+        """
+        # Thử lại các bình luận bị hoãn ở batch trước, bản mới trong batch này (và vị trí tin nhắn của nó)
+        # được ưu tiên
+        deferred = self._deferred_comments
+        positions = comment_pos or {}
+        if deferred:
+            comment_buf = {**{comment_id: entry[0] for comment_id, entry in deferred.items()}, **comment_buf}
+            positions = {**{comment_id: entry[2] for comment_id, entry in deferred.items()}, **positions}
+
+        # Buffer theo id nên không có dòng trùng khóa
+        # (ON CONFLICT DO UPDATE không cho phép cập nhật một dòng hai lần trong cùng câu lệnh)
+        comment_rows = list(comment_buf.values())
+        try:
+            # Đổi tên subreddit thành subreddit_id (thêm subreddit mới nếu cần)
+            post_rows = [
+                (row[0], self._ensure_subreddit_exists(row[1]), *row[2:])
+                for row in post_buf.values()
+            ]
+        except Exception as e:
+            logger.error(f"Lỗi khi lấy subreddit_id cho batch: {str(e)}")
+            if not self.conn.closed:
+                self.conn.rollback()
+            return False
+
+        try:
+            if post_rows:
+                self._upsert_rows("posts", post_rows)
+
+                # Cập nhật bảng user_activity
+                for row in post_rows:
+                    self._update_user_activity(row[5], is_post=True)
+
+            still_deferred = {}
+            if comment_rows:
+                # Bổ sung logic để fix lỗi insert or update comment: bình luận của bài viết không tồn tại
+                # bị bỏ qua bởi điều kiện EXISTS (bài viết vừa ghi ở trên cũng được tính)
+                saved = self._upsert_rows("comments", comment_rows)
+
+                # Cập nhật bảng user_activity
+                saved_ids = set()
+                for comment_id, author in saved:
+                    saved_ids.add(comment_id)
+                    self._update_user_activity(author, is_post=False)
+
+                # Bài viết có thể chưa được ghi (nằm ở batch sau hoặc ở consumer khác), hoãn sang batch tiếp theo
+                still_deferred = self._next_deferred(comment_rows, saved_ids, positions)
+
+            self._flush_user_activity()
+
+            self.conn.commit()
+            self._deferred_comments = still_deferred
+            logger.debug("Đã lưu %d bài viết và %d bình luận vào PostgreSQL",
+                         len(post_rows), len(comment_rows))
+            return True
+        except Exception as e:
+            logger.error(f"Lỗi khi ghi batch {len(post_rows)} bài viết và "
+                         f"{len(comment_rows)} bình luận: {str(e)}")
+            if self.conn.closed:
+                return False
+            self.conn.rollback()
+
+            # Ghi lại từng dòng để chỉ bỏ qua các dòng lỗi thay vì đọc lại cả batch mãi mãi
+            return self._flush_row_by_row(post_rows, comment_rows, positions)
+        finally:
+            self._user_delta.clear()
+
+    def _flush_row_by_row(self, post_rows, comment_rows, positions=None):
+        """
+            Ghi lần lượt từng dòng của batch bằng prepared statement, mỗi dòng một transaction,
+            bỏ qua các dòng bị PostgreSQL từ chối
+
+            Args:
+                post_rows (list): Các dòng bài viết
+                comment_rows (list): Các dòng bình luận
+                positions (dict, optional): Vị trí tin nhắn Kafka của các bình luận theo comment_id
+
+            Returns:
+                bool: False nếu mất kết nối PostgreSQL (batch cần được đọc lại từ Kafka)
+        """
+        self._user_delta.clear()
+        saved_ids = set()
+
+        try:
+            for row in post_rows:
+                saved = self._execute_row("post_ins", row)
+                if saved:
+                    self._update_user_activity(saved[0], is_post=True)
+
+            for row in comment_rows:
+                saved = self._execute_row("comment_ins", row)
+                if saved:
+                    saved_ids.add(row[0])
+                    self._update_user_activity(saved[0], is_post=False)
+
+            self._flush_user_activity()
+            self.conn.commit()
+        except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+            logger.error(f"Mất kết nối PostgreSQL khi ghi từng dòng: {str(e)}")
+            # Batch sẽ được đọc lại, nhưng các bình luận bị hoãn đã được commit thì không được ghi lại lần nữa
+            for comment_id in saved_ids:
+                self._deferred_comments.pop(comment_id, None)
+            return False
+        except Exception as e:
+            # Các dòng dữ liệu đã được lưu, chỉ mất phần cập nhật user_activity của batch này
+            logger.error(f"Lỗi khi cập nhật user_activity: {str(e)}")
+            self.conn.rollback()
+
+        # Bình luận chưa ghi được (bài viết chưa tồn tại hoặc dòng lỗi) được hoãn như khi ghi cả batch,
+        # bình luận bị hoãn đã được lưu thì bỏ khỏi danh sách hoãn
+        self._deferred_comments = self._next_deferred(comment_rows, saved_ids, positions)
+        return True
+
+    def _next_deferred(self, comment_rows, saved_ids, positions=None):
+        """
+            Tính danh sách bình luận hoãn sang batch sau: bình luận chưa được ghi được thử lại
+            tối đa COMMENT_RETRY_BATCHES batch rồi bị bỏ qua
+
+            Args:
+                comment_rows (list): Các dòng bình luận của batch (gồm cả bình luận bị hoãn trước đó)
+                saved_ids (set): comment_id của các bình luận đã được ghi
+                positions (dict, optional): Vị trí tin nhắn Kafka của các bình luận theo comment_id
+
+            Returns:
+                dict: comment_id -> (dòng dữ liệu, số lần đã thử, vị trí tin nhắn)
+        """
+        deferred = self._deferred_comments
+        positions = positions or {}
+        still_deferred = {}
+        skipped = 0
+        for row in comment_rows:
+            if row[0] in saved_ids:
+                continue
+            attempts = deferred[row[0]][1] + 1 if row[0] in deferred else 1
+            if attempts > COMMENT_RETRY_BATCHES:
+                skipped += 1
+            else:
+                still_deferred[row[0]] = (row, attempts, positions.get(row[0]))
+        if skipped:
+            logger.warning(f"Bỏ qua {skipped} bình luận vì bài viết không tồn tại")
+        return still_deferred
+
+    def _execute_row(self, statement, row):
+        """
+            Thực thi prepared statement cho một dòng và commit ngay
+
+            Args:
+                statement (str): Tên prepared statement (post_ins hoặc comment_ins)
+                row (tuple): Dòng dữ liệu
+
+            Returns:
+                tuple: Dòng RETURNING (author), None nếu dòng bị bỏ qua hoặc bị lỗi
+        """
+        try:
+            placeholders = ", ".join(["%s"] * len(row))
+            self.cur.execute(f"EXECUTE {statement} ({placeholders})", row)
+            saved = self.cur.fetchone()
+            self.conn.commit()
+            return saved
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
             raise
+        except Exception as e:
+            logger.error(f"Bỏ qua dòng {row[0]} ({statement}): {str(e)}")
+            self.conn.rollback()
+            return None
 
-    def _process_comment(self, comment_data):
+    def _acquire_connection(self):
+        """
+            Mượn một kết nối từ pool cho self.conn / self.cur, chuẩn bị phiên nếu kết nối mới được tạo
         """
-            Xử lý dữ liệu bình luận và lưu vào PostgreSQL
+        conn = self.pool.getconn()
+        self.conn = conn
+        self.cur = conn.cursor()
+        if id(conn) in self._ready_conns:
+            return
+
+        try:
+            if self.async_commit:
+                self.cur.execute("SET synchronous_commit = off")
+                self.conn.commit()
+                logger.info("Đã tắt synchronous_commit cho phiên PostgreSQL của consumer")
+            self._create_staging_tables()
+            self._prepare_statements()
+        except Exception:
+            self.cur.close()
+            self.pool.putconn(conn, close=True)
+            self.conn = None
+            self.cur = None
+            raise
+        self._ready_conns.add(id(conn))
+
+    def _release_connection(self):
+        """
+            Trả kết nối hiện tại về pool, kết nối đã mất hoặc còn transaction dở dang bị đóng luôn
+        """
+        conn = self.conn
+        if conn is None:
+            return
+
+        broken = bool(conn.closed)
+        if not broken:
+            try:
+                self.cur.close()
+                if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except psycopg2.Error:
+                broken = True
+        if broken:
+            self._ready_conns.discard(id(conn))
+
+        self.pool.putconn(conn, close=broken)
+        self.conn = None
+        self.cur = None
+
+    def _prepare_statements(self):
+        """
+            PREPARE các câu lệnh ghi một dòng, PostgreSQL chỉ phân tích và lập kế hoạch một lần cho mỗi phiên
+        """
+        post_params = ", ".join(f"${i}" for i in range(1, len(POST_PARAM_TYPES) + 1))
+        self.cur.execute(f"""
+            PREPARE post_ins ({", ".join(POST_PARAM_TYPES)}) AS
+            INSERT INTO reddit_data.posts ({", ".join(POST_COLUMNS)}) VALUES ({post_params})
+            {POST_CONFLICT}
+            RETURNING author
+        """)
+
+        # Bình luận chỉ được ghi khi bài viết ($2) đã tồn tại
+        comment_params = ", ".join(f"${i}" for i in range(1, len(COMMENT_PARAM_TYPES) + 1))
+        self.cur.execute(f"""
+            PREPARE comment_ins ({", ".join(COMMENT_PARAM_TYPES)}) AS
+            INSERT INTO reddit_data.comments ({", ".join(COMMENT_COLUMNS)})
+            SELECT {comment_params}
+            WHERE EXISTS (SELECT 1 FROM reddit_data.posts p WHERE p.post_id = $2)
+            {COMMENT_CONFLICT}
+            RETURNING author
+        """)
+        self.conn.commit()
+
+    def _create_staging_tables(self):
+        """
+            Tạo các bảng tạm để nạp batch trước khi upsert (tồn tại theo phiên, tự xóa dữ liệu khi commit)
+        """
+        # Bảng tạm không ghi WAL và chỉ phiên này nhìn thấy, nên không xung đột giữa các consumer
+        for table in ("posts", "comments"):
+            self.cur.execute(f"""
+                CREATE TEMP TABLE IF NOT EXISTS {table}_stage
+                (LIKE reddit_data.{table} INCLUDING DEFAULTS)
+                ON COMMIT DELETE ROWS
+            """)
+        self.conn.commit()
+
+    def _build_upsert_sql(self, table, columns, conflict_clause, where_clause="", returning=None):
+        """
+            Tạo sẵn các câu lệnh ghi batch vào bảng reddit_data.<table> (gọi một lần trong __init__)
 
             Args:
-                comment_data (dict): Dữ liệu bình luận từ Kafka
+                table (str): Tên bảng (không kèm schema)
+                columns (tuple): Tên các cột theo thứ tự giá trị trong mỗi dòng
+                conflict_clause (str): Mệnh đề ON CONFLICT của câu lệnh INSERT
+                where_clause (str): Điều kiện lọc các dòng (bảng tạm có alias s), rỗng nếu ghi tất cả
+                returning (str, optional): Các cột trả về cho những dòng đã được ghi
+
+            Returns:
+                dict: Các câu lệnh đã render thành chuỗi và template một dòng dùng cho _upsert_rows
+        """
+        cols = sql.SQL(", ").join(map(sql.Identifier, columns))
+        target = sql.Identifier("reddit_data", table)
+        stage = sql.Identifier(f"{table}_stage")
+        tail = sql.SQL(conflict_clause + (f" RETURNING {returning}" if returning else ""))
+
+        statements = {
+            "values": sql.SQL("INSERT INTO {} ({}) VALUES %s {}").format(target, cols, tail),
+            "copy": sql.SQL("COPY {} ({}) FROM STDIN").format(stage, cols),
+            "stage": sql.SQL("INSERT INTO {} ({}) VALUES ").format(stage, cols),
+            # Nạp vào bảng tạm trước để các cột có đúng kiểu của bảng gốc, sau đó lọc và upsert
+            # bằng một câu lệnh INSERT ... SELECT
+            "upsert": sql.SQL("INSERT INTO {} ({}) SELECT {} FROM {} AS s {} {}").format(
+                target, cols, cols, stage, sql.SQL(where_clause), tail
+            )
+        }
+        built = {name: statement.as_string(self.conn) for name, statement in statements.items()}
+
+        # Hai câu lệnh được ghép với dữ liệu đã mogrify (bytes) nên encode sẵn
+        built["stage"] = built["stage"].encode()
+        built["upsert"] = built["upsert"].encode()
+        built["template"] = "(" + ", ".join(["%s"] * len(columns)) + ")"
+        built["guarded"] = bool(where_clause)
+        built["returning"] = bool(returning)
+        return built
+
+    def _upsert_rows(self, table, rows):
+        """
+            Thêm hoặc cập nhật các dòng vào bảng reddit_data.<table> bằng các câu lệnh tạo sẵn trong _upsert_sql
+
+            Args:
+                table (str): Tên bảng (không kèm schema)
+                rows (list): Các dòng dữ liệu (tuple), không trùng khóa chính
+
+            Returns:
+                list: Các dòng RETURNING (rỗng nếu bảng không có returning)
+        """
+        statements = self._upsert_sql[table]
+
+        if len(rows) < COPY_MIN_ROWS and not statements["guarded"]:
+            result = execute_values(
+                self.cur,
+                statements["values"],
+                rows,
+                template=statements["template"],
+                page_size=INSERT_PAGE_SIZE,
+                fetch=statements["returning"]
+            )
+            return result or []
+
+        if len(rows) >= COPY_MIN_ROWS:
+            buf = io.StringIO()
+            for row in rows:
+                buf.write('\t'.join(map(_copy_value, row)))
+                buf.write('\n')
+            buf.seek(0)
+            self.cur.copy_expert(statements["copy"], buf)
+            self.cur.execute(statements["upsert"])
+        else:
+            # psycopg2 không có pipeline mode: ghép câu lệnh nạp bảng tạm và câu lệnh upsert
+            # thành một lần gửi duy nhất tới server (kết quả RETURNING là của câu lệnh cuối)
+            values = b", ".join(self.cur.mogrify(statements["template"], row) for row in rows)
+            self.cur.execute(statements["stage"] + values + b";\n" + statements["upsert"])
+        return self.cur.fetchall() if statements["returning"] else []
+
+    def _process_post(self, post_data, position=None):
+        """
+            Xử lý dữ liệu bài viết và đưa vào batch chờ ghi vào PostgreSQL
+
+            Args:
+                post_data (dict): Dữ liệu bài viết từ Kafka
+                position (tuple, optional): (TopicPartition, offset) của tin nhắn; không dùng vì bài viết
+                    luôn được ghi trong batch của nó (cùng chữ ký với _process_comment)
         """
 
-        logger.debug(f"Xử lý bình luận: {comment_data.get('id')}")
+        if not post_data or not post_data.get('id'):
+            return
+
+        # Định dạng kiểu % để chuỗi log chỉ được tạo khi mức DEBUG được bật (hàm chạy cho mọi tin nhắn)
+        logger.debug("Xử lý bài viết: %s", post_data['id'])
 
         try:
-            # Bổ sung logic để fix lỗi insert or update comment
-            post_id = comment_data.get('post_id')
-            self.cur.execute(
-                "SELECT COUNT(*) FROM reddit_data.posts WHERE post_id = %s",
-                (post_id,)
+            # Dòng dữ liệu bài viết theo thứ tự cột của câu lệnh INSERT trong _flush_buffers,
+            # map với hai danh sách gọi post_data.get(trường, giá trị mặc định) cho từng trường.
+            # Cột subreddit_id tạm giữ tên subreddit, được đổi thành id trên thread ghi
+            post_id = post_data['id']
+            self._post_buf[post_id] = (
+                post_id,
+                post_data.get('subreddit'),
+                *map(post_data.get, POST_FIELDS, POST_FIELD_DEFAULTS)
             )
-            post_exists = self.cur.fetchone()[0] > 0
 
-            if not post_exists:
-                logger.warning(f"Bỏ qua bình luận {comment_data.get('id')} vì bài viết {post_id} không tồn tại")
-                return
+        except Exception as e:
+            logger.error(f"Lỗi khi xử lý bài viết {post_data.get('id')}: {str(e)}")
+            raise
 
-            # Chèn thêm hoặc cập nhật dữ liệu bình luận
-            self.cur.execute("""
-                INSERT INTO reddit_data.comments (
-                    comment_id, post_id, parent_id, body, author, score,
-                    created_utc, created_date, is_submitter, collected_utc
-                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                ON CONFLICT (comment_id)
-                DO UPDATE SET
-                    score = EXCLUDED.score,
-                    collected_utc = EXCLUDED.collected_utc;
-            """,(
-                comment_data.get('id'),
-                comment_data.get('post_id'),
-                comment_data.get('parent_id'),
-                comment_data.get('body'),
-                comment_data.get('author'),
-                comment_data.get('score'),
-                comment_data.get('created_utc'),
-                comment_data.get('created_date'),
-                comment_data.get('is_submitter', False),
-                comment_data.get('collected_utc')
-            ))
-
-            # Cập nhật bảng user_activity
-            self._update_user_activity(comment_data.get('author'), is_post=False)
-
-            logger.debug(f"Đã lưu bình luận {comment_data.get('id')} vào PostgreSQL")
+    def _process_comment(self, comment_data, position=None):
+        """
+            Xử lý dữ liệu bình luận và đưa vào batch chờ ghi vào PostgreSQL
+
+            Args:
+                comment_data (dict): Dữ liệu bình luận từ Kafka
+                position (tuple, optional): (TopicPartition, offset) của tin nhắn, giữ lại để không commit
+                    offset vượt qua bình luận bị hoãn
+        """
+
+        if not comment_data or not comment_data.get('id'):
+            return
+
+        logger.debug("Xử lý bình luận: %s", comment_data['id'])
+
+        try:
+            # Dòng dữ liệu bình luận theo thứ tự cột của câu lệnh INSERT trong _flush_buffers,
+            # việc kiểm tra bài viết tồn tại được thực hiện một lần cho cả batch khi ghi
+            comment_id = comment_data['id']
+            self._comment_buf[comment_id] = tuple(map(comment_data.get, COMMENT_FIELDS, COMMENT_FIELD_DEFAULTS))
+            if position is not None:
+                self._comment_pos[comment_id] = position
 
         except Exception as e:
             logger.error(f"Lỗi khi xử lý bình luận {comment_data.get('id')}: {str(e)}")
@@ -222,34 +784,42 @@ class RedditDataConsumer:
 
            Args:
                subreddit_name (str): Tên subreddit
+
+           Returns:
+               int: subreddit_id của subreddit, None nếu không có tên
         """
         if not subreddit_name:
-            return
+            return None
+
+        subreddit_id = self._subreddit_ids.get(subreddit_name)
+        if subreddit_id is not None:
+            return subreddit_id
 
         try:
-            # Kiểm tra xem subreddit đã tồn tại hay chưa
-            self.cur.execute(
-                "SELECT COUNT(*) FROM reddit_data.subreddits WHERE name = %s",
-                (subreddit_name,)
-            )
-            count = self.cur.fetchone()[0]
-
-            # Nếu chưa tồn tại, thêm mới
-            if count == 0:
-                self.cur.execute(
-                    "INSERT INTO reddit_data.subreddits (name) VALUES (%s) RETURNING subreddit_id",
-                    (subreddit_name,)
-                )
-                self.conn.commit()
+            # Chưa có trong cache: thêm mới (hoặc lấy id nếu consumer khác vừa thêm) bằng một câu lệnh
+            self.cur.execute("""
+                INSERT INTO reddit_data.subreddits (name) VALUES (%s)
+                ON CONFLICT (name) DO UPDATE SET name = EXCLUDED.name
+                RETURNING subreddit_id, (xmax = 0) AS inserted
+            """, (subreddit_name,))
+            subreddit_id, inserted = self.cur.fetchone()
+
+            # Commit trước khi đưa vào cache để id không bị mất nếu batch sau đó bị rollback
+            self.conn.commit()
+            self._subreddit_ids[subreddit_name] = subreddit_id
+            if inserted:
                 logger.info(f"Đã thêm subreddit mới: {subreddit_name}")
 
+            return subreddit_id
+
         except Exception as e:
             logger.error(f"Lỗi khi kiểm tra / thêm subreddit {subreddit_name}: {str(e)}")
             raise
 
     def _update_user_activity(self, username, is_post=False):
         """
-            Cập nhật hoặc thêm mới vào bảng user_activity
+            Cộng dồn hoạt động của người dùng vào batch, được ghi vào bảng user_activity
+            bằng một câu lệnh trong _flush_user_activity
 
             Args:
                 username (str): Tên người dùng
@@ -258,51 +828,38 @@ class RedditDataConsumer:
         if not username or username == "[deleted]":
             return
 
-        try:
-            self.cur.execute(
-                "SELECT user_id, post_count, comment_count FROM reddit_data.user_activity WHERE username = %s",
-                (username, )
-            )
-            result = self.cur.fetchone()
-
-            current_time = time.strftime('%Y-%m-%d %H:%M:%S')
-
-            if not result:
-                self.cur.execute("""
-                    INSERT INTO reddit_data.user_activity (
-                        username, post_count, comment_count, first_seen, last_seen
-                    ) VALUES (%s, %s, %s, %s, %s)
-                """, (
-                    username,
-                    1 if is_post else 0,
-                    0 if is_post else 1,
-                    current_time,
-                    current_time
-                ))
-            else:
-                user_id, post_count, comment_count = result
-                self.cur.execute("""
-                    UPDATE reddit_data.user_activity
-                    SET post_count = %s,
-                        comment_count = %s,
-                        last_seen = %s
-                    WHERE user_id = %s
-                """, (
-                    post_count + 1 if is_post else post_count,
-                    comment_count + 1 if not is_post else comment_count,
-                    current_time,
-                    user_id
-                ))
-        except Exception as e:
-            logger.error(f"Lỗi khi cập nhật hoạt động người dùng {username}: {str(e)}")
+        # Một lần tra dict, cộng vào vị trí 0 (bài viết) hoặc 1 (bình luận)
+        self._user_delta.setdefault(username, [0, 0])[not is_post] += 1
+
+    def _flush_user_activity(self):
+        """
+            Thêm mới hoặc cộng dồn hoạt động của các người dùng trong batch vào bảng user_activity
+        """
+        if not self._user_delta:
+            return
+
+        # Sắp xếp theo username để các consumer chạy song song khóa dòng theo cùng thứ tự
+        rows = [
+            (username, post_count, comment_count)
+            for username, (post_count, comment_count) in sorted(self._user_delta.items())
+        ]
+        # Thời điểm first_seen / last_seen lấy từ NOW() của PostgreSQL thay vì định dạng chuỗi thời gian ở Python
+        execute_values(self.cur, """
+            INSERT INTO reddit_data.user_activity (
+                username, post_count, comment_count, first_seen, last_seen
+            ) VALUES %s
+            ON CONFLICT (username)
+            DO UPDATE SET
+                post_count = user_activity.post_count + EXCLUDED.post_count,
+                comment_count = user_activity.comment_count + EXCLUDED.comment_count,
+                last_seen = EXCLUDED.last_seen
+        """, rows, template="(%s, %s, %s, NOW(), NOW())", page_size=INSERT_PAGE_SIZE)
 
     def close(self):
         """Đóng kết nối PostgreSQL và Kafka consumer"""
         try:
-            if hasattr(self, 'cur') and self.cur:
-                self.cur.close()
-            if hasattr(self, 'conn') and self.conn:
-                self.conn.close()
+            if hasattr(self, 'pool') and self.pool and not self.pool.closed:
+                self.pool.closeall()
             if hasattr(self, 'consumer') and self.consumer:
                 self.consumer.close()
             logger.info("Đã đóng tất cả các kết nối")
@@ -310,5 +867,37 @@ class RedditDataConsumer:
             logger.error(f"Lỗi khi đóng kết nối: {str(e)}")
 
 
+def run_consumers(num_workers=2, **consumer_kwargs):
+    """
+        Chạy nhiều consumer trong cùng consumer group, mỗi consumer một thread
+        với Kafka consumer và pool kết nối PostgreSQL riêng (hai loại này không an toàn khi dùng chung giữa các thread)
 
+        Kafka chia các partition của các topic cho các consumer, nên số worker hữu ích
+        tối đa bằng tổng số partition
 
+        Args:
+            num_workers (int): Số consumer chạy song song
+            **consumer_kwargs: Tham số khởi tạo RedditDataConsumer
+    """
+    consumers = []
+    try:
+        for _ in range(num_workers):
+            consumers.append(RedditDataConsumer(**consumer_kwargs))
+    except Exception:
+        for consumer in consumers:
+            consumer.close()
+        raise
+
+    logger.info(f"Chạy {num_workers} consumer song song")
+    executor = ThreadPoolExecutor(max_workers=num_workers)
+    try:
+        futures = [executor.submit(consumer.process_data) for consumer in consumers]
+        for future in futures:
+            future.result()
+    except KeyboardInterrupt:
+        logger.info("Nhận được tín hiệu ngắt, dừng các consumer")
+    finally:
+        # Mỗi consumer ghi nốt batch đang giữ và tự đóng kết nối khi thoát vòng lặp
+        for consumer in consumers:
+            consumer.stop()
+        executor.shutdown(wait=True)
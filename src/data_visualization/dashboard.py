@@ -12,14 +12,12 @@ import networkx as nx
 from datetime import datetime, timedelta
 import flask
 from flask_caching import Cache
-import psycopg2
-import psycopg2.extras
 from wordcloud import WordCloud
 import plotly.figure_factory as ff
 import base64
 from io import BytesIO
-import matplotlib.pyplot as plt
 from sqlalchemy import create_engine
+from sqlalchemy.engine import URL
 import json
 from dash.dependencies import Input, Output, State, ALL
 
@@ -27,7 +25,8 @@ from dash.dependencies import Input, Output, State, ALL
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 
 from src.utils.config import (
-    POSTGRES_HOST, POSTGRES_PORT, POSTGRES_DB, POSTGRES_USER, POSTGRES_PASSWORD
+    POSTGRES_HOST, POSTGRES_PORT, POSTGRES_DB, POSTGRES_USER, POSTGRES_PASSWORD,
+    REDIS_URL, DASHBOARD_CACHE_DIR
 )
 from src.utils.logger import setup_logger
 
@@ -61,14 +60,14 @@ class RedditDashboard:
         self.app.title = "Reddit Data Engineering Analytics Dashboard"
 
         # Khởi tạo cache
-        self.cache = Cache(self.app.server, config={
-            'CACHE_TYPE': 'filesystem',
-            'CACHE_DIR': 'cache-directory',
-            'CACHE_DEFAULT_TIMEOUT': 300  # 5 phút
-        })
+        self.cache = Cache(self.app.server, config=self._cache_config())
+
+        # Khởi tạo pool kết nối database (các callback chạy song song dùng các kết nối khác nhau)
+        self.engine = self._create_db_engine()
 
-        # Khởi tạo kết nối database
-        self.db_connection = self._create_db_connection()
+        # Danh sách cho các dropdown ít thay đổi, chỉ truy vấn một lần khi khởi động
+        self._subreddit_options = self._get_subreddit_options()
+        self._tech_options = self._get_tech_options()
 
         # Thiết lập layout
         self.app.layout = self._create_layout()
@@ -76,27 +75,96 @@ class RedditDashboard:
         # Đăng ký các callback
         self._register_callbacks()
 
-    def _create_db_connection(self):
+    def _cache_config(self):
         """
-        Tạo kết nối đến PostgreSQL
+        Cấu hình Flask-Caching: Redis (dùng chung giữa các worker, không đọc file mỗi lần hit)
+        khi có REDIS_URL, nếu không thì cache file trong thư mục tmpfs
 
         Returns:
-            connection: Kết nối PostgreSQL
+            dict: Cấu hình cho Cache
+        """
+        if REDIS_URL:
+            logger.info("Dùng Redis làm cache cho dashboard")
+            return {
+                'CACHE_TYPE': 'RedisCache',
+                'CACHE_REDIS_URL': REDIS_URL,
+                'CACHE_KEY_PREFIX': 'reddit_dash:',
+                'CACHE_DEFAULT_TIMEOUT': 300  # 5 phút
+            }
+
+        return {
+            'CACHE_TYPE': 'FileSystemCache',
+            'CACHE_DIR': DASHBOARD_CACHE_DIR,
+            'CACHE_DEFAULT_TIMEOUT': 300  # 5 phút
+        }
+
+    def _create_db_engine(self):
+        """
+        Tạo SQLAlchemy engine với pool kết nối đến PostgreSQL
+
+        Returns:
+            Engine: SQLAlchemy engine
         """
         try:
-            conn = psycopg2.connect(
-                host=POSTGRES_HOST,
-                port=POSTGRES_PORT,
-                dbname=POSTGRES_DB,
-                user=POSTGRES_USER,
-                password=POSTGRES_PASSWORD
+            engine = create_engine(
+                URL.create(
+                    "postgresql+psycopg2",
+                    username=POSTGRES_USER,
+                    password=POSTGRES_PASSWORD,
+                    host=POSTGRES_HOST,
+                    port=POSTGRES_PORT,
+                    database=POSTGRES_DB
+                ),
+                pool_size=16,
+                max_overflow=8,
+                pool_recycle=1800,
+                # Kiểm tra kết nối trước khi dùng để bỏ qua kết nối đã bị PostgreSQL đóng
+                pool_pre_ping=True,
+                connect_args={'application_name': 'reddit_dashboard'}
             )
+
+            # Mở thử một kết nối để báo lỗi ngay khi khởi động như trước
+            with engine.connect():
+                pass
             logger.info("Kết nối thành công đến PostgreSQL")
-            return conn
+            return engine
         except Exception as e:
             logger.error(f"Lỗi khi kết nối đến PostgreSQL: {str(e)}")
             raise
 
+    def _read_sql(self, query, params=None):
+        """
+        Chạy truy vấn trên một kết nối mượn từ pool và trả về DataFrame
+
+        Args:
+            query (str): Câu truy vấn SQL (placeholder %s)
+            params (list|tuple, optional): Tham số của truy vấn
+
+        Returns:
+            DataFrame: Kết quả truy vấn
+        """
+        # exec_driver_sql hiểu list là nhiều bộ tham số, nên một bộ tham số phải là tuple
+        if isinstance(params, list):
+            params = tuple(params)
+        with self.engine.connect() as conn:
+            return pd.read_sql_query(query, conn, params=params)
+
+    def _fetch_rows(self, query, params=None, as_dict=False):
+        """
+        Chạy truy vấn trên một kết nối mượn từ pool và trả về các dòng kết quả
+
+        Args:
+            query (str): Câu truy vấn SQL (placeholder %s)
+            params (list|tuple, optional): Tham số của truy vấn
+            as_dict (bool): Trả về các dòng dạng dict (truy cập theo tên cột)
+
+        Returns:
+            list: Các dòng kết quả
+        """
+        with self.engine.connect() as conn:
+            result = conn.exec_driver_sql(query, tuple(params) if params is not None else ())
+            return result.mappings().all() if as_dict else result.all()
+
     def _create_layout(self):
         """
         Tạo layout cho dashboard
@@ -146,7 +214,7 @@ class RedditDashboard:
                                 html.Label("Subreddit:", className="font-weight-bold"),
                                 dcc.Dropdown(
                                     id="subreddit-filter",
-                                    options=self._get_subreddit_options(),
+                                    options=self._subreddit_options,
                                     value="dataengineering",
                                     multi=True,
                                     className="w-100"
@@ -188,6 +256,9 @@ class RedditDashboard:
                 dbc.Tabs([
                     # Tab Tổng quan
                     dbc.Tab([
+                        # Số liệu KPI thô từ server, được định dạng ở trình duyệt
+                        dcc.Store(id="overview-stats-store"),
+
                         # Row 1: KPI Cards
                         dbc.Row([
                             # Tổng số bài viết
@@ -522,7 +593,7 @@ class RedditDashboard:
                                                 html.Label("Chọn công nghệ:", className="font-weight-bold"),
                                                 dcc.Dropdown(
                                                     id="tech-trend-dropdown",
-                                                    options=self._get_tech_options(),
+                                                    options=self._tech_options,
                                                     value=self._get_default_tech_values(),
                                                     multi=True,
                                                     className="w-100"
@@ -830,7 +901,7 @@ class RedditDashboard:
                                                 html.Label("Chọn công nghệ:", className="font-weight-bold"),
                                                 dcc.Dropdown(
                                                     id="sentiment-tech-dropdown",
-                                                    options=self._get_tech_options(),
+                                                    options=self._tech_options,
                                                     value=self._get_default_tech_values(3),
                                                     multi=True,
                                                     className="w-100"
@@ -913,11 +984,7 @@ class RedditDashboard:
                 list: Danh sách options cho dropdown
         """
         try:
-            cursor = self.db_connection.cursor()
-            cursor.execute("SELECT name FROM reddit_data.subreddits ORDER BY name")
-
-            subreddits = cursor.fetchall()
-            cursor.close()
+            subreddits = self._fetch_rows("SELECT name FROM reddit_data.subreddits ORDER BY name")
 
             options = [{"label": sub[0], "value": sub[0]} for sub in subreddits]
             if not options:
@@ -936,8 +1003,7 @@ class RedditDashboard:
                     list: Danh sách options cho dropdown
                 """
         try:
-            cursor = self.db_connection.cursor()
-            cursor.execute("""
+            technologies = self._fetch_rows("""
                         SELECT tech_name, SUM(mention_count) as total_mentions
                         FROM reddit_data.tech_trends
                         GROUP BY tech_name
@@ -945,9 +1011,6 @@ class RedditDashboard:
                         LIMIT 100
                     """)
 
-            technologies = cursor.fetchall()
-            cursor.close()
-
             # Format options cho dropdown
             options = [{"label": tech[0], "value": tech[0]} for tech in technologies]
 
@@ -983,41 +1046,18 @@ class RedditDashboard:
             Returns:
                 list: Danh sách công nghệ mặc định
         """
-        try:
-            cursor = self.db_connection.cursor()
-            cursor.execute("""
-                SELECT tech_name
-                FROM (
-                    SELECT tech_name, SUM(mention_count) as total_mentions
-                    FROM reddit_data.tech_trends
-                    GROUP BY tech_name
-                    ORDER BY total_mentions DESC
-                    LIMIT %s
-                ) t
-            """, (count,))
-
-            technologies = cursor.fetchall()
-            cursor.close()
-
-            return [tech[0] for tech in technologies] if technologies else ["hadoop", "spark", "postgresql", "airflow",
-                                                                            "kafka"][:count]
-        except Exception as e:
-            logger.error(f"Lỗi khi lấy danh sách công nghệ mặc định: {str(e)}")
-            return ["hadoop", "spark", "postgresql", "airflow", "kafka"][:count]
+        # Options công nghệ đã được sắp xếp theo tổng số lần đề cập, lấy count công nghệ đầu
+        # thay vì truy vấn lại cùng một phép tổng hợp
+        return [option["value"] for option in self._tech_options[:count]]
 
     def _register_callbacks(self):
         """
         Đăng ký các callback cho dashboard
         """
         # Thêm các callbacks cho tab Tổng quan
-        # Callback cho KPI Cards
+        # Callback cho KPI Cards: server chỉ đếm, việc định dạng số chạy ở trình duyệt
         self.app.callback(
-            [
-                Output("total-posts-count", "children"),
-                Output("total-comments-count", "children"),
-                Output("total-topics-count", "children"),
-                Output("total-techs-count", "children")
-            ],
+            Output("overview-stats-store", "data"),
             [
                 Input("date-range", "start_date"),
                 Input("date-range", "end_date"),
@@ -1025,6 +1065,27 @@ class RedditDashboard:
             ]
         )(self._update_overview_stats)
 
+        self.app.clientside_callback(
+            """
+            function(stats) {
+                if (!stats) {
+                    return window.dash_clientside.no_update;
+                }
+                // Thêm dấu cách ngăn cách hàng nghìn, giữ nguyên "N/A" khi server lỗi
+                return stats.map(function(num) {
+                    return typeof num === "number" ? String(num).replace(/\\B(?=(\\d{3})+(?!\\d))/g, " ") : num;
+                });
+            }
+            """,
+            [
+                Output("total-posts-count", "children"),
+                Output("total-comments-count", "children"),
+                Output("total-topics-count", "children"),
+                Output("total-techs-count", "children")
+            ],
+            Input("overview-stats-store", "data")
+        )
+
         # Callback cho biểu đồ hoạt động theo thời gian
         self.app.callback(
             Output("activity-trend-graph", "figure"),
@@ -1245,7 +1306,16 @@ class RedditDashboard:
         )(self._update_sentiment_examples)
 
     def _update_overview_stats(self, start_date, end_date, subreddits):
-        """Cập nhật các thống kê tổng quan"""
+        """Cập nhật các thống kê tổng quan (số liệu thô, được định dạng bởi clientside callback)"""
+        # Tạo cache key
+        subreddits_str = "_".join(sorted(subreddits)) if subreddits else "all"
+        cache_key = f"overview_stats_{start_date}_{end_date}_{subreddits_str}"
+
+        # Kiểm tra cache
+        cached_data = self.cache.get(cache_key)
+        if cached_data is not None:
+            return cached_data
+
         try:
             subreddit_condition = ""
             params = [start_date, end_date]
@@ -1255,75 +1325,53 @@ class RedditDashboard:
                 subreddit_condition = f" AND s.name IN ({placeholders})"
                 params.extend(subreddits)
 
-            # Truy vấn số lượng bài viết
-            query_posts = f"""
-                SELECT COUNT(DISTINCT p.post_id) as count
-                FROM reddit_data.posts p
-                JOIN reddit_data.subreddits s ON p.subreddit_id = s.subreddit_id
-                WHERE p.created_date BETWEEN %s AND %s
-                {subreddit_condition}
-            """
-
-            # Truy vấn số lượng bình luận
-            query_comments = f"""
-                SELECT COUNT(DISTINCT c.comment_id) as count
-                FROM reddit_data.comments c
-                JOIN reddit_data.posts p ON c.post_id = p.post_id
-                JOIN reddit_data.subreddits s ON p.subreddit_id = s.subreddit_id
-                WHERE p.created_date BETWEEN %s AND %s
-                {subreddit_condition}
-            """
-
-            # Truy vấn số lượng chủ đề
-            query_topics = f"""
-                SELECT COUNT(DISTINCT t.topic) as count
-                FROM (
-                    SELECT unnest(pa.topics) as topic
-                    FROM reddit_data.post_analysis pa
-                    JOIN reddit_data.posts p ON pa.post_id = p.post_id
+            # Cả bốn số liệu trong một truy vấn: bài viết được lọc một lần trong CTE và dùng lại
+            # cho số bình luận và số chủ đề (post_id, comment_id là khóa chính nên không cần DISTINCT)
+            query = f"""
+                WITH filtered_posts AS (
+                    SELECT p.post_id
+                    FROM reddit_data.posts p
                     JOIN reddit_data.subreddits s ON p.subreddit_id = s.subreddit_id
                     WHERE p.created_date BETWEEN %s AND %s
                     {subreddit_condition}
-                    AND pa.topics IS NOT NULL
-                ) t
-            """
-
-            # Truy vấn số lượng công nghệ
-            query_techs = f"""
-                SELECT COUNT(DISTINCT tech_name) as count
-                FROM reddit_data.tech_trends t
-                JOIN reddit_data.subreddits s ON t.subreddit_id = s.subreddit_id
-                WHERE t.week_start BETWEEN %s AND %s
-                {subreddit_condition}
+                )
+                SELECT
+                    (SELECT COUNT(*) FROM filtered_posts) AS total_posts,
+                    (
+                        SELECT COUNT(*)
+                        FROM reddit_data.comments c
+                        JOIN filtered_posts fp ON c.post_id = fp.post_id
+                    ) AS total_comments,
+                    (
+                        SELECT COUNT(DISTINCT t.topic)
+                        FROM reddit_data.post_analysis pa
+                        JOIN filtered_posts fp ON pa.post_id = fp.post_id
+                        CROSS JOIN LATERAL unnest(pa.topics) AS t(topic)
+                        WHERE pa.topics IS NOT NULL
+                    ) AS total_topics,
+                    (
+                        SELECT COUNT(DISTINCT tech_name)
+                        FROM reddit_data.tech_trends t
+                        JOIN reddit_data.subreddits s ON t.subreddit_id = s.subreddit_id
+                        WHERE t.week_start BETWEEN %s AND %s
+                        {subreddit_condition}
+                    ) AS total_techs
             """
 
-            cur = self.db_connection.cursor()
-
-            cur.execute(query_posts, params)
-            total_posts = cur.fetchone()[0]
-
-            cur.execute(query_comments, params)
-            total_comments = cur.fetchone()[0]
+            # Điều kiện lọc xuất hiện hai lần (bài viết và tech_trends)
+            total_posts, total_comments, total_topics, total_techs = self._fetch_rows(query, params * 2)[0]
 
-            cur.execute(query_topics, params)
-            total_topics = cur.fetchone()[0]
+            stats = [total_posts, total_comments, total_topics, total_techs]
 
-            cur.execute(query_techs, params)
-            total_techs = cur.fetchone()[0]
-
-            cur.close()
-
-            # Format để hiển thị (thêm dấu phẩy cho số hàng nghìn)
-            def format_number(num):
-                return f"{num:,}".replace(",", " ")
+            # Lưu vào cache
+            self.cache.set(cache_key, stats, timeout=300)  # Cache trong 5 phút
 
-            return format_number(total_posts), format_number(total_comments), format_number(
-                total_topics), format_number(total_techs)
+            return stats
         except Exception as e:
             logger.error(f"Lỗi khi cập nhật thống kê tổng quan: {str(e)}")
             import traceback
             logger.error(traceback.format_exc())
-            return "N/A", "N/A", "N/A", "N/A"
+            return ["N/A", "N/A", "N/A", "N/A"]
 
     def _update_activity_trend_graph(self, start_date, end_date, subreddits):
         """
@@ -1356,20 +1404,22 @@ class RedditDashboard:
                 time_unit = "week"
                 time_format = "%U/%Y"
 
-            # Tạo phần điều kiện lọc subreddit
+            # Tạo phần điều kiện lọc subreddit (đơn vị thời gian cũng là tham số để câu truy vấn không đổi)
             subreddit_condition = ""
-            params = [start_date, end_date]
+            params = [time_unit, start_date, end_date]
 
             if subreddits and len(subreddits) > 0 and not (len(subreddits) == 1 and subreddits[0] == "all"):
                 placeholders = ",".join(["%s"] * len(subreddits))
                 subreddit_condition = f" AND s.name IN ({placeholders})"
                 params.extend(subreddits)
 
-            # Truy vấn số lượng bài viết theo thời gian
+            # Truy vấn số lượng bài viết theo thời gian, gom nhóm ngay trong PostgreSQL.
+            # COUNT(*) (post_id là khóa chính) chỉ cần created_date, subreddit_id nên có thể
+            # quét chỉ trên index idx_posts_created_date_subreddit
             query = f"""
                 SELECT 
-                    DATE_TRUNC('{time_unit}', p.created_date)::date as time_period,
-                    COUNT(p.post_id) as post_count
+                    DATE_TRUNC(%s, p.created_date)::date as time_period,
+                    COUNT(*) as post_count
                 FROM 
                     reddit_data.posts p
                     JOIN reddit_data.subreddits s ON p.subreddit_id = s.subreddit_id
@@ -1383,7 +1433,7 @@ class RedditDashboard:
             """
 
             # Thực hiện truy vấn
-            df = pd.read_sql_query(query, self.db_connection, params=params)
+            df = self._read_sql(query, params=params)
 
             if df.empty:
                 return {
@@ -1468,7 +1518,7 @@ class RedditDashboard:
             """
 
             # Thực hiện truy vấn
-            df = pd.read_sql_query(query, self.db_connection, params=[start_date, end_date])
+            df = self._read_sql(query, params=[start_date, end_date])
 
             if df.empty:
                 return {
@@ -1584,7 +1634,7 @@ class RedditDashboard:
             """
 
             # Thực hiện truy vấn
-            df = pd.read_sql_query(query, self.db_connection, params=params)
+            df = self._read_sql(query, params=params)
 
             if df.empty:
                 return {
@@ -1689,7 +1739,7 @@ class RedditDashboard:
             """
 
             # Thực hiện truy vấn
-            df = pd.read_sql_query(query, self.db_connection, params=params)
+            df = self._read_sql(query, params=params)
 
             if df.empty:
                 return {
@@ -1816,7 +1866,7 @@ class RedditDashboard:
         query += " GROUP BY topic ORDER BY count DESC"
 
         try:
-            df = pd.read_sql(query, self.db_connection, params=params)
+            df = self._read_sql(query, params=params)
 
             # Lưu vào cache
             self.cache.set(cache_key, df, timeout=300)  # Cache trong 5 phút
@@ -1870,7 +1920,7 @@ class RedditDashboard:
         query += " GROUP BY topic ORDER BY count DESC"
 
         try:
-            df = pd.read_sql(query, self.db_connection, params=params)
+            df = self._read_sql(query, params=params)
 
             # Lưu vào cache
             self.cache.set(cache_key, df, timeout=300)  # Cache trong 5 phút
@@ -1891,7 +1941,7 @@ class RedditDashboard:
                 FROM information_schema.columns 
                 WHERE table_schema = 'reddit_data' AND table_name = 'tech_trends'
             """
-            structure_df = pd.read_sql(structure_query, self.db_connection)
+            structure_df = self._read_sql(structure_query)
             logger.info(f"Cấu trúc bảng tech_trends: {structure_df.to_dict('records')}")
 
             # Kiểm tra dữ liệu
@@ -1903,7 +1953,7 @@ class RedditDashboard:
                     MAX(week_start) as latest_date
                 FROM reddit_data.tech_trends
             """
-            data_df = pd.read_sql(data_query, self.db_connection)
+            data_df = self._read_sql(data_query)
             logger.info(f"Thông tin dữ liệu tech_trends: {data_df.to_dict('records')}")
 
             # Kiểm tra phân phối theo thời gian
@@ -1915,7 +1965,7 @@ class RedditDashboard:
                 GROUP BY month
                 ORDER BY month
             """
-            time_df = pd.read_sql(time_query, self.db_connection)
+            time_df = self._read_sql(time_query)
             logger.info(f"Phân phối theo thời gian: {time_df.to_dict('records')}")
 
             # Trả về True nếu có dữ liệu
@@ -2025,7 +2075,7 @@ class RedditDashboard:
     #             f"Executing query with params: start_date={start_date}, end_date={end_date}, min_mentions={min_mentions}")
     #
     #         # Thực hiện truy vấn
-    #         df = pd.read_sql(query, self.db_connection, params=[start_date, end_date, min_mentions])
+    #         df = self._read_sql(query, params=[start_date, end_date, min_mentions])
     #         logger.info(f"Query returned {len(df)} rows")
     #
     #         # Log sample data
@@ -2145,7 +2195,7 @@ class RedditDashboard:
                 f"Query parameters: current_start={current_start_str}, current_end={current_end_str}, min_mentions={min_mentions}, previous_start={previous_start_str}, previous_end={previous_end_str}")
 
             # Thực hiện truy vấn với các tham số chính xác
-            df = pd.read_sql(query, self.db_connection, params=(
+            df = self._read_sql(query, params=(
                 current_start_str, current_end_str, min_mentions, previous_start_str, previous_end_str
             ))
 
@@ -2206,7 +2256,7 @@ class RedditDashboard:
                     growth_percent DESC NULLS LAST
                 """
 
-                df = pd.read_sql(query, self.db_connection)
+                df = self._read_sql(query)
                 logger.info(f"Thử lại thành công: {len(df)} rows returned")
 
                 # Lưu vào cache
@@ -2276,7 +2326,7 @@ class RedditDashboard:
         """
 
         try:
-            df = pd.read_sql(query, self.db_connection, params=params)
+            df = self._read_sql(query, params=params)
 
             # Lưu vào cache
             self.cache.set(cache_key, df, timeout=300)  # Cache trong 5 phút
@@ -2344,7 +2394,7 @@ class RedditDashboard:
         """
 
         try:
-            df = pd.read_sql(query, self.db_connection, params=params)
+            df = self._read_sql(query, params=params)
 
             # Lưu vào cache
             self.cache.set(cache_key, df, timeout=300)  # Cache trong 5 phút
@@ -2404,7 +2454,7 @@ class RedditDashboard:
         params = [threshold]
 
         try:
-            df = pd.read_sql(query, self.db_connection, params=params)
+            df = self._read_sql(query, params=params)
 
             # Lưu vào cache
             self.cache.set(cache_key, df, timeout=300)  # Cache trong 5 phút
@@ -2462,7 +2512,7 @@ class RedditDashboard:
         """
 
         try:
-            df = pd.read_sql(query, self.db_connection, params=params)
+            df = self._read_sql(query, params=params)
 
             # Lưu vào cache
             self.cache.set(cache_key, df, timeout=300)  # Cache trong 5 phút
@@ -2512,7 +2562,7 @@ class RedditDashboard:
         params = [start_date, end_date, min_mentions]
 
         try:
-            df = pd.read_sql(query, self.db_connection, params=params)
+            df = self._read_sql(query, params=params)
 
             # Lưu vào cache
             self.cache.set(cache_key, df, timeout=300)  # Cache trong 5 phút
@@ -2563,7 +2613,7 @@ class RedditDashboard:
         params = [start_date, end_date, tech_name]
 
         try:
-            df = pd.read_sql(query, self.db_connection, params=params)
+            df = self._read_sql(query, params=params)
 
             # Lưu vào cache
             self.cache.set(cache_key, df, timeout=300)  # Cache trong 5 phút
@@ -2613,58 +2663,75 @@ class RedditDashboard:
             logger.error(f"Lỗi khi cập nhật nút chủ đề: {str(e)}")
             return html.Div(f"Lỗi khi tạo danh sách chủ đề: {str(e)}", className="text-danger")
 
+    def _render_wordcloud_b64(self, start_date, end_date, subreddits, item_count):
+        """
+        Vẽ WordCloud chủ đề thành ảnh PNG base64, kết quả được cache theo bộ lọc
+
+        Args:
+            start_date (str): Ngày bắt đầu
+            end_date (str): Ngày kết thúc
+            subreddits (list): Danh sách subreddit
+            item_count (int): Số chủ đề tối đa
+
+        Returns:
+            str: Ảnh PNG mã hóa base64, None nếu không có dữ liệu
+        """
+        # Tạo cache key
+        subreddits_str = "_".join(sorted(subreddits)) if subreddits else "all"
+        cache_key = f"wordcloud_{start_date}_{end_date}_{subreddits_str}_{item_count}"
+
+        # Kiểm tra cache
+        cached_data = self.cache.get(cache_key)
+        if cached_data is not None:
+            return cached_data
+
+        # Lấy dữ liệu (tần suất chủ đề đã được tổng hợp bằng SQL)
+        df = self._get_topics_data(start_date, end_date, subreddits)
+        if df.empty:
+            return None
+
+        # Giới hạn số lượng chủ đề
+        df = df.head(item_count)
+
+        # Tạo từ điển tần suất cho WordCloud
+        topic_freq = dict(zip(df['topic'], df['count']))
+
+        # Tạo WordCloud với màu sắc đẹp hơn
+        wordcloud = WordCloud(
+            width=800,
+            height=400,
+            background_color='white',
+            max_words=item_count,
+            prefer_horizontal=1.0,
+            colormap='viridis',
+            contour_width=1,
+            contour_color='#5a5a5a'
+        ).generate_from_frequencies(topic_freq)
+
+        # Ghi thẳng ảnh PIL của WordCloud ra PNG (tiêu đề đã có ở card header, không cần vẽ lại
+        # bằng matplotlib); nén mức 1 vì ảnh chỉ hiển thị tạm thời trên dashboard
+        buffer = BytesIO()
+        wordcloud.to_image().save(buffer, format='PNG', compress_level=1)
+
+        # Chuyển đổi thành base64 để hiển thị trong Dash
+        img_str = base64.b64encode(buffer.getvalue()).decode()
+
+        # Lưu vào cache
+        self.cache.set(cache_key, img_str, timeout=600)  # Cache trong 10 phút
+
+        return img_str
+
     def _update_wordcloud(self, start_date, end_date, subreddits, item_count):
         """
         Cập nhật WordCloud chủ đề với cải tiến hiển thị
         """
         try:
-            # Lấy dữ liệu
-            df = self._get_topics_data(start_date, end_date, subreddits)
+            img_str = self._render_wordcloud_b64(start_date, end_date, subreddits, item_count)
 
-            if df.empty:
+            if img_str is None:
                 return html.Div("Không có dữ liệu về chủ đề trong khoảng thời gian được chọn.",
                                 style={'text-align': 'center', 'margin-top': '20px', 'color': '#6c757d'})
 
-            # Giới hạn số lượng chủ đề
-            df = df.head(item_count)
-
-            # Tạo từ điển tần suất cho WordCloud
-            topic_freq = {row['topic']: row['count'] for _, row in df.iterrows()}
-
-            # Đặt matplotlib backend thành Agg (không dùng Tk)
-            import matplotlib
-            matplotlib.use('Agg')
-            import matplotlib.pyplot as plt
-
-            # Tạo WordCloud với màu sắc đẹp hơn
-            wordcloud = WordCloud(
-                width=800,
-                height=400,
-                background_color='white',
-                max_words=item_count,
-                prefer_horizontal=1.0,
-                colormap='viridis',
-                contour_width=1,
-                contour_color='#5a5a5a'
-            ).generate_from_frequencies(topic_freq)
-
-            # Tạo figure mới
-            plt.figure(figsize=(10, 6))
-            plt.imshow(wordcloud, interpolation='bilinear')
-            plt.axis('off')
-
-            # Thêm tiêu đề đẹp hơn
-            plt.title('Top chủ đề thảo luận', fontsize=16, pad=20, color='#2c3e50')
-
-            # Chuyển đổi thành base64 để hiển thị trong Dash
-            buffer = BytesIO()
-            plt.savefig(buffer, format='png', bbox_inches='tight', dpi=150)
-            buffer.seek(0)
-            img_str = base64.b64encode(buffer.read()).decode()
-
-            # Đảm bảo đóng figure để tránh rò rỉ bộ nhớ
-            plt.close('all')
-
             # Trả về hình ảnh với style để hiển thị tốt hơn
             return html.Img(
                 src=f'data:image/png;base64,{img_str}',
@@ -2761,11 +2828,12 @@ class RedditDashboard:
         topic = button_idx
 
         try:
-            # Truy vấn bài viết liên quan đến chủ đề
+            # Truy vấn bài viết liên quan đến chủ đề. Card chỉ hiển thị 200 ký tự đầu của nội dung,
+            # nên cắt ngay trong SQL (thêm 1 ký tự để biết có cần "...") thay vì tải cả bài viết dài
             query = """
                 SELECT 
                     p.title,
-                    p.text,
+                    COALESCE(LEFT(p.text, 201), '') as text,
                     p.score,
                     p.num_comments,
                     p.created_date,
@@ -2789,10 +2857,7 @@ class RedditDashboard:
             query += " ORDER BY p.score DESC LIMIT 10"
 
             # Thực hiện truy vấn
-            cursor = self.db_connection.cursor(cursor_factory=psycopg2.extras.DictCursor)
-            cursor.execute(query, params)
-            posts = cursor.fetchall()
-            cursor.close()
+            posts = self._fetch_rows(query, params, as_dict=True)
 
             if not posts:
                 return html.Div(f"Không tìm thấy bài viết nào về chủ đề '{topic}'.", className="text-center p-3")
@@ -3345,7 +3410,7 @@ class RedditDashboard:
             params.append(item_count)
 
             # Thực hiện truy vấn
-            df = pd.read_sql(query, self.db_connection, params=params)
+            df = self._read_sql(query, params=params)
 
             if df.empty:
                 return {
@@ -3572,22 +3637,18 @@ class RedditDashboard:
                     }
                 }
 
-            # Tạo đồ thị mạng lưới
-            G = nx.Graph()
-
-            # Thêm cạnh vào đồ thị
-            for _, row in df.iterrows():
-                G.add_edge(
-                    row['tech_name_1'],
-                    row['tech_name_2'],
-                    weight=row['correlation_score']
-                )
+            # Tạo đồ thị mạng lưới trực tiếp từ các cột của DataFrame (không duyệt từng dòng bằng iterrows)
+            G = nx.from_pandas_edgelist(
+                df.rename(columns={'correlation_score': 'weight'}),
+                'tech_name_1',
+                'tech_name_2',
+                edge_attr='weight'
+            )
 
             # Giới hạn số lượng nút (nếu cần)
             if len(G.nodes()) > item_count:
-                # Lấy các nút có độ trung tâm cao nhất
-                centrality = nx.degree_centrality(G)
-                top_nodes = sorted(centrality.items(), key=lambda x: x[1], reverse=True)[:item_count]
+                # Lấy các nút có nhiều kết nối nhất (cùng thứ tự với degree_centrality = bậc / (n - 1))
+                top_nodes = sorted(G.degree(), key=lambda x: x[1], reverse=True)[:item_count]
                 top_node_names = [node[0] for node in top_nodes]
 
                 # Tạo đồ thị con với các nút hàng đầu
@@ -3781,10 +3842,7 @@ class RedditDashboard:
             params = [tech_name, tech_name, tech_name]
 
             # Thực hiện truy vấn
-            cursor = self.db_connection.cursor(cursor_factory=psycopg2.extras.DictCursor)
-            cursor.execute(query, params)
-            correlations = cursor.fetchall()
-            cursor.close()
+            correlations = self._fetch_rows(query, params, as_dict=True)
 
             if not correlations:
                 return html.Div(f"Không tìm thấy tương quan nào cho công nghệ '{tech_name}'.")
@@ -3931,7 +3989,7 @@ class RedditDashboard:
                     """
 
             # Thực hiện truy vấn
-            df = pd.read_sql(query, self.db_connection, params=params)
+            df = self._read_sql(query, params=params)
 
             if df.empty:
                 return {
@@ -4058,10 +4116,10 @@ class RedditDashboard:
             elif chart_type == 'heatmap':
                 # Tạo ma trận cho heatmap
                 tech_list = df['tech_name'].tolist()
-                sentiment_matrix = np.zeros((1, len(tech_list)))
 
-                for i, tech in enumerate(tech_list):
-                    sentiment_matrix[0, i] = df[df['tech_name'] == tech]['avg_sentiment'].values[0]
+                # Phân nhóm một lần theo tech_name thay vì lọc toàn bộ DataFrame cho từng công nghệ
+                first_sentiment = df.groupby('tech_name', sort=False)['avg_sentiment'].first()
+                sentiment_matrix = first_sentiment.reindex(tech_list).to_numpy(dtype=float).reshape(1, -1)
 
                 # Tạo heatmap
                 fig = px.imshow(
@@ -4416,8 +4474,8 @@ class RedditDashboard:
         """
         Đóng kết nối và giải phóng tài nguyên
         """
-        if hasattr(self, 'db_connection') and self.db_connection:
-            self.db_connection.close()
+        if hasattr(self, 'engine') and self.engine:
+            self.engine.dispose()
             logger.info("Đã đóng kết nối database")
 
 
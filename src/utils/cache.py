@@ -0,0 +1,159 @@
+import os
+import pickle
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+from .logger import setup_logger
+
+logger = setup_logger(__name__)
+
+
+class ResultCache:
+    """
+        Cache kết quả phân tích: LRU giới hạn số phần tử trong bộ nhớ, hết hạn theo TTL
+        và lưu xuống đĩa để giữ kết quả qua các lần khởi động lại. Các process dùng chung
+        một cache_dir sẽ dùng chung kết quả đã lưu trên đĩa
+    """
+
+    def __init__(self, cache_dir=None, maxsize=128, size_limit=None):
+        """
+            Khởi tạo cache
+
+            Args:
+                cache_dir (str, optional): Thư mục lưu cache trên đĩa, None để chỉ dùng bộ nhớ
+                maxsize (int): Số phần tử tối đa giữ trong bộ nhớ
+                size_limit (int, optional): Dung lượng tối đa (bytes) của cache trên đĩa,
+                    các file cũ nhất bị xóa khi vượt quá; None để không giới hạn
+        """
+        self.cache_dir = cache_dir
+        self.maxsize = maxsize
+        self.size_limit = size_limit
+        self._entries = OrderedDict()  # key -> (timestamp, value)
+        self._lock = threading.Lock()
+
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, key):
+        """Đường dẫn file cache của một key (băm key để tên file luôn hợp lệ)"""
+        return os.path.join(self.cache_dir, hashlib.sha1(key.encode('utf-8')).hexdigest() + '.pkl')
+
+    def _store(self, key, timestamp, value):
+        """Lưu vào bộ nhớ và loại phần tử ít dùng nhất khi vượt quá maxsize (cần giữ _lock)"""
+        self._entries[key] = (timestamp, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def get(self, key, ttl):
+        """
+            Lấy giá trị còn hạn từ cache
+
+            Args:
+                key (str): Cache key
+                ttl (timedelta | None): Thời gian sống của giá trị, None nếu không hết hạn
+
+            Returns:
+                Giá trị đã cache, None nếu không có hoặc đã hết hạn
+        """
+        expired_before = datetime.now() - ttl if ttl is not None else None
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if expired_before is None or entry[0] > expired_before:
+                    self._entries.move_to_end(key)
+                    return entry[1]
+                del self._entries[key]
+
+        if not self.cache_dir:
+            return None
+
+        # Không có trong bộ nhớ: thử đọc từ đĩa
+        try:
+            with open(self._path(key), 'rb') as f:
+                timestamp, value = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"Không thể đọc cache {key} từ đĩa: {str(e)}")
+            return None
+
+        if expired_before is not None and timestamp <= expired_before:
+            return None
+
+        with self._lock:
+            self._store(key, timestamp, value)
+        return value
+
+    def set(self, key, value):
+        """
+            Lưu giá trị vào cache (bộ nhớ và đĩa)
+
+            Args:
+                key (str): Cache key
+                value: Giá trị cần lưu (phải pickle được nếu dùng cache trên đĩa)
+        """
+        timestamp = datetime.now()
+
+        with self._lock:
+            self._store(key, timestamp, value)
+
+        if not self.cache_dir:
+            return
+
+        # Ghi ra file tạm rồi thay thế nguyên tử để không để lại file cache hỏng
+        tmp_path = None
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump((timestamp, value), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self._path(key))
+        except Exception as e:
+            logger.warning(f"Không thể lưu cache {key} xuống đĩa: {str(e)}")
+            if tmp_path and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+
+        if self.size_limit is not None:
+            self._prune_disk()
+
+    def _prune_disk(self):
+        """Xóa các file cache ghi cũ nhất cho tới khi tổng dung lượng không vượt quá size_limit"""
+        files = []
+        total_size = 0
+        for entry in os.scandir(self.cache_dir):
+            if not entry.name.endswith('.pkl'):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue  # Process khác vừa xóa file
+            files.append((stat.st_mtime, stat.st_size, entry.path))
+            total_size += stat.st_size
+
+        if total_size <= self.size_limit:
+            return
+
+        files.sort()
+        for _, size, path in files:
+            if total_size <= self.size_limit:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total_size -= size
+
+    def clear(self):
+        """Xóa toàn bộ cache trong bộ nhớ và trên đĩa"""
+        with self._lock:
+            self._entries.clear()
+
+        if self.cache_dir and os.path.isdir(self.cache_dir):
+            for file_name in os.listdir(self.cache_dir):
+                if file_name.endswith('.pkl'):
+                    os.remove(os.path.join(self.cache_dir, file_name))
@@ -26,6 +26,20 @@ POSTGRES_PASSWORD = os.getenv("POSTGRES_PASSWORD", "postgres")
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
 LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
 
+# Cache Configuration
+# Mặc định lưu trong thư mục cache của người dùng, không phụ thuộc thư mục đang chạy script
+CACHE_DIR = os.getenv(
+    "CACHE_DIR",
+    os.path.join(os.getenv("XDG_CACHE_HOME", os.path.expanduser("~/.cache")), "reddit_pipeline")
+)
+CACHE_SIZE_LIMIT = int(os.getenv("CACHE_SIZE_LIMIT", 2 ** 30))  # Dung lượng tối đa (bytes) của cache trên đĩa
+# Cache của dashboard: dùng Redis nếu có REDIS_URL (vd. unix:///tmp/redis.sock), nếu không thì lưu file trên tmpfs
+REDIS_URL = os.getenv("REDIS_URL")
+DASHBOARD_CACHE_DIR = os.getenv(
+    "DASHBOARD_CACHE_DIR",
+    "/dev/shm/reddit_dashboard_cache" if os.path.isdir("/dev/shm") else "cache-directory"
+)
+
 # Subreddit to collect data from
 SUBREDDITS = ["dataengineering", "datascience", "bigdata", "MachineLearning"]
 
@@ -0,0 +1,17 @@
+def prepare_statement(conn, prepared, name, param_types, sql):
+    """
+        PREPARE câu lệnh SQL một lần cho mỗi phiên kết nối PostgreSQL
+
+        Args:
+            conn: Kết nối PostgreSQL
+            prepared (set): Các prepared statement đã tạo, do đối tượng gọi giữ qua các lần mượn kết nối
+            name (str): Tên prepared statement
+            param_types (str): Kiểu các tham số, ví dụ "(int, int)"
+            sql (str): Câu lệnh SQL với tham số $1, $2, ...
+    """
+    # Prepared statement tồn tại theo phiên (backend), không bị mất khi rollback
+    key = (id(conn), conn.get_backend_pid(), name)
+    if key not in prepared:
+        with conn.cursor() as cur:
+            cur.execute(f"PREPARE {name}{param_types} AS {sql}")
+        prepared.add(key)
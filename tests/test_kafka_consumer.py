@@ -0,0 +1,191 @@
+import unittest
+from unittest import mock
+
+try:
+    from src.utils import logger as logger_module
+
+    # Logger của module chỉ ghi ra console trong test, không tạo logs/kafka_consumer.log
+    _setup_logger = logger_module.setup_logger
+    with mock.patch.object(logger_module, "setup_logger", lambda name, log_file=None: _setup_logger(name)):
+        from src.data_processing import kafka_consumer
+except ImportError:  # Cần kafka-python, psycopg2 và python-dotenv
+    kafka_consumer = None
+
+
+def _post_message(i):
+    """Tin nhắn bài viết giống dữ liệu collector gửi (created_utc là float như PRAW trả về)"""
+    return {
+        "id": f"p{i}",
+        "title": f"Bài viết {i}",
+        "text": "Nội dung\tcó tab\nvà xuống dòng",
+        "url": "https://reddit.com",
+        "author": f"user{i}",
+        "score": 10,
+        "upvote_ratio": 1.0,
+        "num_comments": 3,
+        "created_utc": 1697040000.0 + i,
+        "created_date": "2023-10-11 16:00:00",
+        "subreddit": "dataengineering",
+        "permalink": f"/r/dataengineering/{i}",
+        "is_self": True,
+        "is_video": False,
+        "over_18": False,
+        "link_flair_text": None,
+        "collected_utc": 1697050000
+    }
+
+
+def _make_consumer():
+    """Tạo consumer không kết nối Kafka / PostgreSQL, cursor được thay bằng mock"""
+    consumer = object.__new__(kafka_consumer.RedditDataConsumer)
+    consumer.conn = mock.MagicMock(closed=0)
+    consumer.cur = mock.MagicMock()
+    consumer._post_buf = {}
+    consumer._comment_buf = {}
+    consumer._user_delta = {}
+    consumer._deferred_comments = {}
+    consumer._upsert_sql = {
+        table: {
+            "values": f"INSERT INTO reddit_data.{table} VALUES %s",
+            "copy": f"COPY {table}_stage FROM STDIN",
+            "stage": f"INSERT INTO {table}_stage VALUES ".encode(),
+            "upsert": f"INSERT INTO reddit_data.{table} SELECT * FROM {table}_stage AS s".encode(),
+            "template": "(" + ", ".join(["%s"] * len(columns)) + ")",
+            "guarded": table == "comments",
+            "returning": table == "comments"
+        }
+        for table, columns in (("posts", kafka_consumer.POST_COLUMNS),
+                               ("comments", kafka_consumer.COMMENT_COLUMNS))
+    }
+    return consumer
+
+
+@unittest.skipIf(kafka_consumer is None, "cần kafka-python, psycopg2 và python-dotenv")
+class CopyPathTest(unittest.TestCase):
+
+    def test_copy_value_writes_integral_float_as_integer(self):
+        self.assertEqual(kafka_consumer._copy_value(1697040000.0), "1697040000")
+        self.assertEqual(kafka_consumer._copy_value(0.95), "0.95")
+        self.assertEqual(kafka_consumer._copy_value(None), "\\N")
+
+    def test_copy_path_sends_bigint_created_utc(self):
+        consumer = _make_consumer()
+        for i in range(kafka_consumer.COPY_MIN_ROWS):
+            consumer._process_post(_post_message(i))
+        rows = [(row[0], 1, *row[2:]) for row in consumer._post_buf.values()]
+
+        copied = {}
+        consumer.cur.copy_expert.side_effect = lambda statement, buf: copied.setdefault("data", buf.getvalue())
+        consumer._upsert_rows("posts", rows)
+
+        lines = copied["data"].splitlines()
+        self.assertEqual(len(lines), kafka_consumer.COPY_MIN_ROWS)
+        created_index = kafka_consumer.POST_COLUMNS.index("created_utc")
+        for i, line in enumerate(lines):
+            fields = line.split("\t")
+            self.assertEqual(len(fields), len(kafka_consumer.POST_COLUMNS))
+            # Giá trị phải đọc được như số nguyên cho cột BIGINT
+            self.assertEqual(fields[created_index], str(1697040000 + i))
+        consumer.cur.execute.assert_called_once()
+
+
+
+def _comment_row(comment_id, post_id="p1"):
+    """Dòng bình luận theo thứ tự COMMENT_COLUMNS"""
+    return (comment_id, post_id, f"t3_{post_id}", "Bình luận", f"user_{comment_id}", 1,
+            1697040000, "2023-10-11 16:00:00", False, 1697050000)
+
+
+@unittest.skipIf(kafka_consumer is None, "cần kafka-python, psycopg2 và python-dotenv")
+class RowByRowFallbackTest(unittest.TestCase):
+
+    def _run_fallback(self, saved_comment_ids):
+        consumer = _make_consumer()
+        consumer._flush_user_activity = mock.MagicMock()
+        # Bình luận c1 bị hoãn từ batch trước, c2 và c3 thuộc batch hiện tại
+        consumer._deferred_comments = {"c1": (_comment_row("c1"), 1, None)}
+        comment_buf = {"c2": _comment_row("c2"), "c3": _comment_row("c3")}
+
+        # Ghi cả batch thất bại, chuyển sang ghi từng dòng
+        consumer._upsert_rows = mock.MagicMock(side_effect=RuntimeError("batch lỗi"))
+        consumer._execute_row = mock.MagicMock(
+            side_effect=lambda statement, row: (row[4],) if row[0] in saved_comment_ids else None
+        )
+
+        result = consumer._write_batch({}, comment_buf)
+        return consumer, result
+
+    def test_saved_deferred_comments_are_not_retried(self):
+        consumer, result = self._run_fallback({"c1", "c2"})
+
+        self.assertTrue(result)
+        consumer.conn.rollback.assert_called_once()
+        # c1 và c2 đã được lưu từng dòng: không còn bị hoãn để ghi (và đếm user_activity) lại
+        self.assertEqual(set(consumer._deferred_comments), {"c3"})
+        self.assertEqual(consumer._deferred_comments["c3"][1], 1)
+
+    def test_unsaved_deferred_comment_counts_another_attempt(self):
+        consumer, result = self._run_fallback({"c2", "c3"})
+
+        self.assertTrue(result)
+        self.assertEqual(set(consumer._deferred_comments), {"c1"})
+        self.assertEqual(consumer._deferred_comments["c1"][1], 2)
+
+    def test_connection_loss_drops_saved_rows_from_deferred(self):
+        consumer = _make_consumer()
+        consumer._deferred_comments = {"c1": (_comment_row("c1"), 1, None), "c2": (_comment_row("c2"), 1, None)}
+
+        def execute_row(statement, row):
+            if row[0] == "c2":
+                raise kafka_consumer.psycopg2.OperationalError("mất kết nối")
+            return (row[4],)
+        consumer._execute_row = mock.MagicMock(side_effect=execute_row)
+
+        result = consumer._flush_row_by_row([], [_comment_row("c1"), _comment_row("c2")])
+
+        self.assertFalse(result)
+        self.assertEqual(set(consumer._deferred_comments), {"c2"})
+
+
+@unittest.skipIf(kafka_consumer is None, "cần kafka-python, psycopg2 và python-dotenv")
+class OffsetCommitTest(unittest.TestCase):
+
+    def _finish(self, consumer, batch_end):
+        future = mock.MagicMock()
+        future.result.return_value = True
+        consumer.consumer = mock.MagicMock()
+        consumer._pending_flush = (future, {}, batch_end)
+        consumer._finish_pending_flush()
+        return {tp: meta.offset for tp, meta in consumer.consumer.commit.call_args[0][0].items()}
+
+    def test_commit_stops_at_oldest_deferred_comment(self):
+        consumer = _make_consumer()
+        # Bình luận c1 (offset 12) và c2 (offset 15) của partition "comments-0" vẫn chỉ nằm trong bộ nhớ
+        consumer._deferred_comments = {
+            "c1": (_comment_row("c1"), 1, ("comments-0", 12)),
+            "c2": (_comment_row("c2"), 2, ("comments-0", 15))
+        }
+
+        committed = self._finish(consumer, {"comments-0": 20, "posts-0": 7})
+
+        self.assertEqual(committed, {"comments-0": 12, "posts-0": 7})
+
+    def test_commit_reaches_batch_end_once_deferred_comments_are_saved(self):
+        consumer = _make_consumer()
+
+        committed = self._finish(consumer, {"comments-0": 20})
+
+        self.assertEqual(committed, {"comments-0": 20})
+
+    def test_deferred_comment_keeps_position_of_its_message(self):
+        consumer = _make_consumer()
+        consumer._flush_user_activity = mock.MagicMock()
+        consumer._upsert_rows = mock.MagicMock(return_value=set())
+
+        consumer._write_batch({}, {"c1": _comment_row("c1")}, {"c1": ("comments-0", 12)})
+
+        self.assertEqual(consumer._deferred_comments["c1"][2], ("comments-0", 12))
+
+
+if __name__ == "__main__":
+    unittest.main()